@@ -1,14 +1,54 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, File, Form, UploadFile
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from app.chatbot import Chatbot
+from app.controllers.warmup import WarmupState, load_usage_stats, save_usage_stats
+from app.controllers.admission import AdmissionController, Overloaded
+from app.rag.batch import answer_batch, sources_from_docs
+from app.models.llm import metrics as llm_metrics
+from app.data.jobs import IngestJobQueue, IngestWorkerPool
+from app.utils import config
 from app.utils.logger import logger
+from app.utils.shared_cache import record_usage, retrieval_counts, usage_counts
 from typing import Optional, List, Dict
+import json
+import os
+import shutil
+import uuid
+
+# Estado del warm-up (readiness); los contadores de consultas por ramo viven en la caché compartida
+warmup_state = WarmupState()
+
+# Control de admisión de /api/query (colas acotadas, carriles de prioridad y modo degradado)
+admission = AdmissionController()
+
+# Cola persistente de ingesta y pool de workers en segundo plano. La ingesta sube la generación
+# compartida de la colección al terminar, así los demás workers reabren su vectorstore.
+# Con varios workers de uvicorn usar INGEST_WORKERS=0 y `python main.py ingest-worker`.
+ingest_queue = IngestJobQueue()
+ingest_pool = IngestWorkerPool(ingest_queue)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not config.REDIS_URL:
+        # Sin Redis los contadores parten desde el archivo; con Redis, Redis es la fuente de verdad
+        for ramo, count in load_usage_stats().items():
+            record_usage(ramo, count)
+    warmup_state.start(get_chatbot, usage_counts())
+    if ingest_pool.workers > 0:
+        ingest_pool.start()
+    yield
+    ingest_pool.stop()
+    save_usage_stats(usage_counts())
 
 app = FastAPI(
     title="RAGent API",
     description="API para chatbot con RAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configurar CORS para permitir peticiones desde el frontend
@@ -26,6 +66,10 @@ class QueryRequest(BaseModel):
     ramo: str
     files: Optional[List[str]] = None  # lista de nombres de archivos a enfocar
     use_rag: Optional[bool] = True
+    mode: Optional[str] = "qa"  # 'qa', 'search' o 'flashcards'
+    difficulty: Optional[str] = None  # filtro de flashcards: 'easy', 'medium' o 'hard'
+    topic: Optional[str] = None  # filtro de flashcards por tema
+    conversation_id: Optional[str] = None  # id de conversación del cliente: permite reutilizar el contexto entre turnos
 
 # Modelo para la respuesta
 class QueryResponse(BaseModel):
@@ -33,6 +77,13 @@ class QueryResponse(BaseModel):
     sources: Optional[List[str]] = None
     ramo: str
 
+# Modelo para consultas por lote
+class BatchQueryRequest(BaseModel):
+    prompts: List[str]
+    ramo: str
+    mode: Optional[str] = "qa"
+    files: Optional[List[str]] = None
+
 # Instancias de chatbots por colección (cache)
 chatbot_instances: Dict[str, Chatbot] = {}
 
@@ -53,14 +104,51 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "query": "/api/query",
-            "health": "/health"
+            "batch": "/api/query/batch",
+            "ingest": "/api/ingest",
+            "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "llm_metrics": "/metrics/llm",
+            "admission_metrics": "/metrics/admission",
+            "retrieval_metrics": "/metrics/retrieval"
         }
     }
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check():
-    """Verifica el estado de la API."""
-    return {"status": "healthy"}
+    """Liveness: el proceso está vivo y respondiendo (no implica que esté precalentado)."""
+    return {"status": "healthy", "pid": os.getpid()}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 200 solo cuando terminó el warm-up; 503 mientras tanto."""
+    state = warmup_state.to_dict()
+    if not warmup_state.ready:
+        return JSONResponse(status_code=503, content={"status": "warming", **state})
+    return {"status": "ready", **state}
+
+@app.get("/metrics/llm")
+async def llm_metrics_endpoint():
+    """Métricas del cliente LLM compartido: reintentos, 429, concurrencia, espera por límites y tokens del último minuto."""
+    return llm_metrics.snapshot()
+
+@app.get("/metrics/admission")
+async def admission_metrics_endpoint():
+    """Estado del control de admisión: activas, en cola por ramo, rechazadas y degradadas."""
+    return admission.snapshot()
+
+@app.get("/metrics/retrieval")
+async def retrieval_metrics_endpoint():
+    """Recuperaciones por turno: nuevas, extendidas y reutilizadas (sin consultar Chroma), compartidas entre workers."""
+    counts = await run_in_threadpool(retrieval_counts)
+    total = sum(counts.values())
+    return {
+        "counts": counts,
+        "total": total,
+        "skipped_rate": round(counts.get("reused", 0) / total, 3) if total else 0.0,
+    }
 
 @app.post("/api/query", response_model=QueryResponse)
 async def query_chatbot(request: QueryRequest):
@@ -71,30 +159,37 @@ async def query_chatbot(request: QueryRequest):
         request: Objeto con el prompt del usuario y el ramo (colección)
         
     Returns:
-        Respuesta del chatbot con la respuesta y las fuentes (si usa RAG)
+        Respuesta del chatbot con la respuesta y las fuentes (si usa RAG).
+        429 con Retry-After si la cola (global o del ramo) está llena.
     """
+    mode = request.mode or "qa"
     try:
         logger.info(f"Consulta recibida - Ramo: {request.ramo}, Prompt: {request.prompt[:50]}...")
+        # Con Redis es una llamada de red: fuera del event loop
+        await run_in_threadpool(record_usage, request.ramo)
 
         # Obtener el chatbot para la colección específica
         chatbot = get_chatbot(request.ramo)
 
-        # Procesar la consulta
-        result = chatbot.ask(
-            request.prompt,
-            use_rag_override=request.use_rag,
-            files=request.files,
-        )
+        async with admission.admit(request.ramo, mode) as slot:
+            if slot.degraded:
+                logger.info(f"Consulta en modo degradado - Ramo: {request.ramo}, k={slot.k}, contexto={slot.context_tokens}")
+            # Procesar la consulta en el threadpool para no bloquear el event loop
+            result = await run_in_threadpool(
+                chatbot.ask,
+                request.prompt,
+                use_rag_override=request.use_rag,
+                files=request.files,
+                mode=mode,
+                difficulty=request.difficulty,
+                topic=request.topic,
+                k=slot.k,
+                context_tokens=slot.context_tokens,
+                conversation_id=request.conversation_id,
+            )
 
         # Extraer fuentes si existen
-        sources: List[str] = []
-        if result.get("source_documents"):
-            sources_set = set()
-            for doc in result["source_documents"]:
-                if hasattr(doc, "metadata"):
-                    source = doc.metadata.get("source", "desconocido")
-                    sources_set.add(source)
-            sources = list(sources_set)
+        sources = sources_from_docs(result.get("source_documents"))
 
         response = QueryResponse(
             answer=result.get("answer", ""),
@@ -105,6 +200,13 @@ async def query_chatbot(request: QueryRequest):
         logger.info(f"Respuesta enviada - Ramo: {request.ramo}")
         return response
 
+    except Overloaded as e:
+        logger.warning(f"Consulta rechazada ({e.reason}) - Ramo: {request.ramo}, Retry-After: {e.retry_after}s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Servicio saturado ({e.reason}), reintenta en {e.retry_after}s",
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
         logger.error(f"Error procesando consulta: {str(e)}")
         raise HTTPException(
@@ -112,6 +214,139 @@ async def query_chatbot(request: QueryRequest):
             detail=f"Error al procesar la consulta: {str(e)}",
         )
 
+@app.post("/api/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """
+    Procesa muchas preguntas sobre un mismo ramo con recuperación compartida.
+
+    Responde NDJSON: una línea JSON por pregunta ({index, prompt, answer, sources, tokens_used}
+    o {index, prompt, error}) en el orden en que terminan.
+    Pasa por el mismo control de admisión que /api/query y ocupa un lugar mientras dura el stream.
+    """
+    if not request.prompts:
+        raise HTTPException(status_code=400, detail="Se requiere al menos un prompt")
+    if len(request.prompts) > config.BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=413, detail=f"Máximo {config.BATCH_MAX_PROMPTS} prompts por lote")
+    mode = request.mode or "qa"
+    logger.info(f"Batch recibido - Ramo: {request.ramo}, {len(request.prompts)} prompts")
+    await run_in_threadpool(record_usage, request.ramo, len(request.prompts))
+
+    try:
+        slot = await admission.acquire(request.ramo, mode)
+    except Overloaded as e:
+        logger.warning(f"Batch rechazado ({e.reason}) - Ramo: {request.ramo}, Retry-After: {e.retry_after}s")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Servicio saturado ({e.reason}), reintenta en {e.retry_after}s",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    async def stream():
+        batch = answer_batch(
+            request.prompts,
+            collection_name=request.ramo,
+            k=slot.k,
+            mode=mode,
+            files=request.files,
+            context_tokens=slot.context_tokens,
+        )
+        try:
+            async for item in iterate_in_threadpool(batch):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Error procesando batch: {str(e)}")
+            yield json.dumps({"error": f"Error al procesar el lote: {str(e)}"}, ensure_ascii=False) + "\n"
+        finally:
+            # También al desconectarse el cliente: no se lanzan más preguntas y se libera el lugar
+            try:
+                batch.close()
+            except ValueError:
+                # Desconexión a mitad de un next(): el hilo sigue dentro del generador y lo cierra al volver
+                logger.warning(f"Batch interrumpido con una pregunta en curso - Ramo: {request.ramo}")
+            admission.release(slot)
+
+    return AdmittedStreamingResponse(stream(), slot, media_type="application/x-ndjson")
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que devuelve su lugar de admisión al terminar de enviarse. Cubre los casos en que
+    el `finally` del generador no corre: el cliente se desconecta antes de que el cuerpo empiece a iterarse.
+    """
+
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            admission.release(self.slot)
+
+def resolve_ingest_path(path: str) -> str:
+    """Ruta real de un archivo del servidor; debe quedar dentro de INGEST_PATHS_ROOT (si no, 400/403)."""
+    if not config.INGEST_PATHS_ROOT:
+        raise HTTPException(status_code=400, detail="Rutas del servidor deshabilitadas (INGEST_PATHS_ROOT no configurado)")
+    root = os.path.realpath(config.INGEST_PATHS_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise HTTPException(status_code=403, detail=f"Ruta fuera de INGEST_PATHS_ROOT: {path}")
+    if not os.path.isfile(resolved):
+        raise HTTPException(status_code=400, detail=f"Archivo no encontrado: {path}")
+    return resolved
+
+@app.post("/api/ingest", status_code=202)
+async def create_ingest_job(
+    ramo: str = Form(...),
+    files: Optional[List[UploadFile]] = File(None),
+    paths: Optional[List[str]] = Form(None),
+    flashcards: Optional[bool] = Form(None),
+    profiles: Optional[bool] = Form(None),
+):
+    """
+    Encola un trabajo de ingesta y responde de inmediato (202) con su id.
+
+    Acepta archivos subidos (multipart `files`) y/o rutas ya presentes en el servidor (`paths`),
+    estas solo dentro de INGEST_PATHS_ROOT.
+    El trabajo lo procesa el pool de workers; su avance se consulta en /api/ingest/{job_id}.
+    """
+    if not files and not paths:
+        raise HTTPException(status_code=400, detail="Se requiere al menos un archivo o ruta")
+
+    job_id = uuid.uuid4().hex
+    job_paths: List[str] = [resolve_ingest_path(p) for p in paths or []]
+    if files:
+        upload_dir = os.path.join(config.INGEST_UPLOAD_DIR, job_id)
+        os.makedirs(upload_dir, exist_ok=True)
+        used = set()
+        for i, f in enumerate(files):
+            name = os.path.basename(f.filename or "archivo")
+            # Dos archivos con el mismo nombre en un trabajo: subdirectorio propio (se conserva el nombre para las citas)
+            target_dir = upload_dir if name not in used else os.path.join(upload_dir, str(i))
+            used.add(name)
+            os.makedirs(target_dir, exist_ok=True)
+            dest = os.path.join(target_dir, name)
+            with open(dest, "wb") as out:
+                await run_in_threadpool(shutil.copyfileobj, f.file, out)
+            job_paths.append(dest)
+
+    options = {k: v for k, v in {"flashcards": flashcards, "profiles": profiles}.items() if v is not None}
+    await run_in_threadpool(ingest_queue.enqueue, ramo, job_paths, options, job_id)
+    return {"job_id": job_id, "status": "queued", "ramo": ramo, "files": [os.path.basename(p) for p in job_paths]}
+
+@app.get("/api/ingest/{job_id}")
+def get_ingest_job(job_id: str):
+    """Estado de un trabajo de ingesta, con avance por etapa (extract/embed/write/...)."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@app.get("/api/ingest")
+def list_ingest_jobs(ramo: Optional[str] = None, limit: int = 50):
+    """Lista los trabajos de ingesta más recientes (opcionalmente de un ramo)."""
+    return ingest_queue.list(collection=ramo, limit=limit)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
@@ -6,5 +6,26 @@ class Chatbot:
     def __init__(self, use_rag: bool = True, collection_name: str = "study_collection"):
         self.manager = ConversationManager(use_rag=use_rag, collection_name=collection_name)
 
-    def ask(self, query: str, use_rag_override: bool = None, files: Optional[List[str]] = None) -> Dict[str, Any]:
-        return self.manager.handle_query(query, use_rag_override=use_rag_override, files=files)
+    def ask(
+        self,
+        query: str,
+        use_rag_override: bool = None,
+        files: Optional[List[str]] = None,
+        mode: str = "qa",
+        difficulty: Optional[str] = None,
+        topic: Optional[str] = None,
+        k: Optional[int] = None,
+        context_tokens: Optional[int] = None,
+        conversation_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return self.manager.handle_query(
+            query,
+            use_rag_override=use_rag_override,
+            files=files,
+            mode=mode,
+            difficulty=difficulty,
+            topic=topic,
+            k=k,
+            context_tokens=context_tokens,
+            conversation_id=conversation_id,
+        )
@@ -0,0 +1,167 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.utils import config
+from app.utils.logger import logger
+
+# Carriles de prioridad (menor = se atiende antes): la búsqueda suele servirse desde el índice
+# de perfiles y es barata; la generación de flashcards es la más cara.
+LANES: Dict[str, int] = {"search": 0, "qa": 1, "flashcards": 2}
+
+
+class Overloaded(Exception):
+    """La cola está llena (global o del ramo) o se agotó la espera: responder 429 con Retry-After."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Admission:
+    """Resultado de la admisión: si la consulta corre degradada, con qué k y presupuesto de contexto."""
+    lane: str
+    waited: float
+    degraded: bool = False
+    k: Optional[int] = None
+    context_tokens: Optional[int] = None
+    started: float = 0.0
+    released: bool = False
+
+
+class AdmissionController:
+    """
+    Control de admisión para /api/query (vive en el event loop, sin locks):
+    - a lo más `max_active` consultas ejecutándose a la vez
+    - cola acotada global y por ramo; si se llena se rechaza de inmediato (Overloaded)
+    - la cola se atiende por carril de prioridad y luego por orden de llegada
+    - con la cola sobre `degrade_queue`, las consultas admitidas corren en modo degradado
+    """
+
+    def __init__(
+        self,
+        max_active: int = None,
+        max_queue: int = None,
+        max_queue_per_ramo: int = None,
+        queue_timeout: float = None,
+        degrade_queue: int = None,
+    ):
+        self.max_active = max_active or config.ADMISSION_MAX_ACTIVE
+        self.max_queue = config.ADMISSION_MAX_QUEUE if max_queue is None else max_queue
+        self.max_queue_per_ramo = config.ADMISSION_MAX_QUEUE_PER_RAMO if max_queue_per_ramo is None else max_queue_per_ramo
+        self.queue_timeout = queue_timeout or config.ADMISSION_QUEUE_TIMEOUT
+        self.degrade_queue = config.ADMISSION_DEGRADE_QUEUE if degrade_queue is None else degrade_queue
+
+        self.active = 0
+        self._waiters: List[Any] = []  # heap de (carril, seq, future, ramo)
+        self._seq = itertools.count()
+        self.queued_by_ramo: Dict[str, int] = {}
+        self.service_time = 5.0  # EWMA de la duración de una consulta (s), para estimar Retry-After
+        self.stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "degraded": 0}
+        self.admitted_by_lane: Dict[str, int] = {lane: 0 for lane in LANES}
+
+    @property
+    def queued(self) -> int:
+        return sum(self.queued_by_ramo.values())
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere lugar: cola pendiente / capacidad × duración media."""
+        return max(1, math.ceil((self.queued + 1) / self.max_active * self.service_time))
+
+    def _degraded(self) -> bool:
+        return self.degrade_queue > 0 and self.queued >= self.degrade_queue
+
+    def _release(self) -> None:
+        # Entrega el lugar directamente al siguiente en espera (sin pasar por active=0)
+        while self._waiters:
+            _, _, fut, _ = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    async def acquire(self, ramo: str, mode: str = "qa") -> Admission:
+        """Espera (o rechaza con Overloaded) un lugar; quien lo obtiene debe llamar a `release`."""
+        lane = mode if mode in LANES else "qa"
+        start = time.monotonic()
+
+        if self.active >= self.max_active or self._waiters:
+            if self.queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise Overloaded("global_queue_full", self.retry_after())
+            if self.queued_by_ramo.get(ramo, 0) >= self.max_queue_per_ramo:
+                self.stats["rejected"] += 1
+                raise Overloaded("ramo_queue_full", self.retry_after())
+
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (LANES[lane], next(self._seq), fut, ramo))
+            self.queued_by_ramo[ramo] = self.queued_by_ramo.get(ramo, 0) + 1
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), timeout=self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if fut.done() and not fut.cancelled():
+                    # Se le asignó lugar justo al vencer o al desconectarse el cliente: devolverlo
+                    self._release()
+                else:
+                    fut.cancel()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self.stats["timed_out"] += 1
+                raise Overloaded("queue_timeout", self.retry_after())
+            finally:
+                self.queued_by_ramo[ramo] -= 1
+                if not self.queued_by_ramo[ramo]:
+                    del self.queued_by_ramo[ramo]
+        else:
+            self.active += 1
+
+        admission = Admission(lane=lane, waited=time.monotonic() - start)
+        if self._degraded():
+            admission.degraded = True
+            admission.k = config.ADMISSION_DEGRADED_TOP_K
+            admission.context_tokens = config.ADMISSION_DEGRADED_CONTEXT_TOKENS
+            self.stats["degraded"] += 1
+        self.stats["admitted"] += 1
+        self.admitted_by_lane[lane] += 1
+        admission.started = time.monotonic()
+        return admission
+
+    def release(self, admission: Admission) -> None:
+        """Devuelve el lugar de una admisión. Es idempotente: un stream puede liberarlo desde más de un sitio."""
+        if admission.released:
+            return
+        admission.released = True
+        self.service_time = 0.8 * self.service_time + 0.2 * (time.monotonic() - admission.started)
+        self._release()
+
+    @asynccontextmanager
+    async def admit(self, ramo: str, mode: str = "qa") -> AsyncIterator[Admission]:
+        admission = await self.acquire(ramo, mode)
+        try:
+            yield admission
+        finally:
+            self.release(admission)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "queued_by_ramo": dict(self.queued_by_ramo),
+            "degraded_now": self._degraded(),
+            "avg_service_s": round(self.service_time, 3),
+            "admitted_by_lane": dict(self.admitted_by_lane),
+            **self.stats,
+            "limits": {
+                "max_active": self.max_active,
+                "max_queue": self.max_queue,
+                "max_queue_per_ramo": self.max_queue_per_ramo,
+                "queue_timeout_s": self.queue_timeout,
+                "degrade_queue": self.degrade_queue,
+            },
+        }
@@ -1,24 +1,190 @@
-from typing import Dict, Any, List, Optional
-from app.rag.qa import answer_with_rag
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.rag.qa import answer_with_rag, rag_question, llm as rag_llm
+from app.rag.retriever import cosine_similarity, get_relevant_docs
+from app.models.embeddings import EmbeddingClient
+from app.data.chunking import source_key
+from app.data.flashcards import sample_flashcards
+from app.data.profiles import has_profiles, search_profiles, search_answer_from_profiles, build_search_prompt
+from app.utils import config
 from app.utils.logger import logger
-from app.models.llm import Agent
+from app.utils.shared_cache import collection_generation, record_retrieval
+from app.utils.tokens import count_tokens
+import json
+import threading
+import time
+
+def _doc_key(doc: Any) -> str:
+    meta = getattr(doc, "metadata", None) or {}
+    return getattr(doc, "id", None) or f"{meta.get('source')}#{meta.get('chunk')}"
 
 class ConversationManager:
     def __init__(self, use_rag: bool = True, collection_name: str = "study_collection"):
         self.use_rag = use_rag
         self.collection_name = collection_name
         self.history: List[Dict[str, str]] = [] 
+        # Última recuperación por conversación: embedding de la pregunta, documentos, files y generación
+        self._retrievals: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
 
-    def handle_query(self, query: str, use_rag_override: bool = None, files: Optional[List[str]] = None):
+    def handle_query(
+        self,
+        query: str,
+        use_rag_override: bool = None,
+        files: Optional[List[str]] = None,
+        mode: str = "qa",
+        difficulty: Optional[str] = None,
+        topic: Optional[str] = None,
+        k: Optional[int] = None,
+        context_tokens: Optional[int] = None,
+        conversation_id: Optional[str] = None,
+    ):
         use_rag = self.use_rag if use_rag_override is None else use_rag_override
         self.history.append({"role": "user", "text": query})
         if use_rag:
-            res = answer_with_rag(query, collection_name=self.collection_name, files=files)
+            res = None
+            if mode == "flashcards" and files:
+                res = self._flashcards_from_store(files, difficulty=difficulty, topic=topic)
+            if mode == "search" and config.SEARCH_USE_PROFILES and has_profiles(self.collection_name):
+                res = self._search_from_profiles(query)
+            if res is None:
+                docs, outcome = self._retrieve(rag_question(query, mode, difficulty, topic), files, k, conversation_id)
+                res = answer_with_rag(
+                    query,
+                    k=k,
+                    collection_name=self.collection_name,
+                    mode=mode,
+                    files=files,
+                    difficulty=difficulty,
+                    topic=topic,
+                    context_tokens=context_tokens,
+                    docs=docs,
+                )
+                res["retrieval"] = outcome
             self.history.append({"role": "assistant", "text": res["answer"]})
             return res
         else:
-            llm = Agent()
             prompt = f"Eres un asistente. Responde: {query}"
-            answer = llm.generate(prompt)
+            answer = rag_llm.generate(prompt)
             self.history.append({"role": "assistant", "text": answer})
             return {"answer": answer, "source_documents": []}
+
+    def _last_retrieval(self, conversation_id: Optional[str], generation: int) -> Optional[Dict[str, Any]]:
+        if not conversation_id or not config.FOLLOWUP_REUSE_ENABLED:
+            return None
+        with self._lock:
+            now = time.time()
+            while self._retrievals:
+                oldest = next(iter(self._retrievals.values()))
+                if now - oldest["at"] <= config.FOLLOWUP_TTL_SECONDS:
+                    break
+                self._retrievals.popitem(last=False)
+            state = self._retrievals.get(conversation_id)
+        # Si una ingesta modificó la colección, los documentos guardados pueden estar obsoletos
+        if state is None or state["generation"] != generation or generation == -1:
+            return None
+        return state
+
+    def _remember(self, conversation_id: Optional[str], state: Dict[str, Any]) -> None:
+        if not conversation_id or not config.FOLLOWUP_REUSE_ENABLED:
+            return
+        state["at"] = time.time()
+        with self._lock:
+            self._retrievals[conversation_id] = state
+            self._retrievals.move_to_end(conversation_id)
+            while len(self._retrievals) > config.FOLLOWUP_MAX_CONVERSATIONS:
+                self._retrievals.popitem(last=False)
+
+    def _retrieve(
+        self,
+        question: str,
+        files: Optional[List[str]],
+        k: Optional[int],
+        conversation_id: Optional[str],
+    ) -> Tuple[List[Any], str]:
+        """
+        Documentos para un turno de la conversación. Retorna (documentos, resultado):
+        - 'reused': la pregunta se parece a la que originó el contexto (FOLLOWUP_REUSE_SIMILARITY), o
+          enfoca los mismos `files` y estos ya están en el contexto: no se consulta Chroma
+        - 'extended': seguimiento relacionado (FOLLOWUP_EXTEND_SIMILARITY o mismos `files`): se consulta
+          Chroma y se agregan al contexto previo solo los documentos nuevos
+        - 'fresh': recuperación normal
+        """
+        generation = collection_generation(self.collection_name)
+        state = self._last_retrieval(conversation_id, generation)
+        files_key = sorted(source_key(f) for f in files or [])
+        same_files = bool(files_key) and state is not None and files_key == state["files"]
+
+        if same_files and set(files_key) <= {source_key((d.metadata or {}).get("source") or "") for d in state["docs"]}:
+            docs, outcome, q_emb = state["docs"], "reused", state["embedding"]
+            logger.info(f"Recuperación de seguimiento: reused (mismos archivos {files_key}, {len(docs)} docs)")
+        else:
+            q_emb = EmbeddingClient().embed(question)
+            sim = cosine_similarity(q_emb, state["embedding"]) if state is not None else 0.0
+            if state is not None and sim >= config.FOLLOWUP_REUSE_SIMILARITY:
+                # Se conserva el embedding original para que la deriva entre turnos no se acumule
+                docs, outcome, q_emb = state["docs"], "reused", state["embedding"]
+            else:
+                new_docs = get_relevant_docs(question, k=k, collection_name=self.collection_name, query_embedding=q_emb)
+                if state is not None and (same_files or sim >= config.FOLLOWUP_EXTEND_SIMILARITY):
+                    seen = {_doc_key(d) for d in new_docs}
+                    docs = new_docs + [d for d in state["docs"] if _doc_key(d) not in seen]
+                    docs = docs[:max(len(new_docs), config.RETRIEVAL_MAX_K)]
+                    outcome = "extended"
+                else:
+                    docs, outcome = new_docs, "fresh"
+            if state is not None:
+                logger.info(f"Recuperación de seguimiento: {outcome} (similitud {sim:.3f}, {len(docs)} docs)")
+
+        self._remember(conversation_id, {"embedding": q_emb, "docs": docs, "files": files_key, "generation": generation})
+        if state is not None:
+            # Solo cuentan los turnos que podían reutilizar contexto; el primer turno siempre es 'fresh'
+            record_retrieval(outcome)
+        # El tope de k (modo degradado) aplica también al contexto reutilizado
+        return (docs[:k] if k else docs), outcome
+
+    def _flashcards_from_store(self, files: List[str], difficulty: Optional[str] = None, topic: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Sirve flashcards materializadas en la ingesta; None si no alcanzan y hay que usar el LLM."""
+        try:
+            data = sample_flashcards(self.collection_name, files, difficulty=difficulty, topic=topic)
+        except Exception as e:
+            logger.exception(f"Error leyendo el almacén de flashcards: {e}")
+            return None
+        if data is None:
+            logger.info(f"Flashcards insuficientes en almacén para {files}, se usa el LLM")
+            return None
+        sources = sorted(set(c["source"]["file"] for c in data["flashcards"]))
+        logger.info(f"Flashcards servidas desde almacén: {data['total_generated']} de {sources}")
+        return {
+            "answer": json.dumps(data, ensure_ascii=False),
+            "source_documents": [Document(page_content="", metadata={"source": s}) for s in sources],
+            "tokens_used": 0,
+            "mode": "flashcards",
+            "files": files,
+            "served_from": "flashcard_store",
+        }
+
+    def _search_from_profiles(self, query: str) -> Dict[str, Any]:
+        """Modo 'search' sobre el índice de perfiles: solo índice (SEARCH_USE_LLM=false) o LLM con perfiles como contexto."""
+        results = search_profiles(query, self.collection_name)
+        source_documents = [Document(page_content=d.page_content, metadata=d.metadata or {}) for d, _ in results]
+        if not config.SEARCH_USE_LLM:
+            data = search_answer_from_profiles(query, results)
+            return {
+                "answer": json.dumps(data, ensure_ascii=False),
+                "source_documents": source_documents,
+                "tokens_used": 0,
+                "mode": "search",
+                "files": [],
+                "served_from": "profile_index",
+            }
+        prompt = build_search_prompt(query, results)
+        return {
+            "answer": rag_llm.generate(prompt),
+            "source_documents": source_documents,
+            "tokens_used": count_tokens(prompt),
+            "mode": "search",
+            "files": [],
+            "served_from": "profile_index+llm",
+        }
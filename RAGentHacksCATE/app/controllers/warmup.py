@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from app.rag.retriever import get_vectorstore, get_relevant_docs, list_collection_names
+from app.rag.qa import build_prompt, llm
+from app.utils import config
+from app.utils.logger import logger
+from app.utils.tokens import get_encoding
+
+
+def load_usage_stats(path: str = None) -> Dict[str, int]:
+    path = path or config.USAGE_STATS_PATH
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {str(k): int(v) for k, v in data.items()}
+    except Exception as e:
+        logger.warning(f"No se pudieron leer estadísticas de uso en {path}: {e}")
+        return {}
+
+
+def save_usage_stats(stats: Dict[str, int], path: str = None) -> None:
+    path = path or config.USAGE_STATS_PATH
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.warning(f"No se pudieron guardar estadísticas de uso en {path}: {e}")
+
+
+def select_collections(usage: Dict[str, int]) -> List[str]:
+    """
+    Colecciones a precalentar:
+    - WARMUP_COLLECTIONS si está configurado
+    - si no, las más consultadas según `usage` que existan en Chroma
+    - si no hay estadísticas, las colecciones existentes
+    """
+    if config.WARMUP_COLLECTIONS:
+        return list(config.WARMUP_COLLECTIONS)
+    try:
+        existing = list_collection_names()
+    except Exception as e:
+        logger.warning(f"No se pudieron listar colecciones para warm-up: {e}")
+        return []
+    existing = [name for name in existing if not name.endswith(config.PROFILE_COLLECTION_SUFFIX)]
+    ranked = sorted(existing, key=lambda name: (-usage.get(name, 0), name))
+    return ranked[:config.WARMUP_MAX_COLLECTIONS]
+
+
+class WarmupState:
+    """Estado del warm-up; la API lo consulta para responder readiness."""
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.collections: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished
+
+    def start(self, chatbot_factory: Callable[[str], Any], usage: Dict[str, int]) -> None:
+        """Lanza el warm-up en un hilo para no bloquear el arranque (liveness responde de inmediato)."""
+        self.started = True
+        if not config.WARMUP_ENABLED:
+            self.finished = True
+            return
+        self._thread = threading.Thread(target=self._run, args=(chatbot_factory, usage), name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self, chatbot_factory: Callable[[str], Any], usage: Dict[str, int]) -> None:
+        t0 = time.perf_counter()
+        names = select_collections(usage)
+        for name in names:
+            self.collections[name] = {"status": "warming"}
+        for name in names:
+            self.collections[name] = warm_collection(name, chatbot_factory)
+        self.finished = True
+        logger.info(f"Warm-up terminado: {len(names)} colecciones en {time.perf_counter() - t0:.2f}s")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "started": self.started,
+            "warmup_enabled": config.WARMUP_ENABLED,
+            "collections": self.collections,
+        }
+
+
+def warm_collection(name: str, chatbot_factory: Callable[[str], Any]) -> Dict[str, Any]:
+    """Ejecuta una consulta sintética por cada etapa y devuelve la duración (ms) de cada una."""
+    stages: Dict[str, float] = {}
+
+    def timed(stage: str, fn: Callable[[], Any]) -> Any:
+        t = time.perf_counter()
+        out = fn()
+        stages[stage] = round((time.perf_counter() - t) * 1000, 1)
+        return out
+
+    try:
+        timed("chatbot", lambda: chatbot_factory(name))
+        vectordb = timed("open_collection", lambda: get_vectorstore(collection_name=name))
+        count = timed("count", lambda: vectordb._collection.count())
+        # Embebe la consulta y carga el índice HNSW de la colección
+        docs = timed("retrieve", lambda: get_relevant_docs(config.WARMUP_QUERY, collection_name=name))
+        timed("tokenizer", get_encoding)
+        timed("build_prompt", lambda: build_prompt(docs, config.WARMUP_QUERY))
+        if config.WARMUP_LLM:
+            timed("llm", lambda: llm.generate("Responde solo: ok"))
+        logger.info(f"Warm-up de '{name}' listo ({count} documentos): {stages}")
+        return {"status": "warm", "documents": count, "stages_ms": stages}
+    except Exception as e:
+        logger.exception(f"Warm-up de '{name}' falló: {e}")
+        return {"status": "failed", "error": str(e), "stages_ms": stages}
@@ -2,6 +2,8 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from app.utils import config
 from typing import List, Union, Dict
 import unicodedata
+import hashlib
+import os
 import re
 
 def normalize_text(s: str) -> str:
@@ -13,21 +15,39 @@ def normalize_text(s: str) -> str:
     return s.strip()
 
 
+def content_hash(text: str) -> str:
+    """Hash estable (SHA-256) del contenido, usado para detectar documentos modificados."""
+    return hashlib.sha256((text or "").encode("utf-8", "ignore")).hexdigest()
+
+
+def source_key(name: str) -> str:
+    """Nombre de archivo comparable: sin ruta, sin extensión y en minúsculas (el frontend envía nombres sin extensión)."""
+    base = os.path.basename(name or "")
+    return os.path.splitext(base)[0].lower()
+
+
 def chunk_text(text: Union[str, List[str]], chunk_size_chars: int = None, chunk_overlap: int = None) -> List[Dict]:
     """
     Devuelve un único chunk por archivo, sin importar su tamaño.
-    Si `text` es lista (páginas), se une con saltos de línea.
+    Si `text` es lista (páginas), se une con saltos de línea y se guarda
+    en `page_offsets` el carácter donde empieza cada página.
     """
     if isinstance(text, list):
         normalized_pages = [normalize_text(p or "") for p in text]
         full = "\n".join(normalized_pages)
         if not full.strip():
             return []
+        offsets = []
+        pos = 0
+        for p in normalized_pages:
+            offsets.append(pos)
+            pos += len(p) + 1
         return [{
             "page_start": 0,
             "page_end": max(0, len(normalized_pages) - 1),
             "char_start": 0,
             "char_end": len(full),
+            "page_offsets": offsets,
             "text": full,
         }]
     else:
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional, Union
+from app.utils import config
+from app.utils.logger import logger
+
+# Subir cuando cambie la normalización del texto extraído: invalida todas las entradas previas
+EXTRACTION_FORMAT_VERSION = "1"
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 del contenido del archivo, leído por bloques (no carga el PDF completo en memoria)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def bytes_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class FallbackExtraction(Exception):
+    """
+    El extractor pedido falló y se usó un respaldo (p. ej. Marker → PyPDF2). `cached_extraction`
+    devuelve `text` sin guardarlo: no debe quedar cacheado bajo la clave del extractor que falló.
+    """
+
+    def __init__(self, text: Union[str, list]):
+        super().__init__("extracción de respaldo")
+        self.text = text
+
+
+class ExtractionCache:
+    """
+    Almacén SQLite del texto extraído por archivo (lista de páginas o texto plano), comprimido con zlib.
+    La clave es (hash del contenido, versión del extractor): cambiar chunking, embeddings o índices
+    reutiliza el texto; cambiar de extractor (PyPDF2 ↔ Marker, versión) fuerza una nueva extracción.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.EXTRACTION_CACHE_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                content_hash TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                data BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, extractor)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, doc_hash: str, extractor: str) -> Optional[Union[str, list]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM extractions WHERE content_hash = ? AND extractor = ?",
+                (doc_hash, extractor),
+            ).fetchone()
+        if not row:
+            return None
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, doc_hash: str, extractor: str, text: Union[str, list]) -> None:
+        blob = zlib.compress(json.dumps(text, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (content_hash, extractor, data, created_at) VALUES (?, ?, ?, ?)",
+                (doc_hash, extractor, blob, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT extractor, COUNT(*), SUM(LENGTH(data)) FROM extractions GROUP BY extractor"
+            ).fetchall()
+        return {
+            "entries": sum(r[1] for r in rows),
+            "bytes": sum(r[2] or 0 for r in rows),
+            "by_extractor": {r[0]: r[1] for r in rows},
+        }
+
+    def clear(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM extractions")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+        return cur.rowcount
+
+
+_cache: Optional[ExtractionCache] = None
+
+
+def get_extraction_cache() -> ExtractionCache:
+    global _cache
+    if _cache is None:
+        _cache = ExtractionCache()
+    return _cache
+
+
+def cached_extraction(doc_hash: str, extractor: str, extract):
+    """
+    Devuelve el texto cacheado para (hash, extractor) o ejecuta `extract()` y lo guarda.
+    Si `extract()` lanza FallbackExtraction se devuelve su texto sin cachearlo (se reintenta la próxima vez).
+    """
+    if not config.EXTRACTION_CACHE_ENABLED:
+        try:
+            return extract()
+        except FallbackExtraction as e:
+            return e.text
+    key = f"{extractor}/v{EXTRACTION_FORMAT_VERSION}"
+    cache = get_extraction_cache()
+    try:
+        hit = cache.get(doc_hash, key)
+    except Exception as e:
+        logger.exception(f"Error leyendo la caché de extracción: {e}")
+        hit = None
+    if hit is not None:
+        logger.info(f"Texto extraído desde caché ({key}, {doc_hash[:12]})")
+        return hit
+    try:
+        text = extract()
+    except FallbackExtraction as e:
+        logger.info(f"Extracción de respaldo para {doc_hash[:12]}: no se guarda bajo {key}")
+        return e.text
+    try:
+        cache.put(doc_hash, key, text)
+    except Exception as e:
+        logger.exception(f"Error guardando en la caché de extracción: {e}")
+    return text
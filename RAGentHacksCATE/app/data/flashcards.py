@@ -0,0 +1,194 @@
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from langchain_core.documents import Document
+from app.data.chunking import content_hash, source_key
+from app.rag.qa import build_prompt, parse_llm_json, llm
+from app.utils import config
+from app.utils.logger import logger
+
+
+class FlashcardStore:
+    """Almacén SQLite de flashcards por documento, versionadas por hash de contenido."""
+
+    def __init__(self, path: str = None):
+        self.path = path or config.FLASHCARDS_DB_PATH
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS flashcard_documents (
+                collection TEXT NOT NULL,
+                source TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                generated_at REAL NOT NULL,
+                PRIMARY KEY (collection, source)
+            );
+            CREATE TABLE IF NOT EXISTS flashcards (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection TEXT NOT NULL,
+                source TEXT NOT NULL,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                page INTEGER,
+                difficulty TEXT,
+                topic TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_flashcards_collection ON flashcards (collection, source);
+            """
+        )
+        self._conn.commit()
+
+    def is_current(self, collection: str, source: str, doc_hash: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash FROM flashcard_documents WHERE collection = ? AND source = ?",
+                (collection, source),
+            ).fetchone()
+        return bool(row) and row[0] == doc_hash
+
+    def replace(self, collection: str, source: str, doc_hash: str, cards: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM flashcards WHERE collection = ? AND source = ?", (collection, source))
+            self._conn.executemany(
+                "INSERT INTO flashcards (collection, source, question, answer, page, difficulty, topic) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        collection,
+                        source,
+                        c["question"],
+                        c["answer"],
+                        c.get("page"),
+                        c.get("difficulty"),
+                        c.get("topic"),
+                    )
+                    for c in cards
+                ],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO flashcard_documents (collection, source, content_hash, generated_at) VALUES (?, ?, ?, ?)",
+                (collection, source, doc_hash, time.time()),
+            )
+            self._conn.commit()
+
+    def delete(self, collection: str, source: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM flashcards WHERE collection = ? AND source = ?", (collection, source))
+            self._conn.execute("DELETE FROM flashcard_documents WHERE collection = ? AND source = ?", (collection, source))
+            self._conn.commit()
+
+    def cards_for(self, collection: str, files: Iterable[str]) -> List[Dict[str, Any]]:
+        wanted = set(source_key(f) for f in files)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, question, answer, page, difficulty, topic FROM flashcards WHERE collection = ?",
+                (collection,),
+            ).fetchall()
+        return [
+            {"source": r[0], "question": r[1], "answer": r[2], "page": r[3], "difficulty": r[4], "topic": r[5]}
+            for r in rows
+            if source_key(r[0]) in wanted
+        ]
+
+
+_store: Optional[FlashcardStore] = None
+
+
+def get_flashcard_store() -> FlashcardStore:
+    global _store
+    if _store is None:
+        _store = FlashcardStore()
+    return _store
+
+
+def generate_flashcards(doc: Document, n: int = None) -> List[Dict[str, Any]]:
+    """Genera flashcards para un único documento con el LLM y las normaliza."""
+    n = n or config.FLASHCARDS_PER_DOCUMENT
+    source = (doc.metadata or {}).get("source", "desconocido")
+    question = (
+        f"Genera {n} flashcards que cubran todo el documento. "
+        "Varía la dificultad (easy, medium, hard) y asigna un tema corto a cada una."
+    )
+    prompt = build_prompt([doc], question, mode="flashcards")
+    data = parse_llm_json(llm.generate(prompt))
+    cards = []
+    for c in (data or {}).get("flashcards", []) if isinstance(data, dict) else []:
+        if not isinstance(c, dict) or not c.get("question") or not c.get("answer"):
+            continue
+        src = c.get("source") if isinstance(c.get("source"), dict) else {}
+        page = src.get("page")
+        cards.append({
+            "question": str(c["question"]),
+            "answer": str(c["answer"]),
+            "page": page if isinstance(page, int) else None,
+            "difficulty": str(c.get("difficulty") or "medium").lower(),
+            "topic": str(c.get("topic") or ""),
+        })
+    logger.info(f"Generadas {len(cards)} flashcards para {source}")
+    return cards
+
+
+def materialize_flashcards(documents: Iterable[Document], collection_name: str, force: bool = False) -> int:
+    """
+    Genera y guarda flashcards para cada documento cuyo contenido cambió (o no existe en el almacén).
+    Retorna el número de documentos regenerados.
+    """
+    store = get_flashcard_store()
+    regenerated = 0
+    for doc in documents:
+        source = (doc.metadata or {}).get("source", "desconocido")
+        doc_hash = content_hash(doc.page_content)
+        if not force and store.is_current(collection_name, source, doc_hash):
+            logger.info(f"Flashcards vigentes para {source}, se omite regeneración")
+            continue
+        try:
+            cards = generate_flashcards(doc)
+        except Exception as e:
+            logger.exception(f"Error generando flashcards para {source}: {e}")
+            continue
+        if cards:
+            store.replace(collection_name, source, doc_hash, cards)
+            regenerated += 1
+    return regenerated
+
+
+def sample_flashcards(
+    collection_name: str,
+    files: List[str],
+    difficulty: Optional[str] = None,
+    topic: Optional[str] = None,
+    n: int = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Arma una respuesta en el esquema 'flashcards' desde el almacén, filtrando por dificultad/tema.
+    Retorna None si no hay suficientes tarjetas (el llamador debe usar el LLM como respaldo).
+    """
+    n = n or config.FLASHCARDS_SAMPLE_SIZE
+    cards = get_flashcard_store().cards_for(collection_name, files)
+    if difficulty:
+        cards = [c for c in cards if (c.get("difficulty") or "") == difficulty.lower()]
+    if topic:
+        t = topic.lower()
+        cards = [c for c in cards if t in (c.get("topic") or "").lower() or t in c["question"].lower()]
+    if len(cards) < min(n, config.FLASHCARDS_MIN_STORED):
+        return None
+
+    picked = random.sample(cards, min(n, len(cards)))
+    flashcards = [
+        {
+            "id": i + 1,
+            "question": c["question"],
+            "answer": c["answer"],
+            "source": {"file": c["source"], "page": c["page"]},
+            "difficulty": c["difficulty"],
+            "topic": c["topic"],
+        }
+        for i, c in enumerate(picked)
+    ]
+    return {
+        "flashcards": flashcards,
+        "total_generated": len(flashcards),
+        "topics_covered": sorted(set(c["topic"] for c in picked if c["topic"])),
+    }
@@ -1,22 +1,28 @@
+import io
+import json
 import os
-from typing import List
-from app.data.chunking import chunk_text
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from app.data.chunking import chunk_text, content_hash
 from app.data.chunking import __dict__ as _chunk_mod
 from app.models.embeddings import EmbeddingClient
+from app.rag.retriever import cosine_similarity, distance_to_similarity, mark_collection_updated, open_collection
 from app.utils import config
 from app.utils.logger import logger
-from math import sqrt
 
-from langchain_chroma import Chroma
 from langchain.schema import Document
 
-from PyPDF2 import PdfReader
+from PyPDF2 import PdfReader, __version__ as PYPDF2_VERSION
 import docx
+from docx import __version__ as DOCX_VERSION
 
 
 from app.data.marker import extract_text_with_marker
+from app.data.extraction_cache import FallbackExtraction, bytes_hash, cached_extraction, file_hash
+from app.data.flashcards import materialize_flashcards
+from app.data.profiles import build_profiles, parse_exam_name
 
-def read_pdf(path: str) -> str:
+def read_pdf(path: Union[str, io.BytesIO]) -> str:
+    """Acepta una ruta o un stream en memoria (p. ej. un objeto descargado de S3)."""
     reader = PdfReader(path)
     text = []
     for page in reader.pages:
@@ -28,7 +34,7 @@ def read_pdf(path: str) -> str:
     else:
         return [p.strip() for p in text]
 
-def read_docx(path: str) -> str:
+def read_docx(path: Union[str, io.BytesIO]) -> str:
     doc = docx.Document(path)
     return "\n".join([p.text for p in doc.paragraphs])
 
@@ -36,9 +42,26 @@ def read_txt(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
+def _extractor_key(ext: str, use_marker_ocr: bool = False) -> str:
+    """Identifica el extractor (y su configuración) que produce el texto, para versionar la caché."""
+    if ext == ".pdf":
+        key = f"pypdf2-{PYPDF2_VERSION}"
+        if use_marker_ocr and config.FORCE_MARKER_OCR:
+            key += f"+marker-{config.MARKER_OCR_THRESHOLD}"
+        return key
+    return f"python-docx-{DOCX_VERSION}"
+
 def load_file_to_text(path: str, use_marker_ocr: bool = True) -> str:
+    """
+    Texto de un archivo local. PDFs y DOCX pasan por la caché de extracción (hash del contenido +
+    extractor), así reingestar con otro chunking o embeddings no vuelve a parsear ni a correr OCR.
+    """
     ext = os.path.splitext(path)[1].lower()
+    if ext in (".pdf", ".docx", ".doc"):
+        return cached_extraction(file_hash(path), _extractor_key(ext, use_marker_ocr), lambda: _extract_file(path, ext, use_marker_ocr))
+    return _extract_file(path, ext, use_marker_ocr)
 
+def _extract_file(path: str, ext: str, use_marker_ocr: bool = True):
     if ext == ".pdf":
         # Comportamiento condicional: primero extracción nativa; opcionalmente usar Marker según configuración y umbral
         raw_text = read_pdf(path)
@@ -54,6 +77,8 @@ def load_file_to_text(path: str, use_marker_ocr: bool = True) -> str:
                     return [p.strip() for p in ocr_result.split('\n\n')]
                 except Exception as e:
                     logger.exception(f"Marker OCR failed for {path}, falling back to PyPDF2: {e}")
+                    # No se cachea bajo la clave de Marker: la próxima ingesta vuelve a intentar el OCR
+                    raise FallbackExtraction(raw_text)
         return raw_text
 
     elif ext in [".docx", ".doc"]:
@@ -63,24 +88,243 @@ def load_file_to_text(path: str, use_marker_ocr: bool = True) -> str:
     else:
         raise ValueError(f"Unsupported file extension: {ext}")
 
-def ingest_files(paths: List[str], collection_name: str = None, persist: bool = None, dry_run: bool = False, dedup_threshold: float = None):
+def load_bytes_to_text(name: str, data: bytes):
+    """
+    Extrae texto de un archivo ya cargado en memoria. Los PDFs se detectan también por su firma
+    (%PDF) porque muchos objetos del bucket no tienen extensión. Marker OCR requiere una ruta
+    en disco, por lo que aquí solo se usa PyPDF2.
+    """
+    ext = os.path.splitext(name)[1].lower()
+    if ext == ".pdf" or (ext not in (".docx", ".doc", ".txt", ".md") and data[:5] == b"%PDF-"):
+        return cached_extraction(bytes_hash(data), _extractor_key(".pdf"), lambda: read_pdf(io.BytesIO(data)))
+    elif ext in [".docx", ".doc"]:
+        return cached_extraction(bytes_hash(data), _extractor_key(ext), lambda: read_docx(io.BytesIO(data)))
+    elif ext in [".txt", ".md"]:
+        return data.decode("utf-8", "ignore")
+    else:
+        raise ValueError(f"Unsupported file extension: {ext}")
+
+class IngestCheckpoint:
+    """
+    Avance de una ingesta por lotes, persistido en JSON tras cada escritura a Chroma.
+    La clave depende de la colección y del conjunto de rutas, así la misma invocación
+    interrumpida se puede retomar omitiendo los archivos ya escritos.
+    """
+
+    def __init__(self, collection_name: str, paths: List[str], directory: str = None):
+        digest = content_hash("\n".join(sorted(os.path.abspath(p) for p in paths)))[:16]
+        self.path = os.path.join(directory or config.INGEST_CHECKPOINT_DIR, f"{collection_name}-{digest}.json")
+        self.collection_name = collection_name
+        self.completed: List[str] = []
+        self.documents = 0
+
+    def load(self) -> "IngestCheckpoint":
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.completed = data.get("completed", [])
+            self.documents = data.get("documents", 0)
+        return self
+
+    def mark(self, names: List[str], documents: int) -> None:
+        self.completed.extend(names)
+        self.documents += documents
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"collection": self.collection_name, "completed": self.completed, "documents": self.documents}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def source_identity(path: str) -> str:
+    """
+    Identidad estable de un archivo local para los ids de sus chunks y para reemplazarlos al reingestar:
+    la ruta real. Los archivos subidos por la API viven en INGEST_UPLOAD_DIR/<job_id>/, un directorio
+    nuevo por trabajo; para ellos la identidad es la ruta dentro del trabajo (el nombre con que se subieron).
+    """
+    full = os.path.realpath(path)
+    uploads = os.path.realpath(config.INGEST_UPLOAD_DIR)
+    if os.path.commonpath([uploads, full]) == uploads:
+        parts = os.path.relpath(full, uploads).split(os.sep)
+        if len(parts) > 1:
+            return "upload:" + "/".join(parts[1:])
+    return full
+
+
+def ingest_files(paths: List[str], collection_name: str = None, persist: bool = None, dry_run: bool = False, dedup_threshold: float = None, flashcards: bool = None, profiles: bool = None, progress: Optional[Callable[[str, int, int], None]] = None, resume: bool = False) -> int:
+    """
+    Ingesta archivos locales en la colección. `progress(stage, done, total)` se invoca al avanzar cada
+    etapa ('extract', 'embed', 'write', 'profiles', 'flashcards') para reportar avance.
+    Con `resume=True` se omiten los archivos que una ejecución interrumpida con las mismas rutas ya escribió.
+    Retorna el número de documentos escritos (o que se escribirían, en dry-run); al retomar incluye
+    los que escribió la ejecución interrumpida, así el total corresponde a todas las rutas.
+    """
+    collection_name = collection_name or config.DEFAULT_COLLECTION_NAME
+    checkpoint = None
+    resumed_documents = 0
+    if not dry_run:
+        checkpoint = IngestCheckpoint(collection_name, paths)
+        if resume:
+            checkpoint.load()
+            resumed_documents = checkpoint.documents
+        else:
+            checkpoint.clear()
+    done = set(checkpoint.completed) if checkpoint else set()
+    pending = [p for p in paths if p not in done]
+    skipped = [p for p in paths if p in done]
+    if skipped:
+        logger.info(
+            f"Retomando ingesta: se omiten {len(skipped)} de {len(paths)} archivos ya escritos "
+            f"({resumed_documents} documentos): {', '.join(os.path.basename(p) for p in skipped)}"
+        )
+
+    def sources():
+        for path in pending:
+            # Usar OCR solo si está habilitado en configuración
+            yield path, load_file_to_text(path, use_marker_ocr=config.FORCE_MARKER_OCR), {}
+
+    written = ingest_texts(
+        sources(),
+        total=len(pending),
+        collection_name=collection_name,
+        persist=persist,
+        dry_run=dry_run,
+        dedup_threshold=dedup_threshold,
+        flashcards=flashcards,
+        profiles=profiles,
+        progress=progress,
+        checkpoint=checkpoint,
+    )
+    if checkpoint:
+        checkpoint.clear()
+    if skipped:
+        logger.info(f"Ingesta retomada completa: {written + resumed_documents} documentos ({written} en esta ejecución, {resumed_documents} antes de la interrupción)")
+    return written + resumed_documents
+
+def ingest_texts(
+    sources: Iterable[Tuple[str, Any, Dict[str, Any]]],
+    total: Optional[int] = None,
+    collection_name: str = None,
+    persist: bool = None,
+    dry_run: bool = False,
+    dedup_threshold: float = None,
+    flashcards: bool = None,
+    profiles: bool = None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    checkpoint: Optional[IngestCheckpoint] = None,
+    batch_size: int = None,
+) -> int:
+    """
+    Ingesta textos ya extraídos como un pipeline por lotes de memoria acotada. `sources` entrega tuplas
+    (nombre, texto o lista de páginas, metadata extra) y puede ser un generador: la extracción de cada
+    fuente ocurre al consumirla. La identidad de cada fuente es `source_id` de la metadata extra o, si no
+    viene, `source_identity(nombre)`; `source` (el nombre del archivo) queda solo para mostrar y citar. Cada `batch_size` documentos se embeben en una sola llamada, se
+    descartan los casi duplicados (contra el lote y contra lo ya guardado en Chroma), se escriben con
+    ids deterministas y se registra el avance en `checkpoint`. Retorna el número de documentos escritos.
+    """
+    def report(stage: str, done: int, total: int):
+        if progress:
+            progress(stage, done, total)
+
     def clean_text(text):
         return text.encode('utf-8', 'ignore').decode('utf-8')
     emb = EmbeddingClient()
     collection_name = collection_name or config.DEFAULT_COLLECTION_NAME
-    vectordb = Chroma(
-        persist_directory=config.CHROMA_PERSIST_DIR,
-        embedding_function=emb._client,
-        collection_name=collection_name,
-    )
+    collection = open_collection(collection_name)
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
     persist = config.DEFAULT_PERSIST if persist is None else persist
     dedup_threshold = config.DEDUP_SIM_THRESHOLD if dedup_threshold is None else dedup_threshold
-    documents = []
+    flashcards = config.FLASHCARDS_AT_INGEST if flashcards is None else flashcards
+    profiles = config.PROFILES_AT_INGEST if profiles is None else profiles
+    batch_size = batch_size or config.INGEST_BATCH_SIZE
+    total = total or 0
+
     seen_hashes = set()
-    seen_embeddings = []
-    for path in paths:
-        # Usar OCR solo si está habilitado en configuración
-        text = load_file_to_text(path, use_marker_ocr=config.FORCE_MARKER_OCR)
+    batch: List[Tuple[str, Document]] = []  # (id, documento) pendientes de escribir
+    batch_sources: List[str] = []  # fuentes cuyos chunks están completos dentro del lote
+    stats = {"files": 0, "written": 0, "replaced": 0}
+
+    def near_duplicates(ids: List[str], docs: List[Document], embeddings: List[List[float]]) -> set:
+        """Índices del lote que son casi duplicados de otro documento (de otra fuente) ya guardado o aceptado."""
+        if not dedup_threshold or dedup_threshold >= 1.0:
+            return set()
+        rejected = set()
+        stored = collection.count()
+        neighbours = None
+        if stored:
+            neighbours = collection.query(
+                query_embeddings=embeddings,
+                n_results=min(3, stored),
+                include=["metadatas", "distances"],
+            )
+        accepted: List[int] = []
+        for j, doc in enumerate(docs):
+            src = doc.metadata.get("source_id")
+            if neighbours:
+                for nid, md, dist in zip(neighbours["ids"][j], neighbours["metadatas"][j], neighbours["distances"][j]):
+                    # La misma fuente (reingesta) o el mismo id (reanudación) no cuentan como duplicado
+                    if nid == ids[j] or (md or {}).get("source_id") == src:
+                        continue
+                    sim = distance_to_similarity(dist, space)
+                    if sim >= dedup_threshold:
+                        logger.info(f"Skipping near-duplicate chunk for {src} (chunk {doc.metadata.get('chunk')}) sim={sim:.3f} vs stored {(md or {}).get('source')}")
+                        rejected.add(j)
+                        break
+            if j in rejected:
+                continue
+            for a in accepted:
+                if docs[a].metadata.get("source_id") == src:
+                    continue
+                sim = cosine_similarity(embeddings[j], embeddings[a])
+                if sim >= dedup_threshold:
+                    logger.info(f"Skipping near-duplicate chunk for {src} (chunk {doc.metadata.get('chunk')}) sim={sim:.3f})")
+                    rejected.add(j)
+                    break
+            if j not in rejected:
+                accepted.append(j)
+        return rejected
+
+    def flush():
+        kept = 0
+        if batch:
+            ids = [i for i, _ in batch]
+            docs = [d for _, d in batch]
+            embeddings = emb.embed([d.page_content for d in docs])
+            report("embed", stats["files"], total)
+            rejected = near_duplicates(ids, docs, embeddings)
+            keep = [j for j in range(len(docs)) if j not in rejected]
+            docs_kept = [docs[j] for j in keep]
+            if keep and not dry_run:
+                collection.upsert(
+                    ids=[ids[j] for j in keep],
+                    embeddings=[embeddings[j] for j in keep],
+                    documents=[docs[j].page_content for j in keep],
+                    metadatas=[docs[j].metadata for j in keep],
+                )
+                report("write", stats["files"], total)
+                if profiles:
+                    report("profiles", stats["files"], total)
+                    build_profiles(docs_kept, collection_name)
+                if flashcards:
+                    report("flashcards", stats["files"], total)
+                    regenerated = materialize_flashcards(docs_kept, collection_name)
+                    logger.info(f"Flashcards materializadas para {regenerated} documentos de '{collection_name}'")
+            kept = len(keep)
+            stats["written"] += kept
+            logger.info(f"Lote {'simulado' if dry_run else 'escrito'}: {len(keep)} documentos ({len(rejected)} casi duplicados) en '{collection_name}'")
+        if checkpoint and batch_sources:
+            checkpoint.mark(list(batch_sources), kept)
+        batch.clear()
+        batch_sources.clear()
+
+    for file_index, (path, text, extra_metadata) in enumerate(sources):
+        report("extract", file_index + 1, total)
+        stats["files"] = file_index + 1
+        batch_sources.append(path)
         # Validar texto
         if isinstance(text, list):
             combined_text = "\n".join([p or "" for p in text])
@@ -92,6 +336,9 @@ def ingest_files(paths: List[str], collection_name: str = None, persist: bool =
                 logger.info(f"No text extracted from {path}, skipping.")
                 continue
 
+        source = os.path.basename(path)
+        source_id = (extra_metadata or {}).get("source_id") or source_identity(path)
+        file_ids: List[str] = []
         # Un único chunk por archivo
         chunks = chunk_text(text, chunk_size_chars=config.CHUNK_DEFAULT_SIZE, chunk_overlap=config.CHUNK_DEFAULT_OVERLAP)
         for i, ch in enumerate(chunks):
@@ -99,60 +346,65 @@ def ingest_files(paths: List[str], collection_name: str = None, persist: bool =
             ch_text = ch_dict.get("text") or ""
             ch_clean = clean_text(ch_text)
 
-            h = hash(ch_clean)
+            h = content_hash(ch_clean)
             if h in seen_hashes:
                 logger.info(f"Skipping exact-duplicate chunk for {path} (chunk {i})")
                 continue
-
-            accept = True
-            if dedup_threshold and dedup_threshold < 1.0 and len(seen_embeddings) > 0:
-                emb_client = EmbeddingClient()
-                q_emb = emb_client.embed([ch_clean])
-                if isinstance(q_emb, list) and len(q_emb) == 1:
-                    q_emb = q_emb[0]
-                for d_emb in seen_embeddings:
-                    dot = sum(a * b for a, b in zip(q_emb, d_emb))
-                    norm_q = sqrt(sum(a * a for a in q_emb))
-                    norm_d = sqrt(sum(a * a for a in d_emb))
-                    sim = dot / (norm_q * norm_d) if norm_q and norm_d else 0.0
-                    if sim >= dedup_threshold:
-                        accept = False
-                        logger.info(f"Skipping near-duplicate chunk for {path} (chunk {i}) sim={sim:.3f})")
-                        break
-
-            if not accept:
-                continue
-
             seen_hashes.add(h)
-            emb_client = EmbeddingClient()
-            emb = emb_client.embed([ch_clean])
-            if isinstance(emb, list) and len(emb) == 1:
-                seen_embeddings.append(emb[0])
 
-            metadata = {"source": os.path.basename(path), "chunk": i}
+            metadata = {"source": source, "source_id": source_id, "chunk": i, "content_hash": h}
+            metadata.update(parse_exam_name(path))
+            metadata.update(extra_metadata or {})
             if ch_dict.get("page_start") is not None:
                 metadata.update({"page_start": ch_dict.get("page_start"), "page_end": ch_dict.get("page_end")})
             if ch_dict.get("char_start") is not None:
                 metadata.update({"char_start": ch_dict.get("char_start"), "char_end": ch_dict.get("char_end")})
-            documents.append(Document(page_content=ch_clean, metadata=metadata))
+            if ch_dict.get("page_offsets"):
+                # Chroma solo admite metadatos escalares: offsets de página como lista separada por comas
+                metadata["page_offsets"] = ",".join(str(o) for o in ch_dict["page_offsets"])
+            # Id determinista: reingestar o retomar el mismo archivo sobrescribe en vez de duplicar
+            doc_id = content_hash(f"{source_id}\0{i}\0{h}")[:32]
+            batch.append((doc_id, Document(page_content=ch_clean, metadata=metadata)))
+            file_ids.append(doc_id)
+
+        # Archivo editado: sus chunks anteriores tienen otros ids y se borran antes de escribir los nuevos.
+        # Se busca por nombre y se filtra por identidad: otro archivo con el mismo nombre no se toca. Los
+        # chunks sin `source_id` (ingestados antes de que existiera) no se pueden atribuir y se reemplazan.
+        stored = collection.get(where={"source": source}, include=["metadatas"])
+        current = set(file_ids)
+        stale = [
+            sid for sid, md in zip(stored["ids"], stored["metadatas"] or [])
+            if sid not in current and (md or {}).get("source_id", source_id) == source_id
+        ]
+        if stale:
+            logger.info(f"{source} cambió: {len(stale)} chunks anteriores {'por reemplazar' if dry_run else 'reemplazados'}")
+            if not dry_run:
+                collection.delete(ids=stale)
+                stats["replaced"] += len(stale)
+
+        # Se escribe en frontera de archivo: así el checkpoint nunca deja un archivo a medias
+        if len(batch) >= batch_size:
+            flush()
+    flush()
 
-    if documents:
+    if stats["written"] or stats["replaced"]:
         if dry_run:
-            logger.info(f"Dry-run ingest: {len(documents)} documents would be added to collection '{collection_name}'")
+            logger.info(f"Dry-run ingest: {stats['written']} documents would be added to collection '{collection_name}'")
         else:
-            vectordb.add_documents(documents)
-            logger.info(f"Ingested {len(documents)} documents into collection '{collection_name}'")
+            logger.info(f"Ingested {stats['written']} documents into collection '{collection_name}'")
+            # Avisa a los workers de la API (de este u otros procesos) que reabran la colección
+            mark_collection_updated(collection_name)
     else:
         logger.info("No documents to add after processing (dedup/filter may have removed all chunks)")
-    return documents
+    return stats["written"]
 
 
-def ingest_file(path: str, collection_name: str, persist: bool = None, dry_run: bool = False, dedup_threshold: float = None):
+def ingest_file(path: str, collection_name: str, persist: bool = None, dry_run: bool = False, dedup_threshold: float = None, flashcards: bool = None, profiles: bool = None):
         """
         Ingesta un único archivo en la colección indicada.
         Parámetros:
             - path: ruta_de_archivo
             - collection_name: nombre de la colección destino
-            - persist, dry_run, dedup_threshold: igual que ingest_files
+            - persist, dry_run, dedup_threshold, flashcards, profiles: igual que ingest_files
         """
-        return ingest_files([path], collection_name=collection_name, persist=persist, dry_run=dry_run, dedup_threshold=dedup_threshold)
+        return ingest_files([path], collection_name=collection_name, persist=persist, dry_run=dry_run, dedup_threshold=dedup_threshold, flashcards=flashcards, profiles=profiles)
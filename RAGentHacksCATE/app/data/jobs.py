@@ -0,0 +1,242 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from app.data.ingestion import ingest_files
+from app.utils import config
+from app.utils.logger import logger
+
+
+class IngestJobQueue:
+    """
+    Cola persistente (SQLite) de trabajos de ingesta. Sobrevive reinicios: cada trabajo 'running'
+    registra el worker que lo tomó (`owner`) y un latido (`heartbeat_at`); `requeue_stale` vuelve
+    a encolar solo los que dejaron de latir (su proceso cayó), no los de otro proceso vivo.
+    Cada operación abre su propia conexión, así la cola se puede compartir entre hilos y procesos.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.INGEST_JOBS_DB_PATH
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    id TEXT PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    paths TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    owner TEXT,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            # Bases creadas antes de registrar owner/latido
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_jobs)")}
+            for column, kind in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {column} {kind}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, collection: str, paths: List[str], options: Optional[Dict[str, Any]] = None, job_id: str = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingest_jobs (id, collection, paths, options, status, progress, created_at) VALUES (?, ?, ?, ?, 'queued', '{}', ?)",
+                (job_id, collection, json.dumps(paths), json.dumps(options or {}), time.time()),
+            )
+        logger.info(f"Trabajo de ingesta {job_id} encolado: {len(paths)} archivos en '{collection}'")
+        return job_id
+
+    def claim_next(self, owner: str = None) -> Optional[Dict[str, Any]]:
+        """Toma atómicamente el trabajo encolado más antiguo y lo marca 'running' a nombre de `owner`."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT id FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row:
+                    now = time.time()
+                    conn.execute(
+                        "UPDATE ingest_jobs SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? WHERE id = ?",
+                        (now, owner, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row else None
+
+    def update_progress(self, job_id: str, stage: str, done: int, total: int) -> None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT progress FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+            progress = json.loads(row[0]) if row else {}
+            progress[stage] = {"done": done, "total": total}
+            progress["current_stage"] = stage
+            conn.execute("UPDATE ingest_jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingest_jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ?",
+                (json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingest_jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+
+    def heartbeat(self, owner: str) -> None:
+        """Marca como vivos los trabajos 'running' de `owner`."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingest_jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                (time.time(), owner),
+            )
+
+    def requeue_stale(self, stale_after: float = None) -> int:
+        """Vuelve a encolar los trabajos 'running' sin latido hace más de `stale_after` segundos."""
+        stale_after = config.INGEST_STALE_AFTER if stale_after is None else stale_after
+        with self._connect() as conn:
+            cur = conn.execute(
+                """
+                UPDATE ingest_jobs SET status = 'queued', started_at = NULL, owner = NULL, heartbeat_at = NULL
+                WHERE status = 'running' AND COALESCE(heartbeat_at, started_at, 0) < ?
+                """,
+                (time.time() - stale_after,),
+            )
+            return cur.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, collection: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if collection:
+                rows = conn.execute(
+                    "SELECT * FROM ingest_jobs WHERE collection = ? ORDER BY created_at DESC LIMIT ?", (collection, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM ingest_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(r) for r in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "collection": row["collection"],
+            "paths": json.loads(row["paths"]),
+            "options": json.loads(row["options"]),
+            "status": row["status"],
+            "progress": json.loads(row["progress"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "owner": row["owner"],
+        }
+
+
+class IngestWorkerPool:
+    """Hilos que consumen la cola y ejecutan `ingest_files` fuera del camino de las consultas."""
+
+    def __init__(self, queue: IngestJobQueue, workers: int = None, on_complete: Optional[Callable[[str], None]] = None):
+        self.queue = queue
+        self.workers = config.INGEST_WORKERS if workers is None else workers
+        self.on_complete = on_complete
+        # Identifica a este pool en la cola (varios procesos pueden compartir la base)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._requeue_stale()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat_loop, name="ingest-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+        logger.info(f"Pool de ingesta iniciado con {self.workers} workers ({self.owner})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+
+    def _requeue_stale(self) -> None:
+        requeued = self.queue.requeue_stale()
+        if requeued:
+            logger.info(f"{requeued} trabajos de ingesta interrumpidos vueltos a encolar")
+
+    def _heartbeat_loop(self) -> None:
+        # Latido de los trabajos propios y rescate de los de procesos caídos, mientras el pool viva
+        while not self._stop.wait(config.INGEST_HEARTBEAT_INTERVAL):
+            try:
+                self.queue.heartbeat(self.owner)
+                self._requeue_stale()
+            except Exception as e:
+                logger.exception(f"Error actualizando el latido de la cola de ingesta: {e}")
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim_next(self.owner)
+            except Exception as e:
+                logger.exception(f"Error leyendo la cola de ingesta: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(config.INGEST_POLL_INTERVAL)
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        collection = job["collection"]
+        logger.info(f"Procesando trabajo de ingesta {job_id} ('{collection}')")
+        try:
+            # resume=True: un trabajo reencolado tras una caída retoma desde su checkpoint
+            written = ingest_files(
+                job["paths"],
+                collection_name=collection,
+                resume=True,
+                progress=lambda stage, done, total: self.queue.update_progress(job_id, stage, done, total),
+                **job["options"],
+            )
+            self.queue.finish(job_id, {"documents": written})
+        except Exception as e:
+            logger.exception(f"Trabajo de ingesta {job_id} falló: {e}")
+            self.queue.fail(job_id, str(e))
+            return
+        if self.on_complete:
+            try:
+                self.on_complete(collection)
+            except Exception as e:
+                logger.exception(f"Error invalidando cachés de '{collection}': {e}")
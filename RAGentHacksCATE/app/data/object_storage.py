@@ -0,0 +1,160 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import boto3
+from botocore.config import Config as BotoConfig
+from app.data.ingestion import ingest_texts, load_bytes_to_text
+from app.rag.retriever import get_vectorstore
+from app.utils import config
+from app.utils.logger import logger
+
+SUPPORTED_EXTENSIONS = ("", ".pdf", ".docx", ".doc", ".txt", ".md")
+
+_client = None
+
+
+def get_s3_client():
+    """
+    Cliente S3 compartido por el proceso. Los clientes de boto3 son thread-safe y reutilizan
+    conexiones HTTP (keep-alive) del pool de urllib3, dimensionado según S3_MAX_CONCURRENCY.
+    """
+    global _client
+    if _client is None:
+        _client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=config.S3_ENDPOINT_URL or None,
+            aws_access_key_id=config.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=config.S3_SECRET_ACCESS_KEY or None,
+            region_name=config.S3_REGION,
+            config=BotoConfig(
+                max_pool_connections=max(10, config.S3_MAX_CONCURRENCY * 2),
+                retries={"max_attempts": 5, "mode": "adaptive"},
+            ),
+        )
+    return _client
+
+
+def resolve_bucket(bucket: str = None) -> str:
+    bucket = bucket or config.S3_BUCKET
+    if not bucket:
+        raise ValueError("No hay bucket configurado: define S3_BUCKET (o R2_BUCKET_NAME) o pasa --bucket")
+    return bucket
+
+
+def list_objects(prefix: str, bucket: str = None) -> List[Dict[str, Any]]:
+    """Lista los objetos ingestables bajo `prefix` (paginado), con su ETag sin comillas."""
+    bucket = resolve_bucket(bucket)
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    objects = []
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []) or []:
+            key = item["Key"]
+            if key.endswith("/") or os.path.splitext(key)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            objects.append({"key": key, "etag": (item.get("ETag") or "").strip('"'), "size": item.get("Size", 0)})
+    return objects
+
+
+def fetch_object(key: str, bucket: str = None) -> bytes:
+    """Descarga el objeto completo a memoria (sin pasar por disco)."""
+    resp = get_s3_client().get_object(Bucket=resolve_bucket(bucket), Key=key)
+    return resp["Body"].read()
+
+
+def known_etags(collection_name: str) -> Dict[str, str]:
+    """ETag ya ingestado por cada clave S3 de la colección (según la metadata de sus chunks)."""
+    data = get_vectorstore(collection_name=collection_name).get(include=["metadatas"])
+    etags = {}
+    for md in data.get("metadatas", []) or []:
+        if md and md.get("s3_key"):
+            etags[md["s3_key"]] = md.get("etag", "")
+    return etags
+
+
+def _extract(obj: Dict[str, Any], bucket: str) -> Tuple[str, Any, Dict[str, Any]]:
+    data = fetch_object(obj["key"], bucket=bucket)
+    text = load_bytes_to_text(obj["key"], data)
+    return obj["key"], text, {"origin": "s3", "s3_key": obj["key"], "source_id": f"s3:{obj['key']}", "etag": obj["etag"]}
+
+
+def _bounded_extract(
+    objects: List[Dict[str, Any]], bucket: str, max_concurrency: int, failed: List[str]
+) -> Iterator[Tuple[str, Any, Dict[str, Any]]]:
+    """
+    Descarga y extrae con a lo más `max_concurrency` objetos en vuelo, entregándolos en orden.
+    La ventana acota la memoria: no se descarga más allá de lo que la ingesta alcanza a consumir.
+    Las claves que fallan se registran en `failed` y se omiten.
+    """
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        pending = deque()
+        it = iter(objects)
+        for obj in it:
+            pending.append((obj, pool.submit(_extract, obj, bucket)))
+            if len(pending) >= max_concurrency:
+                break
+        while pending:
+            obj, fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt, pool.submit(_extract, nxt, bucket)))
+            try:
+                yield fut.result()
+            except Exception as e:
+                logger.exception(f"Error descargando/extrayendo s3://{bucket}/{obj['key']}: {e}")
+                failed.append(obj["key"])
+
+
+def ingest_prefix(
+    prefix: str,
+    collection_name: str = None,
+    bucket: str = None,
+    max_concurrency: int = None,
+    force: bool = False,
+    dry_run: bool = False,
+    flashcards: bool = None,
+    profiles: bool = None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Ingesta todos los objetos bajo `prefix` (p. ej. 'CII-2750/') directamente desde el bucket.
+    Omite los objetos cuyo ETag no cambió desde la última ingesta. Un objeto modificado reemplaza
+    sus chunks anteriores solo si la nueva extracción funciona; si falla, se conservan los anteriores
+    (con su ETag viejo, así se reintenta en la siguiente corrida) y la clave se informa en `failed`.
+    """
+    bucket = resolve_bucket(bucket)
+    collection_name = collection_name or prefix.strip("/") or config.DEFAULT_COLLECTION_NAME
+    max_concurrency = max_concurrency or config.S3_MAX_CONCURRENCY
+
+    objects = list_objects(prefix, bucket=bucket)
+    known = known_etags(collection_name)
+    todo = [o for o in objects if force or known.get(o["key"]) != o["etag"]]
+    changed = [o["key"] for o in todo if o["key"] in known]
+    logger.info(
+        f"s3://{bucket}/{prefix}: {len(objects)} objetos, {len(objects) - len(todo)} sin cambios (ETag), "
+        f"{len(todo)} por ingestar ({len(changed)} modificados) en '{collection_name}'"
+    )
+
+    # Los chunks anteriores de un objeto modificado los reemplaza ingest_texts (por `source_id`)
+    # al procesar su nueva extracción, no antes
+    failed: List[str] = []
+    written = 0
+    if todo:
+        written = ingest_texts(
+            _bounded_extract(todo, bucket, max_concurrency, failed),
+            total=len(todo),
+            collection_name=collection_name,
+            dry_run=dry_run,
+            flashcards=flashcards,
+            profiles=profiles,
+            progress=progress,
+        )
+    if failed:
+        logger.warning(f"{len(failed)} objetos no se pudieron descargar/extraer: {', '.join(failed)}")
+    return {
+        "listed": len(objects),
+        "skipped": len(objects) - len(todo),
+        "ingested_objects": len(todo) - len(failed),
+        "failed": failed,
+        "documents": written,
+    }
@@ -0,0 +1,196 @@
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.data.chunking import content_hash
+from app.rag.qa import build_prompt, parse_llm_json, llm
+from app.rag.retriever import get_vectorstore
+from app.utils import config
+from app.utils.logger import logger
+from app.utils.tokens import get_encoding
+
+EXAM_TYPES = {
+    "control": "Control",
+    "solemne": "Solemne",
+    "mesa estudio": "Mesa Estudio",
+    "examen": "Examen",
+    "tarea": "Tarea",
+}
+
+_TYPE_RE = re.compile(r"\b(control|solemne|mesa\s+(?:de\s+)?estudio|examen|tarea)(?:\s+(\d{1,2})(?![\d-]))?\b", re.IGNORECASE)
+_SECTION_RE = re.compile(r"\bs(\d)\b", re.IGNORECASE)
+_SEMESTER_RE = re.compile(r"\b(20\d{2})\s*-\s*([12])\b")
+_PAUTA_RE = re.compile(r"\bpautas?\b", re.IGNORECASE)
+_EXT_RE = re.compile(r"\.(pdf|docx?|txt|md)$", re.IGNORECASE)
+
+PROFILE_PROMPT = (
+    "Eres un asistente académico. A partir del documento, devuelve SOLO un JSON válido con la forma "
+    "{{\"summary\":\"string (máximo 80 palabras, en español)\",\"topics\":[\"string\"]}} "
+    "donde 'topics' lista entre 3 y 10 temas concretos evaluados o explicados en el documento, "
+    "usando los términos que aparecen en él.\n\n"
+    "Documento ({source}):\n{text}\n\n"
+    "Genera la salida JSON ahora:"
+)
+
+
+def parse_exam_name(name: str) -> Dict[str, Any]:
+    """
+    Extrae tipo de evaluación, número, sección, semestre y si es pauta desde un nombre
+    como 'Pauta Control 1 S1 2023-2' o 'Control_1_2022-1.pdf'. También sirve para consultas.
+    Solo incluye las claves que se pudieron detectar.
+    """
+    text = _EXT_RE.sub("", os.path.basename(name or "")).replace("_", " ")
+    out: Dict[str, Any] = {}
+
+    m = _TYPE_RE.search(text)
+    if m:
+        key = re.sub(r"\s+(?:de\s+)?", " ", m.group(1).lower())
+        out["exam_type"] = EXAM_TYPES.get(key, m.group(1).title())
+        if m.group(2):
+            out["exam_number"] = int(m.group(2))
+    m = _SECTION_RE.search(text)
+    if m:
+        out["section"] = f"S{m.group(1)}"
+    m = _SEMESTER_RE.search(text)
+    if m:
+        out["semester"] = f"{m.group(1)}-{m.group(2)}"
+        out["year"] = int(m.group(1))
+    if _PAUTA_RE.search(text):
+        out["is_solution"] = True
+    return out
+
+
+def profile_collection_name(collection_name: str) -> str:
+    return f"{collection_name or config.DEFAULT_COLLECTION_NAME}{config.PROFILE_COLLECTION_SUFFIX}"
+
+
+def _profile_text(source: str, exam: Dict[str, Any], summary: str, topics: List[str]) -> str:
+    parts = [f"Archivo: {source}"]
+    label = " ".join(str(exam[k]) for k in ("exam_type", "exam_number", "section", "semester") if k in exam)
+    if label:
+        parts.append(f"Evaluación: {'Pauta ' if exam.get('is_solution') else ''}{label}")
+    if summary:
+        parts.append(f"Resumen: {summary}")
+    if topics:
+        parts.append(f"Temas: {'; '.join(topics)}")
+    return "\n".join(parts)
+
+
+def summarize_document(doc: Document) -> Tuple[str, List[str]]:
+    """Pide al LLM un resumen corto y la lista de temas sobre un extracto acotado del documento."""
+    source = (doc.metadata or {}).get("source", "desconocido")
+    encoding = get_encoding()
+    tokens = encoding.encode(doc.page_content or "")
+    text = encoding.decode(tokens[:config.PROFILE_SOURCE_TOKENS])
+    data = parse_llm_json(llm.generate(PROFILE_PROMPT.format(source=source, text=text)))
+    if not isinstance(data, dict):
+        logger.warning(f"Perfil sin JSON válido para {source}; se guarda solo con metadatos del nombre")
+        return "", []
+    topics = [str(t).strip() for t in data.get("topics") or [] if str(t).strip()]
+    return str(data.get("summary") or "").strip(), topics
+
+
+def build_profiles(documents: Iterable[Document], collection_name: str, force: bool = False) -> int:
+    """
+    Construye (o actualiza si el contenido cambió) el perfil de cada archivo en la colección de perfiles.
+    Retorna el número de perfiles escritos.
+    """
+    vs = get_vectorstore(collection_name=profile_collection_name(collection_name))
+    written = 0
+    for doc in documents:
+        meta = doc.metadata or {}
+        source = meta.get("source", "desconocido")
+        doc_hash = content_hash(doc.page_content)
+        if not force:
+            existing = vs.get(ids=[source], include=["metadatas"])
+            mds = existing.get("metadatas") or []
+            if mds and mds[0] and mds[0].get("content_hash") == doc_hash:
+                continue
+        try:
+            summary, topics = summarize_document(doc)
+        except Exception as e:
+            logger.exception(f"Error construyendo perfil de {source}: {e}")
+            continue
+        exam = parse_exam_name(source)
+        metadata = {
+            "source": source,
+            "content_hash": doc_hash,
+            "summary": summary,
+            "topics": "; ".join(topics),
+            **exam,
+        }
+        vs.add_texts([_profile_text(source, exam, summary, topics)], metadatas=[metadata], ids=[source])
+        written += 1
+    logger.info(f"Perfiles actualizados: {written} en '{profile_collection_name(collection_name)}'")
+    return written
+
+
+def has_profiles(collection_name: str) -> bool:
+    try:
+        return get_vectorstore(collection_name=profile_collection_name(collection_name))._collection.count() > 0
+    except Exception:
+        return False
+
+
+def _where_from_query(query: str) -> Optional[Dict[str, Any]]:
+    """Filtro Chroma a partir de menciones explícitas en la consulta (p. ej. 'pauta solemne 2023-2')."""
+    exam = parse_exam_name(query)
+    conditions = [{k: v} for k, v in exam.items() if k != "year"]
+    # Un tipo suelto ('control') suele ser un término del temario, no un filtro: se exige semestre o un segundo rasgo
+    if not conditions or (len(conditions) < 2 and "semester" not in exam):
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def search_profiles(query: str, collection_name: str, k: int = None) -> List[Tuple[Document, float]]:
+    """Rankea perfiles por similitud; aplica filtros de tipo/semestre detectados en la consulta si hay resultados."""
+    k = k or config.DEFAULT_TOP_K
+    vs = get_vectorstore(collection_name=profile_collection_name(collection_name))
+    where = _where_from_query(query)
+    results: List[Tuple[Document, float]] = []
+    if where:
+        results = vs.similarity_search_with_relevance_scores(query, k=k, filter=where)
+    if not results:
+        results = vs.similarity_search_with_relevance_scores(query, k=k)
+    return results
+
+
+def _relevance(score: float) -> str:
+    if score >= config.SEARCH_HIGH_RELEVANCE:
+        return "high"
+    if score >= config.SEARCH_MEDIUM_RELEVANCE:
+        return "medium"
+    return "low"
+
+
+def search_answer_from_profiles(query: str, results: List[Tuple[Document, float]]) -> Dict[str, Any]:
+    """Respuesta en el esquema 'search' construida solo desde el índice (sin LLM)."""
+    q_terms = set(re.findall(r"\w{4,}", query.lower()))
+    matching = []
+    for doc, score in results:
+        meta = doc.metadata or {}
+        topics = [t for t in (meta.get("topics") or "").split("; ") if t]
+        hits = [t for t in topics if q_terms & set(re.findall(r"\w{4,}", t.lower()))]
+        label = " ".join(str(meta[k]) for k in ("exam_type", "exam_number", "section", "semester") if k in meta)
+        reason = f"Temas relacionados: {', '.join(hits or topics[:3])}" if (hits or topics) else "Similitud con el resumen del archivo"
+        if label:
+            reason += f" ({'Pauta ' if meta.get('is_solution') else ''}{label})"
+        matching.append({
+            "file": meta.get("source", "desconocido"),
+            "relevance": _relevance(score),
+            "reason": reason,
+            "matching_topics": hits or topics[:3],
+            "sample_content": meta.get("summary") or "",
+        })
+    return {
+        "matching_files": matching,
+        "total_matches": len(matching),
+        "search_summary": f"{len(matching)} archivos ordenados por similitud con '{query}' según el índice de perfiles.",
+        "no_matches_reason": None if matching else "Ningún perfil de archivo coincide con la consulta.",
+    }
+
+
+def build_search_prompt(query: str, results: List[Tuple[Document, float]]) -> str:
+    """Prompt 'search' cuyo contexto son los perfiles (no el texto completo de los archivos)."""
+    docs = [Document(page_content=d.page_content, metadata={"source": (d.metadata or {}).get("source", "desconocido")}) for d, _ in results]
+    return build_prompt(docs, query, mode="search")
@@ -1,21 +1,283 @@
 from langchain_openai import ChatOpenAI
+from langchain_core.language_models.llms import LLM
 from app.utils import config
 from app.utils.logger import logger
-from typing import Dict, Any
+from app.utils.tokens import count_tokens
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+import openai
+import httpx
+import random
+import threading
+import time
+
+# Errores transitorios que vale la pena reintentar (429, timeouts, conexión y 5xx)
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """
+    Cubeta de tokens thread-safe: `capacity` unidades que se reponen a `capacity / period` por segundo.
+    `acquire` bloquea hasta que haya saldo y retorna los segundos esperados.
+    """
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        # Una solicitud más grande que la cubeta nunca cabría: se limita a la capacidad
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def adjust(self, delta: float) -> None:
+        """Corrige el saldo con el consumo real (delta > 0 descuenta, delta < 0 devuelve)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class LLMMetrics:
+    """Contadores del cliente LLM compartido, expuestos en /metrics/llm."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_total = 0.0
+        self.throttle_wait_total = 0.0
+        self._window: deque = deque()  # (ts, tokens) de los últimos 60 s
+
+    def start(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def success(self, latency: float, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.successes += 1
+            self.latency_total += latency
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self._window.append((time.time(), prompt_tokens + completion_tokens))
+
+    def retry(self, error: Exception) -> None:
+        with self._lock:
+            self.retries += 1
+            if isinstance(error, openai.RateLimitError):
+                self.rate_limited += 1
+            elif isinstance(error, openai.APITimeoutError):
+                self.timeouts += 1
+
+    def failure(self, error: Exception) -> None:
+        with self._lock:
+            self.failures += 1
+            if isinstance(error, openai.RateLimitError):
+                self.rate_limited += 1
+            elif isinstance(error, openai.APITimeoutError):
+                self.timeouts += 1
+
+    def throttled(self, seconds: float) -> None:
+        with self._lock:
+            self.throttle_wait_total += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            cutoff = time.time() - 60
+            while self._window and self._window[0][0] < cutoff:
+                self._window.popleft()
+            return {
+                "requests": self.requests,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "timeouts": self.timeouts,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "avg_latency_s": round(self.latency_total / self.successes, 3) if self.successes else None,
+                "throttle_wait_s": round(self.throttle_wait_total, 3),
+                "last_minute": {"requests": len(self._window), "tokens": sum(t for _, t in self._window)},
+                "limits": {
+                    "max_concurrency": config.LLM_MAX_CONCURRENCY,
+                    "rpm": config.LLM_RPM,
+                    "tpm": config.LLM_TPM,
+                },
+                "uptime_s": round(time.time() - self.started_at, 1),
+            }
+
+
+# Estado compartido por todo el proceso: todas las instancias de Agent pasan por aquí
+metrics = LLMMetrics()
+_semaphore = threading.BoundedSemaphore(config.LLM_MAX_CONCURRENCY)
+_rpm_bucket = TokenBucket(config.LLM_RPM) if config.LLM_RPM > 0 else None
+_tpm_bucket = TokenBucket(config.LLM_TPM) if config.LLM_TPM > 0 else None
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """Cliente HTTP con keep-alive compartido por todos los modelos de chat del proceso."""
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+        ),
+        timeout=config.LLM_TIMEOUT,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name: str, temperature: float, max_completion_tokens: int) -> ChatOpenAI:
+    """
+    ChatOpenAI cacheado por configuración. Los reintentos del SDK se desactivan (max_retries=0):
+    los maneja `Agent.generate` para respetar el semáforo y los límites de tasa. Por eso no se debe
+    usar directamente: las cadenas de LangChain reciben `ThrottledLLM`.
+    """
+    return ChatOpenAI(
+        model=model_name,
+        temperature=temperature,
+        max_completion_tokens=max_completion_tokens,
+        timeout=config.LLM_TIMEOUT,
+        max_retries=0,
+        http_client=get_http_client(),
+    )
+
+
+def _retry_delay(attempt: int, error: Exception) -> float:
+    """Backoff exponencial con jitter completo; respeta Retry-After si el proveedor lo envía."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), config.LLM_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(config.LLM_RETRY_MAX_DELAY, config.LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
 
 class Agent:
     def __init__(self, model_name: str = config.LLM_MODEL, temperature: float = None, max_completion_tokens: int = None):
         self.model_name = model_name
         self.temperature = config.LLM_TEMPERATURE if temperature is None else temperature
         self.max_completion_tokens = config.LLM_MAX_COMPLETION_TOKENS if max_completion_tokens is None else max_completion_tokens
-        self._client = ChatOpenAI(model=self.model_name, temperature=self.temperature, max_completion_tokens=self.max_completion_tokens)
+        self._client = get_chat_model(self.model_name, self.temperature, self.max_completion_tokens)
+
+    def _throttle(self, estimated_tokens: int) -> None:
+        waited = 0.0
+        if _rpm_bucket:
+            waited += _rpm_bucket.acquire(1)
+        if _tpm_bucket:
+            waited += _tpm_bucket.acquire(estimated_tokens)
+        if waited:
+            metrics.throttled(waited)
+            logger.debug(f"LLM: esperando {waited:.2f}s por límite de tasa")
+
+    def _invoke(self, prompt: str):
+        """Una llamada al modelo bajo el semáforo del proceso y los límites RPM/TPM."""
+        estimated = count_tokens(prompt) + (self.max_completion_tokens or 0)
+        with _semaphore:
+            self._throttle(estimated)
+            metrics.start()
+            t0 = time.perf_counter()
+            try:
+                response = self._client.invoke(prompt)
+            finally:
+                metrics.end()
+        usage = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0)
+        completion_tokens = usage.get("output_tokens", 0)
+        if _tpm_bucket and usage:
+            _tpm_bucket.adjust(prompt_tokens + completion_tokens - estimated)
+        metrics.success(time.perf_counter() - t0, prompt_tokens, completion_tokens)
+        return response
 
     def generate(self, prompt: str, **kwargs) -> str:
+        attempt = 0
+        while True:
+            try:
+                response = self._invoke(prompt)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt >= config.LLM_MAX_RETRIES:
+                    metrics.failure(e)
+                    logger.error(f"LLM: {type(e).__name__} tras {attempt} reintentos: {e}")
+                    raise
+                delay = _retry_delay(attempt, e)
+                metrics.retry(e)
+                logger.warning(f"LLM: {type(e).__name__}, reintento {attempt + 1}/{config.LLM_MAX_RETRIES} en {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+            except Exception as e:
+                metrics.failure(e)
+                raise
 
-        response = self._client.invoke(prompt)
         if isinstance(response, str):
             return response
         try:
             return response.content  # type: ignore
         except Exception:
-            return str(response)
\ No newline at end of file
+            return str(response)
+
+
+class ThrottledLLM(LLM):
+    """
+    Adaptador LangChain sobre `Agent`: cadenas y agentes (RetrievalQA, ReAct) pasan por el mismo
+    semáforo, límites RPM/TPM y reintentos que `Agent.generate` en vez de usar el ChatOpenAI crudo.
+    """
+
+    agent: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "ragent-throttled"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        text = self.agent.generate(prompt)
+        # Las secuencias de parada (p. ej. "\nObservation:" en ReAct) se aplican sobre la respuesta
+        cuts = [i for i in (text.find(s) for s in stop or []) if i != -1]
+        return text[:min(cuts)] if cuts else text
+
+
+@lru_cache(maxsize=1)
+def get_agent() -> Agent:
+    """Agent por defecto compartido por el proceso (modelo, temperatura y límites de config)."""
+    return Agent()
@@ -2,13 +2,13 @@ from typing import Dict, Any, List, Tuple, Optional
 from langchain.agents import initialize_agent, Tool
 from langchain.chains import RetrievalQA
 from app.rag.retriever import get_relevant_docs, get_vectorstore
-from app.models.llm import Agent
+from app.models.llm import ThrottledLLM, get_agent
 from app.utils import config
 from app.utils.logger import logger
-import tiktoken
+from app.utils.tokens import get_encoding
 import json
 
-llm = Agent()
+llm = get_agent()
 
 
 def _doc_to_source(doc) -> Dict[str, Any]:
@@ -26,7 +26,8 @@ def create_react_agent(k: int = None, chain_type: str = "stuff", max_iterations:
     vectordb = get_vectorstore()
     retriever = vectordb.as_retriever(search_kwargs={"k": k or config.DEFAULT_TOP_K})
 
-    llm_client = llm._client
+    # Mismo semáforo, límites de tasa y reintentos que el resto de las llamadas al LLM
+    llm_client = ThrottledLLM(agent=llm)
     retrieval_qa = RetrievalQA.from_chain_type(llm=llm_client, retriever=retriever, chain_type=chain_type)
 
     METRICS = getattr(create_react_agent, "METRICS", {"total_queries": 0, "total_tool_calls": 0})
@@ -35,7 +36,7 @@ def create_react_agent(k: int = None, chain_type: str = "stuff", max_iterations:
     TOOL_STATE = {"calls": 0, "tokens": 0}
     create_react_agent.TOOL_STATE = TOOL_STATE
 
-    encoding = tiktoken.encoding_for_model(config.LLM_MODEL)
+    encoding = get_encoding()
 
     def estimate_tokens(text: str) -> int:
         if not text:
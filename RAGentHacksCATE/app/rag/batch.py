@@ -0,0 +1,71 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+from app.rag.qa import answer_from_docs
+from app.rag.retriever import get_relevant_docs_batch
+from app.utils import config
+from app.utils.logger import logger
+
+
+def sources_from_docs(docs: List[Any]) -> List[str]:
+    """Nombres de archivo fuente deduplicados, en orden de aparición."""
+    seen = []
+    for d in docs or []:
+        src = (getattr(d, "metadata", None) or {}).get("source", "desconocido")
+        if src not in seen:
+            seen.append(src)
+    return seen
+
+
+def answer_batch(
+    questions: List[str],
+    collection_name: Optional[str] = None,
+    k: Optional[int] = None,
+    mode: str = "qa",
+    files: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    context_tokens: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Responde muchas preguntas sobre una misma colección:
+    - recuperación compartida (un embedding por lote, una consulta a Chroma, documentos deduplicados)
+    - llamadas al LLM con paralelismo acotado (BATCH_MAX_PARALLEL)
+    Entrega cada resultado apenas termina (no en el orden de entrada); `index` indica la pregunta.
+    Las preguntas se envían al pool en una ventana de `max_workers`: si el generador se cierra
+    (el cliente se desconecta) no se lanzan más llamadas al LLM.
+    """
+    max_workers = max_workers or config.BATCH_MAX_PARALLEL
+    per_query, stats = get_relevant_docs_batch(questions, k=k, collection_name=collection_name)
+    logger.info(f"Batch de {len(questions)} preguntas en '{collection_name}' con {max_workers} llamadas en paralelo ({stats})")
+
+    def run(index: int) -> Dict[str, Any]:
+        res = answer_from_docs(questions[index], per_query[index], mode=mode, files=files, context_tokens=context_tokens)
+        return {
+            "index": index,
+            "prompt": questions[index],
+            "answer": res["answer"],
+            "sources": sources_from_docs(res["source_documents"]),
+            "tokens_used": res["tokens_used"],
+        }
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    pending: Dict[Any, int] = {}
+    next_index = 0
+    try:
+        while next_index < len(questions) or pending:
+            while next_index < len(questions) and len(pending) < max_workers:
+                pending[pool.submit(run, next_index)] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                index = pending.pop(fut)
+                try:
+                    item = fut.result()
+                except Exception as e:
+                    logger.error(f"Error en pregunta {index} del batch: {e}")
+                    item = {"index": index, "prompt": questions[index], "error": str(e)}
+                yield item
+    finally:
+        # Cierre anticipado (GeneratorExit): las llamadas en curso terminan, las demás no se lanzan
+        pool.shutdown(wait=False, cancel_futures=True)
+        if next_index < len(questions) or pending:
+            logger.info(f"Batch interrumpido: {len(questions) - next_index + len(pending)} preguntas sin completar")
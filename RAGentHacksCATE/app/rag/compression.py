@@ -0,0 +1,200 @@
+from app.data.chunking import source_key
+from app.models.embeddings import EmbeddingClient
+from app.rag.retriever import cosine_similarity
+from app.utils import config
+from app.utils.logger import logger
+from app.utils.tokens import count_tokens
+from langchain_core.documents import Document
+from typing import Any, Dict, List, Optional, Set
+from math import log
+import unicodedata
+import re
+
+# Candidatos (por puntaje léxico) que pasan a MMR / re-scoring con embeddings
+MAX_CANDIDATES = 200
+
+# Tokens aproximados que agrega la cabecera de cita por pasaje
+HEADER_TOKENS = 15
+
+STOPWORDS = {
+    "de", "la", "que", "el", "en", "los", "del", "se", "las", "por", "un", "para", "con", "no", "una",
+    "su", "al", "lo", "como", "mas", "pero", "sus", "le", "ya", "o", "este", "si", "porque", "esta",
+    "entre", "cuando", "muy", "sin", "sobre", "tambien", "me", "hasta", "hay", "donde", "quien", "desde",
+    "todo", "nos", "durante", "todos", "uno", "les", "ni", "contra", "otros", "ese", "eso", "ante", "ellos",
+    "e", "esto", "antes", "algunos", "unos", "yo", "otro", "otras", "otra", "cual", "es", "son",
+    "y", "a", "the", "of", "and", "to", "in", "is",
+}
+
+
+def _terms(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return [t for t in re.findall(r"[a-z0-9]{2,}", text) if t not in STOPWORDS]
+
+
+def _page_offsets(meta: Dict[str, Any]) -> List[int]:
+    raw = meta.get("page_offsets")
+    if not raw:
+        return []
+    try:
+        return [int(x) for x in str(raw).split(",") if x != ""]
+    except ValueError:
+        return []
+
+
+def split_passages(doc: Document, doc_index: int, max_chars: int = None) -> List[Dict[str, Any]]:
+    """
+    Divide un documento en pasajes de ~max_chars respetando páginas (si hay `page_offsets`)
+    y saltos de línea. Cada pasaje conserva su página (1-indexada) para poder citarla.
+    """
+    max_chars = max_chars or config.COMPRESSION_PASSAGE_CHARS
+    text = doc.page_content or ""
+    meta = doc.metadata or {}
+    offsets = _page_offsets(meta)
+    if offsets:
+        bounds = offsets + [len(text) + 1]
+        spans = [(i + 1, bounds[i], min(bounds[i + 1] - 1, len(text))) for i in range(len(offsets))]
+    else:
+        spans = [(meta.get("page"), 0, len(text))]
+
+    passages = []
+    for page, start, end in spans:
+        buf_start = start
+        buf: List[str] = []
+        buf_len = 0
+        pos = start
+        for line in text[start:end].split("\n"):
+            # líneas muy largas (PDFs sin saltos) se cortan en trozos de max_chars
+            pieces = [line[j:j + max_chars] for j in range(0, len(line), max_chars)] or [""]
+            for piece in pieces:
+                if buf and buf_len + len(piece) > max_chars:
+                    passages.append({"doc_index": doc_index, "page": page, "start": buf_start, "text": "\n".join(buf)})
+                    buf, buf_len, buf_start = [], 0, pos
+                buf.append(piece)
+                buf_len += len(piece) + 1
+                pos += len(piece)
+            pos += 1
+        if any(b.strip() for b in buf):
+            passages.append({"doc_index": doc_index, "page": page, "start": buf_start, "text": "\n".join(buf)})
+    return [p for p in passages if p["text"].strip()]
+
+
+def _bm25_scores(query_terms: List[str], passages_terms: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    n = len(passages_terms)
+    if not n or not query_terms:
+        return [0.0] * n
+    avgdl = sum(len(t) for t in passages_terms) / n or 1.0
+    df: Dict[str, int] = {}
+    for terms in passages_terms:
+        for t in set(terms):
+            df[t] = df.get(t, 0) + 1
+    q = set(query_terms)
+    scores = []
+    for terms in passages_terms:
+        tf: Dict[str, int] = {}
+        for t in terms:
+            if t in q:
+                tf[t] = tf.get(t, 0) + 1
+        s = 0.0
+        for t, f in tf.items():
+            idf = log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            s += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * len(terms) / avgdl))
+        scores.append(s)
+    return scores
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _mmr_select(relevance: List[float], similarity, token_costs: List[int], token_target: int, lambda_mult: float) -> List[int]:
+    """MMR voraz: agrega el pasaje con mejor relevancia penalizada por redundancia hasta llenar el presupuesto."""
+    top = max(relevance) if relevance else 0.0
+    rel = [r / top for r in relevance] if top > 0 else list(relevance)
+    remaining = set(range(len(rel)))
+    redundancy = [0.0] * len(rel)
+    selected: List[int] = []
+    used = 0
+    while remaining:
+        best = max(remaining, key=lambda i: (lambda_mult * rel[i] - (1 - lambda_mult) * redundancy[i], -i))
+        remaining.discard(best)
+        if used + token_costs[best] > token_target:
+            if token_target - used < min((token_costs[i] for i in remaining), default=token_target + 1):
+                break
+            continue
+        selected.append(best)
+        used += token_costs[best]
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], similarity(i, best))
+    return selected
+
+
+def compress_context(
+    question: str,
+    docs: List[Document],
+    token_target: Optional[int] = None,
+    files_focus: Optional[List[str]] = None,
+    scorer: Optional[str] = None,
+) -> List[Document]:
+    """
+    Selecciona los pasajes más relevantes a la pregunta (BM25 o embeddings + MMR) bajo `token_target`
+    y devuelve un Document por (archivo, página) con metadata `source`/`page` para las citas.
+    """
+    if not docs:
+        return []
+    token_target = token_target or config.COMPRESSION_TOKEN_TARGET
+    scorer = (scorer or config.COMPRESSION_SCORER).lower()
+
+    if files_focus:
+        focus = set(source_key(f) for f in files_focus)
+        focused = [d for d in docs if source_key((d.metadata or {}).get("source", "")) in focus]
+        docs = focused or docs
+
+    passages: List[Dict[str, Any]] = []
+    for i, d in enumerate(docs):
+        passages.extend(split_passages(d, i))
+    if not passages:
+        return []
+
+    terms = [_terms(p["text"]) for p in passages]
+    relevance = _bm25_scores(_terms(question), terms)
+
+    # Acota candidatos por puntaje léxico (conservando el orden original ante empates)
+    order = sorted(range(len(passages)), key=lambda i: (-relevance[i], i))[:MAX_CANDIDATES]
+    passages = [passages[i] for i in order]
+    terms = [terms[i] for i in order]
+    relevance = [relevance[i] for i in order]
+    term_sets = [set(t) for t in terms]
+
+    if scorer == "embedding":
+        emb_client = EmbeddingClient()
+        vectors = emb_client.embed([p["text"] for p in passages])
+        q_vec = emb_client.embed(question)
+        relevance = [cosine_similarity(q_vec, v) for v in vectors]
+        similarity = lambda i, j: cosine_similarity(vectors[i], vectors[j])
+    else:
+        similarity = lambda i, j: _jaccard(term_sets[i], term_sets[j])
+
+    costs = [count_tokens(p["text"]) + HEADER_TOKENS for p in passages]
+    chosen = _mmr_select(relevance, similarity, costs, token_target, config.COMPRESSION_MMR_LAMBDA)
+    chosen_passages = sorted((passages[i] for i in chosen), key=lambda p: (p["doc_index"], p["start"]))
+
+    # Agrupa por documento y página, en orden de recuperación y de lectura
+    grouped: Dict[tuple, List[str]] = {}
+    for p in chosen_passages:
+        grouped.setdefault((p["doc_index"], p["page"]), []).append(p["text"])
+    out = []
+    for (doc_index, page), texts in grouped.items():
+        meta = docs[doc_index].metadata or {}
+        md = {"source": meta.get("source", "desconocido"), "chunk": meta.get("chunk", doc_index)}
+        if page is not None:
+            md["page"] = page
+        out.append(Document(page_content="\n[...]\n".join(texts), metadata=md))
+
+    logger.info(
+        f"Contexto comprimido: {len(chosen_passages)} pasajes de {len(docs)} documentos "
+        f"(~{sum(costs[i] for i in chosen)} tokens, objetivo {token_target}, scorer={scorer})"
+    )
+    return out
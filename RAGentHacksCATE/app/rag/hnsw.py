@@ -0,0 +1,141 @@
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.rag.retriever import get_chroma_client, hnsw_metadata, mark_collection_updated
+from app.utils.logger import logger
+
+# Registros leídos/escritos por llamada a Chroma al copiar una colección
+COPY_BATCH_SIZE = 500
+
+
+def load_collection(collection) -> Dict[str, Any]:
+    """Lee ids, embeddings, documentos y metadata de una colección, por páginas."""
+    total = collection.count()
+    out = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+    for offset in range(0, total, COPY_BATCH_SIZE):
+        page = collection.get(
+            limit=COPY_BATCH_SIZE,
+            offset=offset,
+            include=["embeddings", "documents", "metadatas"],
+        )
+        out["ids"].extend(page["ids"])
+        out["embeddings"].extend(page["embeddings"])
+        out["documents"].extend(page["documents"])
+        out["metadatas"].extend(page["metadatas"])
+    return out
+
+
+def brute_force(queries: np.ndarray, vectors: np.ndarray, k: int, space: str) -> np.ndarray:
+    """Índices de los k vecinos exactos de cada consulta, con la misma distancia que usa Chroma."""
+    if space == "cosine":
+        qn = queries / np.linalg.norm(queries, axis=1, keepdims=True).clip(min=1e-12)
+        vn = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+        dist = 1.0 - qn @ vn.T
+    elif space == "ip":
+        dist = 1.0 - queries @ vectors.T
+    else:
+        dist = (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+    return np.argsort(dist, axis=1)[:, :k]
+
+
+def evaluate(collection, queries: np.ndarray, truth: List[set], k: int) -> Dict[str, float]:
+    """recall@k contra la búsqueda exacta y latencia por consulta (p50/p95, ms) de una colección."""
+    latencies = []
+    hits = 0
+    for q, expected in zip(queries, truth):
+        t0 = time.perf_counter()
+        res = collection.query(query_embeddings=[q.tolist()], n_results=k, include=[])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        hits += len(expected & set(res["ids"][0]))
+    return {
+        "recall": hits / (len(truth) * k) if truth else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+    }
+
+
+def reindex_collection(
+    name: str,
+    space: Optional[str] = None,
+    m: Optional[int] = None,
+    construction_ef: Optional[int] = None,
+    search_ef: Optional[int] = None,
+    k: int = 10,
+    sample: int = 200,
+    swap: bool = True,
+    keep_old: bool = False,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Reconstruye `name` con nuevos parámetros HNSW a partir de los embeddings guardados (sin llamar
+    al API de embeddings) y compara recall@k y latencia de la colección actual y la nueva contra
+    búsqueda exacta sobre una muestra de consultas (los propios vectores guardados).
+    Con `swap`, la nueva colección reemplaza a la original.
+    """
+    client = get_chroma_client()
+    source = client.get_collection(name=name)
+    current_meta = dict(source.metadata or {})
+    current_space = current_meta.get("hnsw:space", "l2")
+    new_meta = {key: value for key, value in current_meta.items() if not key.startswith("hnsw:")}
+    new_meta.update(hnsw_metadata(space=space or current_space, m=m, construction_ef=construction_ef, search_ef=search_ef))
+
+    t0 = time.perf_counter()
+    data = load_collection(source)
+    n = len(data["ids"])
+    if not n:
+        raise ValueError(f"La colección '{name}' está vacía")
+    logger.info(f"Leídos {n} registros de '{name}' en {time.perf_counter() - t0:.1f}s")
+
+    temp_name = f"{name}__reindex"
+    try:
+        client.delete_collection(temp_name)
+    except Exception:
+        pass
+    target = client.create_collection(name=temp_name, metadata=new_meta)
+    t0 = time.perf_counter()
+    for i in range(0, n, COPY_BATCH_SIZE):
+        target.add(
+            ids=data["ids"][i:i + COPY_BATCH_SIZE],
+            embeddings=data["embeddings"][i:i + COPY_BATCH_SIZE],
+            documents=data["documents"][i:i + COPY_BATCH_SIZE],
+            metadatas=data["metadatas"][i:i + COPY_BATCH_SIZE],
+        )
+    build_s = time.perf_counter() - t0
+    logger.info(f"Índice '{temp_name}' construido en {build_s:.1f}s con {new_meta}")
+
+    # Muestra de consultas y vecinos exactos (cada colección con su propia distancia)
+    vectors = np.asarray(data["embeddings"], dtype=np.float32)
+    k = min(k, n)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(n, size=min(sample, n), replace=False)
+    queries = vectors[picks]
+    ids = np.asarray(data["ids"])
+
+    def truth_for(space_name: str) -> List[set]:
+        return [set(ids[row]) for row in brute_force(queries, vectors, k, space_name)]
+
+    report = {
+        "collection": name,
+        "records": n,
+        "k": k,
+        "queries": len(picks),
+        "build_s": round(build_s, 2),
+        "current": {"params": {key: v for key, v in current_meta.items() if key.startswith("hnsw:")}, **evaluate(source, queries, truth_for(current_space), k)},
+        "new": {"params": {key: v for key, v in new_meta.items() if key.startswith("hnsw:")}, **evaluate(target, queries, truth_for(new_meta["hnsw:space"]), k)},
+        "swapped": False,
+    }
+
+    if swap:
+        old_name = f"{name}__old_{int(time.time())}"
+        source.modify(name=old_name)
+        target.modify(name=name)
+        if not keep_old:
+            client.delete_collection(old_name)
+        else:
+            report["old_collection"] = old_name
+        mark_collection_updated(name)
+        report["swapped"] = True
+        logger.info(f"Colección '{name}' reemplazada por el nuevo índice")
+    else:
+        client.delete_collection(temp_name)
+    return report
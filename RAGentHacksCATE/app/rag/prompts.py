@@ -0,0 +1,108 @@
+from functools import lru_cache
+from typing import Dict
+from app.utils.tokens import count_tokens
+
+MODES = ("qa", "search", "flashcards")
+
+# Prefijo compartido por todos los modos. Debe mantenerse byte a byte estable: el proveedor
+# cachea prompts por prefijo, así que cualquier cambio aquí invalida la caché de todos los modos.
+SHARED_PREFIX = (
+    "Eres un asistente académico que SOLO puede usar el contexto recuperado desde PDFs. "
+    "Si la información no está en el contexto, responde exactamente: 'No disponible en el contexto'. No inventes. "
+    "Si te pide información acerca del temario en distintos formatos, por ejemplo: resúmenes, preguntas de examen y cualquier cosa relacionado al contenido de los archivos. Devuelve la información solicitada basándote SOLO en el contexto proporcionado. "
+    "Cita siempre las fuentes como [PDF: <nombre>, pág <n>]. Español claro y directo. "
+    "Devuelve SIEMPRE un JSON válido y NADA más (sin texto fuera del objeto JSON). "
+    "Usa solo términos presentes en los PDFs. "
+    "Si no hay información suficiente, devuelve: "
+    "{\"error\":\"insufficient_context\",\"message\":\"string\",\"suggestions\":[\"string\"]}"
+)
+
+MODE_SCHEMAS: Dict[str, str] = {
+    "qa": (
+        "{"
+        "\"answer\":\"string (respuesta completa con citas inline [PDF: nombre, pág X])\","
+        "\"confidence\":\"high|medium|low\","
+        "\"sources\":[{\"file\":\"string\",\"page\":number}],"
+        "\"limitations\":\"string|null\","
+        "\"followups\":[\"string\"]"
+        "}"
+    ),
+    "search": (
+        "{"
+        "\"matching_files\":[{"
+        "\"file\":\"string (nombre del archivo)\","
+        "\"relevance\":\"high|medium|low\","
+        "\"reason\":\"string (por qué es relevante)\","
+        "\"matching_topics\":[\"string\"],"
+        "\"sample_content\":\"string (fragmento del contenido relevante)\""
+        "}],"
+        "\"total_matches\":number,"
+        "\"search_summary\":\"string\","
+        "\"no_matches_reason\":\"string|null\""
+        "}"
+    ),
+    "flashcards": (
+        "{"
+        "\"flashcards\":[{"
+        "\"id\":number,"
+        "\"question\":\"string\","
+        "\"answer\":\"string\","
+        "\"source\":{\"file\":\"string\",\"page\":number},"
+        "\"difficulty\":\"easy|medium|hard\","
+        "\"topic\":\"string\""
+        "}],"
+        "\"total_generated\":number,"
+        "\"topics_covered\":[\"string\"]"
+        "}"
+    ),
+}
+
+MODE_INSTRUCTIONS: Dict[str, str] = {
+    "qa": (
+        "Responde la pregunta del usuario de forma conversacional, incluye citas inline, sugiere followups relevantes. "
+        "Si hay poca evidencia o ambigüedad, rellena 'limitations'."
+    ),
+    "search": (
+        "NO respondas preguntas, solo identifica qué archivos contienen información relacionada con la consulta, "
+        "ordena por relevancia, explica por qué cada archivo es relevante. "
+        "Si hay poca evidencia o ambigüedad, rellena 'no_matches_reason'."
+    ),
+    "flashcards": (
+        "Genera 5-15 tarjetas de estudio, varía la dificultad, incluye preguntas conceptuales no solo definiciones."
+    ),
+}
+
+
+def normalize_mode(mode: str) -> str:
+    return mode if mode in MODES else "qa"
+
+
+@lru_cache(maxsize=None)
+def system_prompt(mode: str) -> str:
+    """
+    Parte estable del prompt para un modo: prefijo compartido + esquema e instrucciones del modo
+    + bloque de salida estricta. Va antes del contexto para maximizar el prefijo cacheable.
+    """
+    mode = normalize_mode(mode)
+    return (
+        f"{SHARED_PREFIX}\n\n"
+        f"Modo: {mode}\n"
+        f"Esquema de salida obligatorio: {MODE_SCHEMAS[mode]}\n"
+        f"Instrucciones: {MODE_INSTRUCTIONS[mode]}\n\n"
+        "SALIDA ESTRICTA:\n"
+        f"- Devuelve SOLO un objeto JSON válido para mode='{mode}'.\n"
+        "- No incluyas comentario, markdown ni texto fuera del JSON.\n"
+        "- Si la información no está en el contexto, pon 'No disponible en el contexto' en el campo adecuado.\n"
+    )
+
+
+@lru_cache(maxsize=None)
+def template_tokens(mode: str) -> int:
+    """Tokens que cuesta la parte fija del prompt de un modo."""
+    return count_tokens(system_prompt(mode))
+
+
+def template_token_report() -> Dict[str, Dict[str, int]]:
+    """Costo en tokens por modo: prefijo compartido (cacheable entre modos) y total de la plantilla."""
+    shared = count_tokens(SHARED_PREFIX)
+    return {mode: {"shared_prefix": shared, "template": template_tokens(mode)} for mode in MODES}
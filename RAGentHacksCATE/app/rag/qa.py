@@ -1,67 +1,26 @@
 from app.rag.retriever import get_relevant_docs, get_vectorstore
-from app.models.llm import Agent
+from app.rag.compression import compress_context
+from app.rag.prompts import system_prompt, normalize_mode, template_tokens
+from app.data.chunking import source_key
+from app.models.llm import get_agent
 from app.utils import config
 from app.utils.logger import logger
+from app.utils.tokens import get_encoding, count_tokens
 from typing import Dict, Any, Tuple, List, Optional
-import tiktoken
-
-llm = Agent()
-
-SYSTEM_INSTRUCTIONS = (
-    "Eres un asistente académico que SOLO puede usar el contexto recuperado desde PDFs. "
-    "Si la información no está en el contexto, responde exactamente: 'No disponible en el contexto'. No inventes. "
-    "Si te pide información acerca del temario en distintos formatos, por ejemplo: resúmenes, preguntas de examen y cualquier cosa relacionado al contenido de los archivos. Devuelve la información solicitada basándote SOLO en el contexto proporcionado. "
-    "Cita siempre las fuentes como [PDF: <nombre>, pág <n>]. Español claro y directo. "
-    "Devuelve SIEMPRE un JSON válido y NADA más (sin texto fuera del objeto JSON). "
-    
-    "Modos soportados (input 'mode'): 'qa', 'search', 'flashcards'. "
-    
-    "Esquemas de salida obligatorios por modo: "
-    
-    "qa -> {"
-    "\"answer\":\"string (respuesta completa con citas inline [PDF: nombre, pág X])\","
-    "\"confidence\":\"high|medium|low\","
-    "\"sources\":[{\"file\":\"string\",\"page\":number}],"
-    "\"limitations\":\"string|null\","
-    "\"followups\":[\"string\"]"
-    "}; "
-    
-    "search -> {"
-    "\"matching_files\":[{"
-    "\"file\":\"string (nombre del archivo)\","
-    "\"relevance\":\"high|medium|low\","
-    "\"reason\":\"string (por qué es relevante)\","
-    "\"matching_topics\":[\"string\"],"
-    "\"sample_content\":\"string (fragmento del contenido relevante)\""
-    "}],"
-    "\"total_matches\":number,"
-    "\"search_summary\":\"string\","
-    "\"no_matches_reason\":\"string|null\""
-    "}; "
-    
-    "flashcards -> {"
-    "\"flashcards\":[{"
-    "\"id\":number,"
-    "\"question\":\"string\","
-    "\"answer\":\"string\","
-    "\"source\":{\"file\":\"string\",\"page\":number},"
-    "\"difficulty\":\"easy|medium|hard\","
-    "\"topic\":\"string\""
-    "}],"
-    "\"total_generated\":number,"
-    "\"topics_covered\":[\"string\"]"
-    "}; "
-    
-    "Instrucciones por modo: "
-    "qa: Responde la pregunta del usuario de forma conversacional, incluye citas inline, sugiere followups relevantes. "
-    "search: NO respondas preguntas, solo identifica qué archivos contienen información relacionada con la consulta, ordena por relevancia, explica por qué cada archivo es relevante. "
-    "flashcards: Genera 5-15 tarjetas de estudio, varía la dificultad, incluye preguntas conceptuales no solo definiciones. "
-    
-    "Reglas adicionales: usa solo términos presentes en los PDFs; si hay poca evidencia o ambigüedad, rellena 'limitations' (en qa) o 'no_matches_reason' (en search). "
-    
-    "Si no hay información suficiente, devuelve: "
-    "{\"error\":\"insufficient_context\",\"message\":\"string\",\"suggestions\":[\"string\"]}"
-)
+import json
+import re
+
+llm = get_agent()
+
+def parse_llm_json(text: str) -> Optional[Any]:
+    """Parsea la salida JSON del LLM tolerando cercos de markdown (```json ... ```). Retorna None si no es JSON."""
+    if not text:
+        return None
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        return json.loads(cleaned)
+    except Exception:
+        return None
 
 def _format_chunk_header(meta: dict, fallback_index: int) -> str:
     src = meta.get("source", "desconocido")
@@ -76,46 +35,46 @@ def build_prompt(
     question: str,
     mode: str = "qa",
     files_focus: Optional[List[str]] = None,
+    max_context_tokens: Optional[int] = None,
 ) -> str:
     """
     Construye un prompt que:
-    - Inyecta SYSTEM_INSTRUCTIONS
+    - Empieza con la plantilla estable del modo (prefijo compartido + esquema del modo), cacheable por el proveedor
     - Empaqueta el contexto troceado con cabeceras tipo cita
-    - Exige salida SOLO JSON según 'mode'
+    - Deja al final lo que cambia por solicitud (archivos a enfocar y pregunta)
+    `max_context_tokens` acota además el contexto (p. ej. en modo degradado).
     """
     max_model_tokens = config.MAX_MODEL_TOKENS
     reserved = config.RESERVED_RESPONSE_TOKENS
 
-    encoding = tiktoken.encoding_for_model(config.LLM_MODEL)
-
-    # Bloque de formato: fuerza salida JSON estricta según mode.
-    formatting = (
-        "SALIDA ESTRICTA:\n"
-        f"- Devuelve SOLO un objeto JSON válido para mode='{mode}'.\n"
-        "- No incluyas comentario, markdown ni texto fuera del JSON.\n"
-        "- Si la información no está en el contexto, pon 'No disponible en el contexto' en el campo adecuado.\n"
-    )
+    encoding = get_encoding()
+    mode = normalize_mode(mode)
+    template = system_prompt(mode)
 
     # Si se especifican files, filtra/prioriza documentos que provienen de esos nombres
     if files_focus:
-        focus_set = set(f.lower() for f in files_focus)
+        focus_set = set(source_key(f) for f in files_focus)
         prioritized = []
         others = []
         for d in context_docs:
             meta = d.metadata if hasattr(d, "metadata") else {}
-            src = (meta.get("source") or "").lower()
+            src = source_key(meta.get("source") or "")
             (prioritized if src in focus_set else others).append(d)
         context_docs = prioritized + others
 
     # Prepara el bloque de contexto ajustado al presupuesto de tokens
+    files_line = f"Archivos a enfocar: {files_focus}\n" if files_focus else ""
     base_suffix = (
-        f"\n\nModo:\n{mode}\n\n"
+        f"\n\n{files_line}"
+        f"Pregunta del usuario:\n{question}\n\n"
         "Genera la salida JSON ahora:"
     )
-    base_tokens = len(encoding.encode(SYSTEM_INSTRUCTIONS + formatting + base_suffix))
+    base_tokens = template_tokens(mode) + len(encoding.encode(base_suffix))
     allowed_tokens_for_context = max_model_tokens - reserved - base_tokens
     if allowed_tokens_for_context <= 0:
         allowed_tokens_for_context = max_model_tokens // 4
+    if max_context_tokens:
+        allowed_tokens_for_context = min(allowed_tokens_for_context, max_context_tokens)
 
     used_tokens = 0
     context_texts = []
@@ -152,38 +111,89 @@ def build_prompt(
 
     context_block = "\n\n---\n\n".join(context_texts) if context_texts else ""
 
-    files_line = f"Archivos a enfocar: {files_focus}\n" if files_focus else ""
     prompt = (
-        f"{SYSTEM_INSTRUCTIONS}\n\n"
-        f"{files_line}"
-        f"Contexto recuperado (fragmentos con citas integradas):\n{context_block}\n\n"
-        f"{formatting}\n"
-        f"Pregunta del usuario:\n{question}"
+        f"{template}\n"
+        f"Contexto recuperado (fragmentos con citas integradas):\n{context_block}"
         f"{base_suffix}"
     )
     return prompt
 
+def context_budget(mode: str, context_tokens: Optional[int] = None) -> Optional[int]:
+    """
+    Tokens de contexto para un modo (CONTEXT_BUDGET_QA / _SEARCH / _FLASHCARDS). Un `context_tokens`
+    explícito (modo degradado) solo puede achicarlo. None = sin presupuesto por modo.
+    """
+    budgets = {
+        "qa": config.CONTEXT_BUDGET_QA,
+        "search": config.CONTEXT_BUDGET_SEARCH,
+        "flashcards": config.CONTEXT_BUDGET_FLASHCARDS,
+    }
+    budget = budgets.get(normalize_mode(mode)) or None
+    if context_tokens and budget:
+        return min(context_tokens, budget)
+    return context_tokens or budget
+
+def rag_question(question: str, mode: str = "qa", difficulty: Optional[str] = None, topic: Optional[str] = None) -> str:
+    """Pregunta usada para recuperar y para el prompt: en flashcards agrega los filtros de dificultad/tema."""
+    if mode == "flashcards" and (difficulty or topic):
+        hints = []
+        if difficulty:
+            hints.append(f"dificultad '{difficulty}'")
+        if topic:
+            hints.append(f"tema '{topic}'")
+        question = f"{question}\nRestringe las flashcards a: {', '.join(hints)}."
+    return question
+
 def answer_with_rag(
     question: str,
     k: Optional[int] = None,
     collection_name: Optional[str] = None,
     mode: str = "qa",
     files: Optional[List[str]] = None,
+    difficulty: Optional[str] = None,
+    topic: Optional[str] = None,
+    context_tokens: Optional[int] = None,
+    docs: Optional[List[Any]] = None,
 ) -> Dict[str, Any]:
     """
     Ejecuta RAG con el modo deseado. El LLM debe devolver SIEMPRE JSON válido.
+    El número de documentos lo decide el top-k adaptativo y el contexto el presupuesto del modo;
+    `k` y `context_tokens` permiten achicarlos (modo degradado).
+    `docs` permite entregar documentos ya recuperados (p. ej. reutilizados del turno anterior).
     """
-    docs = get_relevant_docs(question, k=k, collection_name=collection_name)
-    prompt = build_prompt(docs, question, mode=mode, files_focus=files)
+    question = rag_question(question, mode, difficulty, topic)
+    if docs is None:
+        docs = get_relevant_docs(question, k=k, collection_name=collection_name)
+    return answer_from_docs(question, docs, mode=mode, files=files, context_tokens=context_tokens)
 
-    encoding = tiktoken.encoding_for_model(config.LLM_MODEL)
-    tokens_used = len(encoding.encode(prompt))
+def answer_from_docs(
+    question: str,
+    docs: List[Any],
+    mode: str = "qa",
+    files: Optional[List[str]] = None,
+    context_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Arma el prompt con documentos ya recuperados e invoca el LLM (compartido por consultas simples y por lotes)."""
+    context_tokens = context_budget(mode, context_tokens)
+    if config.COMPRESSION_ENABLED:
+        context_docs = compress_context(question, docs, token_target=context_tokens, files_focus=files)
+    else:
+        context_docs = docs
+    prompt = build_prompt(context_docs, question, mode=mode, files_focus=files, max_context_tokens=context_tokens)
+
+    tokens_used = count_tokens(prompt)
+    template_cost = template_tokens(mode)
+    logger.info(
+        f"Prompt mode={mode}: {tokens_used} tokens (plantilla {template_cost}, variable {tokens_used - template_cost}, "
+        f"{len(docs)} docs, presupuesto {context_tokens or 'sin límite'})"
+    )
 
     answer_json = llm.generate(prompt)  # Debe ser un string JSON válido
     return {
         "answer": answer_json,
         "source_documents": docs,
         "tokens_used": tokens_used,
+        "prompt_tokens": {"template": template_cost, "dynamic": tokens_used - template_cost, "total": tokens_used},
         "mode": mode,
         "files": files or []
     }
\ No newline at end of file
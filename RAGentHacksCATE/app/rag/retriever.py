@@ -1,82 +1,220 @@
 from app.models.embeddings import EmbeddingClient
 from app.utils import config
 from app.utils.logger import logger
-from typing import List, Optional
+from app.utils.shared_cache import bump_generation, collection_generation
+from typing import Dict, List, Optional, Tuple
 from langchain_core.documents import Document
 from langchain_chroma import Chroma
 from math import sqrt
+import chromadb
+
+# Vectorstores abiertos por colección, con la generación con que se abrieron
+# (evita reabrir Chroma y el índice HNSW en cada consulta)
+_vectorstores: Dict[str, Tuple[int, Chroma]] = {}
+_client = None
+
+def get_chroma_client():
+    """
+    Cliente Chroma del proceso. Con CHROMA_HOST se usa un servidor Chroma compartido (modo
+    multi-worker: un solo índice en memoria para todos los workers); si no, el directorio local.
+    """
+    global _client
+    if _client is None:
+        if config.CHROMA_HOST:
+            _client = chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT)
+            logger.info(f"Chroma en modo servidor: {config.CHROMA_HOST}:{config.CHROMA_PORT}")
+        else:
+            _client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
+    return _client
+
+def hnsw_metadata(space: str = None, m: int = None, construction_ef: int = None, search_ef: int = None) -> Dict[str, object]:
+    """
+    Parámetros HNSW para crear una colección. Chroma solo los aplica al crearla: para cambiarlos
+    en una colección existente hay que reconstruirla (`main.py reindex`).
+    """
+    return {
+        "hnsw:space": space or config.HNSW_SPACE,
+        "hnsw:M": m or config.HNSW_M,
+        "hnsw:construction_ef": construction_ef or config.HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": search_ef or config.HNSW_SEARCH_EF,
+    }
+
+def open_collection(name: str, client=None):
+    """
+    Colección de Chroma con su metadata tal como está guardada. Los parámetros HNSW de config solo
+    se usan al crearla: pasarlos al abrir una existente sobrescribiría los de `main.py reindex`.
+    """
+    client = client or get_chroma_client()
+    try:
+        return client.get_collection(name=name)
+    except Exception:
+        # No existe (la excepción cambia según la versión de chromadb)
+        return client.get_or_create_collection(name=name, metadata=hnsw_metadata())
 
 def get_vectorstore(collection_name: Optional[str] = None):
+    name = collection_name or config.DEFAULT_COLLECTION_NAME
+    generation = collection_generation(name)
+    cached = _vectorstores.get(name)
+    # Se reabre si otro proceso (p. ej. el ingest-worker) modificó la colección; -1 = caché no disponible
+    if cached is not None and (generation == -1 or cached[0] == generation):
+        return cached[1]
     emb = EmbeddingClient()
+    # La colección se abre antes: Chroma(...) sin collection_metadata no toca la metadata guardada
+    open_collection(name)
     vectordb = Chroma(
-        persist_directory=config.CHROMA_PERSIST_DIR,
+        client=get_chroma_client(),
         embedding_function=emb._client,
-        collection_name=collection_name or config.DEFAULT_COLLECTION_NAME,
+        collection_name=name,
     )
+    _vectorstores[name] = (generation, vectordb)
     return vectordb
 
-def get_relevant_docs(query: str, k: int = None, collection_name: Optional[str] = None) -> List[Document]:
-    k = k or config.DEFAULT_TOP_K
-    vectordb = get_vectorstore(collection_name=collection_name)
-    top_n = config.RERANK_TOP_K if config.RERANK_ENABLED else k
-    retriever = vectordb.as_retriever(search_kwargs={"k": top_n})
+def invalidate_vectorstore(collection_name: Optional[str] = None) -> None:
+    """Descarta el vectorstore cacheado de una colección en este proceso."""
+    _vectorstores.pop(collection_name or config.DEFAULT_COLLECTION_NAME, None)
+
+def mark_collection_updated(collection_name: str) -> None:
+    """
+    Tras una ingesta: sube la generación compartida de la colección y de sus perfiles, así todos
+    los workers (de este u otros procesos) reabren su vectorstore en la siguiente consulta.
+    """
+    for name in (collection_name, collection_name + config.PROFILE_COLLECTION_SUFFIX):
+        invalidate_vectorstore(name)
+        bump_generation(name)
+    logger.info(f"Cachés invalidadas para '{collection_name}'")
+
+def list_collection_names() -> List[str]:
+    """Nombres de las colecciones existentes en el directorio persistente de Chroma."""
+    client = get_chroma_client()
+    names = []
+    for col in client.list_collections() or []:
+        name = col if isinstance(col, str) else getattr(col, 'name', None)
+        if name:
+            names.append(name)
+    return names
+
+def distance_to_similarity(distance: float, space: str) -> float:
+    """Convierte una distancia de Chroma en similitud coseno (los embeddings de OpenAI vienen normalizados)."""
+    if space == "l2":
+        # Chroma entrega la distancia L2 al cuadrado: ||a - b||² = 2 - 2·cos
+        return 1.0 - distance / 2.0
+    return 1.0 - distance
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = sqrt(sum(x * x for x in a))
+    nb = sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
 
-    if hasattr(retriever, "invoke"):
-        candidates = retriever.invoke(query)
-    elif hasattr(retriever, "get_relevant_documents"):
-        candidates = retriever.get_relevant_documents(query)
-    else:
-        candidates = [d for d, _ in retriever.similarity_search_with_relevance_scores(query, k=top_n)]
+def adaptive_k(
+    scores: List[float],
+    min_k: int = None,
+    max_k: int = None,
+    min_score: float = None,
+    min_gap: float = None,
+) -> int:
+    """
+    Elige cuántos candidatos conservar a partir de sus similitudes (ordenadas de mayor a menor):
+    - descarta los que quedan bajo `min_score`
+    - corta en el mayor salto entre puntajes consecutivos (codo) si supera `min_gap`
+    - el resultado queda acotado a [min_k, max_k]
+    """
+    min_k = config.RETRIEVAL_MIN_K if min_k is None else min_k
+    max_k = config.RETRIEVAL_MAX_K if max_k is None else max_k
+    min_score = config.RETRIEVAL_MIN_SCORE if min_score is None else min_score
+    min_gap = config.RETRIEVAL_SCORE_GAP if min_gap is None else min_gap
 
-    if not candidates:
+    upper = min(len(scores), max_k)
+    n = sum(1 for s in scores[:upper] if s >= min_score)
+    # El codo se busca desde el primer salto: un único documento claramente mejor también cuenta
+    best_gap, cut = 0.0, n
+    for i in range(1, n):
+        gap = scores[i - 1] - scores[i]
+        if gap > best_gap:
+            best_gap, cut = gap, i
+    if best_gap >= min_gap:
+        n = cut
+    return max(min(min_k, upper), min(n, upper))
+
+def _retrieval_limit(k: Optional[int]) -> int:
+    """Candidatos a pedir a Chroma: RETRIEVAL_MAX_K (con `k` como tope) o `k`/DEFAULT_TOP_K sin top-k adaptativo."""
+    if config.ADAPTIVE_TOP_K:
+        return min(k, config.RETRIEVAL_MAX_K) if k else config.RETRIEVAL_MAX_K
+    return k or config.DEFAULT_TOP_K
+
+def _select_docs(docs: List[Document], distances: List[float], space: str, max_k: int, query: str) -> List[Document]:
+    """Aplica el top-k adaptativo (si está activo) a candidatos ya ordenados por distancia."""
+    if not config.ADAPTIVE_TOP_K:
+        logger.info(f"Returning top {len(docs)} docs for query: {query}")
+        return docs
+    scores = [distance_to_similarity(d, space) for d in distances]
+    n = adaptive_k(scores, max_k=max_k)
+    logger.info(
+        f"Adaptive top-k: {n}/{len(docs)} docs (scores {', '.join(f'{s:.3f}' for s in scores[:n + 1])}) for query: {query}"
+    )
+    return docs[:n]
+
+def get_relevant_docs(
+    query: str,
+    k: int = None,
+    collection_name: Optional[str] = None,
+    query_embedding: Optional[List[float]] = None,
+) -> List[Document]:
+    """
+    Recupera documentos para `query` con una sola consulta a Chroma (embedding de la consulta + distancias).
+    Si se entrega `query_embedding` no se vuelve a embeber la consulta.
+    Con ADAPTIVE_TOP_K el número de documentos se decide por la distribución de similitudes
+    (`adaptive_k`); `k`, si se indica, actúa como tope (p. ej. en modo degradado). Sin ADAPTIVE_TOP_K
+    se devuelven los `k` (o DEFAULT_TOP_K) más cercanos.
+    """
+    max_k = _retrieval_limit(k)
+    vectordb = get_vectorstore(collection_name=collection_name)
+    collection = vectordb._collection
+    q_emb = query_embedding if query_embedding is not None else EmbeddingClient().embed(query)
+    res = collection.query(query_embeddings=[q_emb], n_results=max_k, include=["documents", "metadatas", "distances"])
+
+    ids = (res.get("ids") or [[]])[0]
+    if not ids:
         logger.info(f"No documents retrieved for query: {query}")
         return []
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    docs = [
+        Document(page_content=text or "", metadata=md or {}, id=_id)
+        for _id, text, md in zip(ids, res["documents"][0], res["metadatas"][0])
+    ]
+    return _select_docs(docs, res["distances"][0], space, max_k, query)
+
+def get_relevant_docs_batch(queries: List[str], k: int = None, collection_name: Optional[str] = None) -> Tuple[List[List[Document]], Dict[str, int]]:
+    """
+    Recuperación para muchas consultas de una vez: un solo `embed_documents` y una sola
+    consulta a Chroma con todos los vectores. Los documentos compartidos entre consultas
+    se deduplican por id (misma instancia de Document). Cada consulta pasa por el mismo
+    top-k adaptativo que `get_relevant_docs`.
+    Retorna (documentos por consulta, estadísticas).
+    """
+    max_k = _retrieval_limit(k)
+    if not queries:
+        return [], {"queries": 0, "unique_docs": 0, "total_hits": 0}
+    vectordb = get_vectorstore(collection_name=collection_name)
+    collection = vectordb._collection
+    vectors = EmbeddingClient().embed(list(queries))
+    res = collection.query(query_embeddings=vectors, n_results=max_k, include=["documents", "metadatas", "distances"])
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
 
-    if not config.RERANK_ENABLED or k >= top_n:
-        selected = candidates[:k]
-        logger.info(f"Returning top {len(selected)} candidates without rerank for query: {query}")
-        return selected
-
-    scored = []
-
-    if len(candidates) > 0 and isinstance(candidates[0], tuple) and len(candidates[0]) == 2:
-        for doc, score in candidates:
-            scored.append((score, doc))
-    else:
-        emb_client = EmbeddingClient()
-        q_emb = emb_client.embed([query])
-        if isinstance(q_emb, list) and len(q_emb) == 1:
-            q_emb = q_emb[0]
-
-        collection = getattr(vectordb, '_collection', None) or getattr(vectordb, 'client', None)
-
-        for doc in candidates:
-            meta = getattr(doc, 'metadata', {}) or {}
-            d_emb = None
-
-            if meta.get('embedding'):
-                d_emb = meta.get('embedding')
-
-            if d_emb is None:
-                doc_id = meta.get('id') or meta.get('source') or None
-                if collection is not None and hasattr(collection, 'get'):
-                    resp = collection.get(ids=[doc_id], include=['embeddings', 'metadatas'])
-                    if resp and 'embeddings' in resp and len(resp['embeddings']) > 0:
-                        d_emb = resp['embeddings'][0]
-
-            if d_emb is None:
-                doc_text = getattr(doc, 'page_content', '')
-                d_emb = emb_client.embed([doc_text])
-                if isinstance(d_emb, list) and len(d_emb) == 1:
-                    d_emb = d_emb[0]
-
-            dot = sum(a * b for a, b in zip(q_emb, d_emb))
-            norm_q = sqrt(sum(a * a for a in q_emb))
-            norm_d = sqrt(sum(a * a for a in d_emb))
-            score = dot / (norm_q * norm_d) if norm_q and norm_d else 0.0
-            scored.append((score, doc))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    selected = [doc for _, doc in scored[:k]]
-    logger.info(f"Reranked and returning top {len(selected)} docs for query: {query}")
-    return selected
+    shared: Dict[str, Document] = {}
+    per_query: List[List[Document]] = []
+    total_hits = 0
+    rows = zip(queries, res.get("ids") or [], res.get("documents") or [], res.get("metadatas") or [], res.get("distances") or [])
+    for query, ids, texts, metas, distances in rows:
+        candidates = [
+            shared.get(_id) or Document(page_content=text or "", metadata=md or {}, id=_id)
+            for _id, text, md in zip(ids, texts, metas)
+        ]
+        docs = _select_docs(candidates, distances, space, max_k, query)
+        for d in docs:
+            shared.setdefault(d.id, d)
+        total_hits += len(docs)
+        per_query.append(docs)
+    stats = {"queries": len(queries), "unique_docs": len(shared), "total_hits": total_hits}
+    logger.info(f"Batch retrieval: {stats['queries']} consultas, {stats['total_hits']} resultados, {stats['unique_docs']} documentos únicos")
+    return per_query, stats
@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+import chromadb
+import numpy as np
+from app.rag.hnsw import COPY_BATCH_SIZE, load_collection
+from app.rag.retriever import get_chroma_client, mark_collection_updated
+from app.utils import config
+from app.utils.logger import logger
+
+SNAPSHOT_FORMAT_VERSION = 1
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.json.gz"
+MANIFEST_FILE = "manifest.json"
+
+
+def _sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def export_collection(name: str, out_dir: str, persist_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Escribe una colección en `out_dir/<name>/`:
+    - embeddings.npy: matriz float32 (n × dim)
+    - records.json.gz: columnas ids / documents / metadatas, en el mismo orden que los embeddings
+    - manifest.json: conteo, dimensión, modelo de embeddings, metadata de la colección (HNSW) y sha256 de cada archivo
+    """
+    client = chromadb.PersistentClient(path=persist_dir) if persist_dir else get_chroma_client()
+    collection = client.get_collection(name=name)
+    data = load_collection(collection)
+    target = os.path.join(out_dir, name)
+    os.makedirs(target, exist_ok=True)
+
+    embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+    np.save(os.path.join(target, EMBEDDINGS_FILE), embeddings)
+    with gzip.open(os.path.join(target, RECORDS_FILE), "wt", encoding="utf-8") as f:
+        json.dump({"ids": data["ids"], "documents": data["documents"], "metadatas": data["metadatas"]}, f, ensure_ascii=False)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection": name,
+        "count": len(data["ids"]),
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "embedding_model": config.EMBEDDING_MODEL,
+        "collection_metadata": dict(collection.metadata or {}),
+        "created_at": time.time(),
+        "checksums": {fname: _sha256(os.path.join(target, fname)) for fname in (EMBEDDINGS_FILE, RECORDS_FILE)},
+    }
+    with open(os.path.join(target, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"Snapshot de '{name}' escrito en {target}: {manifest['count']} registros, dim {manifest['dim']}")
+    return manifest
+
+
+def list_snapshots(snapshot_dir: str) -> List[str]:
+    """Subdirectorios de `snapshot_dir` que contienen un manifest (una colección cada uno)."""
+    return sorted(
+        d for d in os.listdir(snapshot_dir)
+        if os.path.isfile(os.path.join(snapshot_dir, d, MANIFEST_FILE))
+    )
+
+
+def import_collection(
+    snapshot_path: str,
+    persist_dir: Optional[str] = None,
+    name: Optional[str] = None,
+    replace: bool = False,
+    allow_model_mismatch: bool = False,
+) -> Dict[str, Any]:
+    """
+    Carga un snapshot en `persist_dir` sin llamar al API de embeddings. Verifica checksums y que el
+    modelo de embeddings coincida con EMBEDDING_MODEL (las consultas se embeben con ese modelo).
+    """
+    with open(os.path.join(snapshot_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Versión de snapshot no soportada: {manifest.get('format_version')}")
+    for fname, expected in manifest["checksums"].items():
+        actual = _sha256(os.path.join(snapshot_path, fname))
+        if actual != expected:
+            raise ValueError(f"Checksum inválido para {fname} en {snapshot_path}")
+    if manifest.get("embedding_model") != config.EMBEDDING_MODEL and not allow_model_mismatch:
+        raise ValueError(
+            f"El snapshot usa '{manifest.get('embedding_model')}' y EMBEDDING_MODEL es '{config.EMBEDDING_MODEL}'"
+        )
+
+    name = name or manifest["collection"]
+    embeddings = np.load(os.path.join(snapshot_path, EMBEDDINGS_FILE))
+    with gzip.open(os.path.join(snapshot_path, RECORDS_FILE), "rt", encoding="utf-8") as f:
+        records = json.load(f)
+    if len(records["ids"]) != manifest["count"] or embeddings.shape[0] != manifest["count"]:
+        raise ValueError(f"El snapshot {snapshot_path} no coincide con su manifest")
+
+    client = chromadb.PersistentClient(path=persist_dir) if persist_dir else get_chroma_client()
+    existing = {c if isinstance(c, str) else c.name for c in client.list_collections()}
+    if name in existing:
+        if not replace:
+            raise ValueError(f"La colección '{name}' ya existe (usa --replace)")
+        client.delete_collection(name)
+    collection = client.create_collection(name=name, metadata=manifest.get("collection_metadata") or None)
+
+    t0 = time.perf_counter()
+    n = manifest["count"]
+    for i in range(0, n, COPY_BATCH_SIZE):
+        collection.add(
+            ids=records["ids"][i:i + COPY_BATCH_SIZE],
+            embeddings=embeddings[i:i + COPY_BATCH_SIZE].tolist(),
+            documents=records["documents"][i:i + COPY_BATCH_SIZE],
+            metadatas=records["metadatas"][i:i + COPY_BATCH_SIZE],
+        )
+    elapsed = time.perf_counter() - t0
+    # Los workers (de este u otros procesos) reabren la colección en vez de servir la anterior
+    mark_collection_updated(name)
+    logger.info(f"Snapshot importado en '{name}': {n} registros en {elapsed:.1f}s")
+    return {"collection": name, "count": n, "seconds": round(elapsed, 2)}
@@ -9,6 +9,14 @@ OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 # Directorio donde se persiste la base de vectores Chroma.
 CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
 
+# Servidor Chroma compartido (modo multi-worker). Si CHROMA_HOST está vacío se usa CHROMA_PERSIST_DIR en proceso.
+CHROMA_HOST: str = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT: int = int(os.getenv("CHROMA_PORT", "8001"))
+
+# Redis para cachés compartidas entre workers (generación de colecciones, uso por ramo). Vacío = en memoria.
+REDIS_URL: str = os.getenv("REDIS_URL", "")
+REDIS_PREFIX: str = os.getenv("REDIS_PREFIX", "ragent:")
+
 # Nombre del modelo de embeddings a usar.
 EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
@@ -21,11 +29,18 @@ DEFAULT_TOP_K: int = int(os.getenv("DEFAULT_TOP_K", "15"))
 # Tamaño aproximado en caracteres para dividir el texto en chunks (aumentado 20x)
 MAX_CHUNK_SIZE: int = int(os.getenv("MAX_CHUNK_SIZE", "400000"))  # chars approximation
 
-# Número de candidatos a recuperar antes de aplicar reranking (si está habilitado).
-RERANK_TOP_K: int = int(os.getenv("RERANK_TOP_K", "20"))
+# Top-k adaptativo: decide cuántos documentos usar según la distribución de similitudes (umbral y codo).
+ADAPTIVE_TOP_K: bool = os.getenv("ADAPTIVE_TOP_K", "true").lower() in ("1", "true", "yes")
+
+# Cotas del top-k adaptativo: candidatos consultados a Chroma (máximo) y mínimo de documentos devueltos.
+RETRIEVAL_MAX_K: int = int(os.getenv("RETRIEVAL_MAX_K", str(DEFAULT_TOP_K)))
+RETRIEVAL_MIN_K: int = int(os.getenv("RETRIEVAL_MIN_K", "2"))
+
+# Similitud coseno (0..1) mínima para que un documento cuente como relevante.
+RETRIEVAL_MIN_SCORE: float = float(os.getenv("RETRIEVAL_MIN_SCORE", "0.3"))
 
-# Habilita o deshabilita la etapa de reranking. Variable de entorno: RERANK_ENABLED
-RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "true").lower() in ("1", "true", "yes")
+# Salto mínimo entre similitudes consecutivas para cortar en el codo de la distribución.
+RETRIEVAL_SCORE_GAP: float = float(os.getenv("RETRIEVAL_SCORE_GAP", "0.05"))
 
 # Límite aproximado de tokens que el modelo puede manejar. Ajustable vía MAX_MODEL_TOKENS
 MAX_MODEL_TOKENS: int = int(os.getenv("MAX_MODEL_TOKENS", "300000"))
@@ -51,6 +66,13 @@ DEFAULT_PERSIST: bool = os.getenv("DEFAULT_PERSIST", "true").lower() in ("1", "t
 # Umbral de deduplicación por similitud (0..1). Si la similitud >= DEDUP_SIM_THRESHOLD se considera duplicado.
 DEDUP_SIM_THRESHOLD: float = float(os.getenv("DEDUP_SIM_THRESHOLD", "0.9"))
 
+# Parámetros HNSW con que se crean las colecciones (por defecto los de Chroma). Solo afectan colecciones
+# nuevas; para cambiarlos en una existente usar `main.py reindex`.
+HNSW_SPACE: str = os.getenv("HNSW_SPACE", "l2")  # 'l2', 'cosine' o 'ip'
+HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+HNSW_CONSTRUCTION_EF: int = int(os.getenv("HNSW_CONSTRUCTION_EF", "100"))
+HNSW_SEARCH_EF: int = int(os.getenv("HNSW_SEARCH_EF", "10"))
+
 # Tamaño de chunk por defecto y solapamiento (en caracteres) para chunking.
 # Tamaño por defecto de chunk y solapamiento en caracteres.
 # Variables de entorno: CHUNK_DEFAULT_SIZE, CHUNK_DEFAULT_OVERLAP (aumentados 20x)
@@ -67,9 +89,184 @@ LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))
 # Limita el tamaño de la respuesta generada por el LLM.
 LLM_MAX_COMPLETION_TOKENS: int = int(os.getenv("LLM_MAX_COMPLETION_TOKENS", "2048"))
 
+# Llamadas simultáneas al LLM por proceso (semáforo compartido por todas las rutas).
+LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Límites del proveedor: solicitudes y tokens por minuto (0 = sin límite local).
+LLM_RPM: int = int(os.getenv("LLM_RPM", "500"))
+LLM_TPM: int = int(os.getenv("LLM_TPM", "200000"))
+
+# Timeout por llamada (segundos) y reintentos con backoff exponencial + jitter ante 429/timeouts/5xx.
+LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", "1.0"))
+LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", "30.0"))
+
+# Conexiones HTTP keep-alive del cliente compartido.
+LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "20"))
+
 
 # Limita el número de llamadas a herramientas por consulta(ReAct).
 BUDGET_CALLS_PER_QUERY: int = int(os.getenv("BUDGET_CALLS_PER_QUERY", "5"))
 
 # Limita tokens consumidos por herramientas en una consulta (0 = sin límite).
 TOKEN_BUDGET_PER_QUERY: int = int(os.getenv("TOKEN_BUDGET_PER_QUERY", "0"))
+
+
+# Habilita la fase de warm-up al iniciar la API (abre Chroma, construye chatbots y ejecuta una consulta sintética).
+WARMUP_ENABLED: bool = os.getenv("WARMUP_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Colecciones a precalentar, separadas por coma. Si está vacío se usan las más consultadas (o todas las existentes).
+WARMUP_COLLECTIONS: list = [c.strip() for c in os.getenv("WARMUP_COLLECTIONS", "").split(",") if c.strip()]
+
+# Número máximo de colecciones a precalentar cuando no se listan explícitamente.
+WARMUP_MAX_COLLECTIONS: int = int(os.getenv("WARMUP_MAX_COLLECTIONS", "5"))
+
+# Consulta sintética usada para recorrer embeddings, búsqueda vectorial y construcción de prompt.
+WARMUP_QUERY: str = os.getenv("WARMUP_QUERY", "resumen de los contenidos del ramo")
+
+# Si es true, el warm-up también realiza una llamada corta al LLM (tiene costo).
+WARMUP_LLM: bool = os.getenv("WARMUP_LLM", "false").lower() in ("1", "true", "yes")
+
+# Archivo donde se persisten los contadores de consultas por ramo (usado para elegir colecciones a precalentar).
+USAGE_STATS_PATH: str = os.getenv("USAGE_STATS_PATH", "./usage_stats.json")
+
+
+# Genera y guarda flashcards por documento durante la ingesta (requiere llamadas al LLM).
+FLASHCARDS_AT_INGEST: bool = os.getenv("FLASHCARDS_AT_INGEST", "false").lower() in ("1", "true", "yes")
+
+# Base SQLite donde se guardan las flashcards materializadas.
+FLASHCARDS_DB_PATH: str = os.getenv("FLASHCARDS_DB_PATH", "./flashcards.db")
+
+# Número de flashcards a generar por documento en la ingesta.
+FLASHCARDS_PER_DOCUMENT: int = int(os.getenv("FLASHCARDS_PER_DOCUMENT", "20"))
+
+# Número de flashcards a devolver por solicitud cuando se sirven desde el almacén.
+FLASHCARDS_SAMPLE_SIZE: int = int(os.getenv("FLASHCARDS_SAMPLE_SIZE", "10"))
+
+# Mínimo de flashcards que deben cumplir el filtro para servir desde el almacén (si no, se usa el LLM).
+FLASHCARDS_MIN_STORED: int = int(os.getenv("FLASHCARDS_MIN_STORED", "5"))
+
+
+# Construye un perfil compacto por archivo (resumen, temas, tipo de evaluación) durante la ingesta.
+PROFILES_AT_INGEST: bool = os.getenv("PROFILES_AT_INGEST", "true").lower() in ("1", "true", "yes")
+
+# Sufijo de la colección Chroma que guarda los perfiles de una colección (p. ej. CII-2750__profiles).
+PROFILE_COLLECTION_SUFFIX: str = os.getenv("PROFILE_COLLECTION_SUFFIX", "__profiles")
+
+# Tokens máximos del documento que se envían al LLM para construir su perfil.
+PROFILE_SOURCE_TOKENS: int = int(os.getenv("PROFILE_SOURCE_TOKENS", "12000"))
+
+# Usa el índice de perfiles para el modo 'search' (si la colección de perfiles existe).
+SEARCH_USE_PROFILES: bool = os.getenv("SEARCH_USE_PROFILES", "true").lower() in ("1", "true", "yes")
+
+# Si es false, 'search' responde solo desde el índice de perfiles, sin llamar al LLM.
+SEARCH_USE_LLM: bool = os.getenv("SEARCH_USE_LLM", "true").lower() in ("1", "true", "yes")
+
+# Umbrales de similitud (0..1) para clasificar la relevancia en la búsqueda por índice.
+SEARCH_HIGH_RELEVANCE: float = float(os.getenv("SEARCH_HIGH_RELEVANCE", "0.5"))
+SEARCH_MEDIUM_RELEVANCE: float = float(os.getenv("SEARCH_MEDIUM_RELEVANCE", "0.35"))
+
+
+# Comprime el contexto recuperado seleccionando los pasajes más relevantes a la pregunta antes de armar el prompt.
+COMPRESSION_ENABLED: bool = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Presupuesto de tokens para los pasajes seleccionados.
+COMPRESSION_TOKEN_TARGET: int = int(os.getenv("COMPRESSION_TOKEN_TARGET", "8000"))
+
+# Presupuesto de tokens de contexto por modo (las flashcards necesitan más material que una búsqueda).
+# Una solicitud degradada puede achicarlo; 0 = usar COMPRESSION_TOKEN_TARGET / MAX_MODEL_TOKENS.
+CONTEXT_BUDGET_QA: int = int(os.getenv("CONTEXT_BUDGET_QA", "4000"))
+CONTEXT_BUDGET_SEARCH: int = int(os.getenv("CONTEXT_BUDGET_SEARCH", "2000"))
+CONTEXT_BUDGET_FLASHCARDS: int = int(os.getenv("CONTEXT_BUDGET_FLASHCARDS", "6000"))
+
+# Puntuación de pasajes: 'lexical' (BM25, sin llamadas externas) o 'embedding' (similitud coseno con embeddings).
+COMPRESSION_SCORER: str = os.getenv("COMPRESSION_SCORER", "lexical").lower()
+
+# Balance relevancia/diversidad de MMR (1.0 = solo relevancia).
+COMPRESSION_MMR_LAMBDA: float = float(os.getenv("COMPRESSION_MMR_LAMBDA", "0.7"))
+
+# Tamaño aproximado en caracteres de cada pasaje candidato.
+COMPRESSION_PASSAGE_CHARS: int = int(os.getenv("COMPRESSION_PASSAGE_CHARS", "1200"))
+
+
+# Reutilización de la recuperación entre turnos de una conversación (requiere conversation_id en la API).
+FOLLOWUP_REUSE_ENABLED: bool = os.getenv("FOLLOWUP_REUSE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Similitud coseno con la pregunta que originó el contexto: sobre REUSE se reutiliza tal cual,
+# sobre EXTEND (o con los mismos `files`) se consulta Chroma y se agregan solo los documentos nuevos.
+FOLLOWUP_REUSE_SIMILARITY: float = float(os.getenv("FOLLOWUP_REUSE_SIMILARITY", "0.9"))
+FOLLOWUP_EXTEND_SIMILARITY: float = float(os.getenv("FOLLOWUP_EXTEND_SIMILARITY", "0.75"))
+
+# Conversaciones recordadas por colección y segundos de inactividad tras los que se olvidan.
+FOLLOWUP_MAX_CONVERSATIONS: int = int(os.getenv("FOLLOWUP_MAX_CONVERSATIONS", "1000"))
+FOLLOWUP_TTL_SECONDS: int = int(os.getenv("FOLLOWUP_TTL_SECONDS", "1800"))
+
+
+# Llamadas al LLM en paralelo por lote en /api/query/batch y `main.py batch`.
+BATCH_MAX_PARALLEL: int = int(os.getenv("BATCH_MAX_PARALLEL", "4"))
+
+# Número máximo de preguntas aceptadas en un lote.
+BATCH_MAX_PROMPTS: int = int(os.getenv("BATCH_MAX_PROMPTS", "500"))
+
+
+# Hilos del pool de ingesta en segundo plano de la API (0 = la API solo encola; otro proceso procesa la cola).
+INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "1"))
+
+# Base SQLite de la cola persistente de trabajos de ingesta.
+INGEST_JOBS_DB_PATH: str = os.getenv("INGEST_JOBS_DB_PATH", "./ingest_jobs.db")
+
+# Directorio donde se guardan los archivos subidos a /api/ingest antes de procesarlos.
+INGEST_UPLOAD_DIR: str = os.getenv("INGEST_UPLOAD_DIR", "./uploads")
+
+# Directorio raíz desde el que /api/ingest acepta rutas del servidor (`paths`). Vacío = solo archivos subidos.
+INGEST_PATHS_ROOT: str = os.getenv("INGEST_PATHS_ROOT", "")
+
+# Caché persistente del texto extraído (PDF/DOCX), por hash de contenido y versión del extractor.
+EXTRACTION_CACHE_ENABLED: bool = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_DB_PATH: str = os.getenv("EXTRACTION_CACHE_DB_PATH", "./extraction_cache.db")
+
+# Documentos por lote en la ingesta: se embeben en una llamada y se escriben juntos en Chroma (acota la memoria).
+INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "16"))
+
+# Directorio de checkpoints de ingesta (permiten retomar con `main.py ingest --resume`).
+INGEST_CHECKPOINT_DIR: str = os.getenv("INGEST_CHECKPOINT_DIR", "./ingest_checkpoints")
+
+# Segundos entre sondeos de la cola cuando no hay trabajos pendientes.
+INGEST_POLL_INTERVAL: float = float(os.getenv("INGEST_POLL_INTERVAL", "2.0"))
+
+# Latido de los trabajos en curso y segundos sin latido tras los que se consideran abandonados y se re-encolan.
+INGEST_HEARTBEAT_INTERVAL: float = float(os.getenv("INGEST_HEARTBEAT_INTERVAL", "10"))
+INGEST_STALE_AFTER: float = float(os.getenv("INGEST_STALE_AFTER", "60"))
+
+
+# Almacenamiento de objetos compatible con S3 (Cloudflare R2, MinIO, AWS). Si no se define S3_ENDPOINT_URL
+# y existe R2_ACCOUNT_ID (mismas variables que usa el frontend), se usa el endpoint de R2.
+R2_ACCOUNT_ID: str = os.getenv("R2_ACCOUNT_ID", "")
+S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", f"https://{R2_ACCOUNT_ID}.r2.cloudflarestorage.com" if R2_ACCOUNT_ID else "")
+# Bucket sin valor por defecto: ingest-s3 falla con un error claro si no está configurado.
+S3_BUCKET: str = os.getenv("S3_BUCKET", os.getenv("R2_BUCKET_NAME", ""))
+S3_ACCESS_KEY_ID: str = os.getenv("S3_ACCESS_KEY_ID", os.getenv("R2_ACCESS_KEY_ID", ""))
+S3_SECRET_ACCESS_KEY: str = os.getenv("S3_SECRET_ACCESS_KEY", os.getenv("R2_SECRET_ACCESS_KEY", ""))
+S3_REGION: str = os.getenv("S3_REGION", "auto")
+
+# Descargas simultáneas desde el bucket durante la ingesta (también dimensiona el pool de conexiones HTTP).
+S3_MAX_CONCURRENCY: int = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+
+
+# Control de admisión de /api/query: consultas ejecutándose a la vez (por defecto igual a LLM_MAX_CONCURRENCY).
+ADMISSION_MAX_ACTIVE: int = int(os.getenv("ADMISSION_MAX_ACTIVE", str(LLM_MAX_CONCURRENCY)))
+
+# Consultas en espera permitidas en total y por ramo; sobre eso se responde 429 con Retry-After.
+ADMISSION_MAX_QUEUE: int = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_QUEUE_PER_RAMO: int = int(os.getenv("ADMISSION_MAX_QUEUE_PER_RAMO", "16"))
+
+# Segundos máximos de espera en cola antes de rechazar la consulta.
+ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+# Con al menos esta cantidad de consultas en cola se entra en modo degradado (0 = nunca).
+ADMISSION_DEGRADE_QUEUE: int = int(os.getenv("ADMISSION_DEGRADE_QUEUE", "8"))
+
+# Top-k y presupuesto de tokens de contexto usados en modo degradado.
+ADMISSION_DEGRADED_TOP_K: int = int(os.getenv("ADMISSION_DEGRADED_TOP_K", "5"))
+ADMISSION_DEGRADED_CONTEXT_TOKENS: int = int(os.getenv("ADMISSION_DEGRADED_CONTEXT_TOKENS", "3000"))
@@ -0,0 +1,121 @@
+import threading
+from typing import Dict, Optional
+from app.utils import config
+from app.utils.logger import logger
+
+try:
+    import redis
+except ImportError:  # opcional: sin redis se usa el respaldo en memoria (un solo proceso)
+    redis = None
+
+
+class LocalCache:
+    """Respaldo en memoria del proceso: correcto con un único worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._hashes: Dict[str, Dict[str, int]] = {}
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def hincr(self, key: str, field: str, amount: int = 1) -> None:
+        with self._lock:
+            h = self._hashes.setdefault(key, {})
+            h[field] = h.get(field, 0) + amount
+
+    def hgetall(self, key: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._hashes.get(key, {}))
+
+
+class RedisCache:
+    """Contadores compartidos entre workers y nodos en Redis (REDIS_URL)."""
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1.0)
+        self._prefix = config.REDIS_PREFIX
+
+    def get_counter(self, key: str) -> int:
+        return int(self._client.get(self._prefix + key) or 0)
+
+    def incr(self, key: str) -> int:
+        return int(self._client.incr(self._prefix + key))
+
+    def hincr(self, key: str, field: str, amount: int = 1) -> None:
+        self._client.hincrby(self._prefix + key, field, amount)
+
+    def hgetall(self, key: str) -> Dict[str, int]:
+        return {k: int(v) for k, v in (self._client.hgetall(self._prefix + key) or {}).items()}
+
+
+_cache = None
+
+
+def get_shared_cache():
+    """Redis si REDIS_URL está configurado (y el paquete instalado); si no, caché local del proceso."""
+    global _cache
+    if _cache is None:
+        if config.REDIS_URL and redis is not None:
+            _cache = RedisCache(config.REDIS_URL)
+            logger.info("Caché compartida: Redis")
+        else:
+            if config.REDIS_URL:
+                logger.warning("REDIS_URL definido pero el paquete 'redis' no está instalado; se usa caché local")
+            _cache = LocalCache()
+    return _cache
+
+
+def collection_generation(name: str) -> int:
+    """Generación de una colección: cambia cada vez que una ingesta la modifica (en cualquier proceso)."""
+    try:
+        return get_shared_cache().get_counter(f"generation:{name}")
+    except Exception as e:
+        logger.warning(f"No se pudo leer la generación de '{name}': {e}")
+        return -1
+
+
+def bump_generation(name: str) -> Optional[int]:
+    try:
+        return get_shared_cache().incr(f"generation:{name}")
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar la generación de '{name}': {e}")
+        return None
+
+
+def record_usage(ramo: str, amount: int = 1) -> None:
+    try:
+        get_shared_cache().hincr("usage", ramo, amount)
+    except Exception as e:
+        logger.warning(f"No se pudo registrar uso de '{ramo}': {e}")
+
+
+def usage_counts() -> Dict[str, int]:
+    try:
+        return get_shared_cache().hgetall("usage")
+    except Exception as e:
+        logger.warning(f"No se pudieron leer estadísticas de uso compartidas: {e}")
+        return {}
+
+
+def record_retrieval(outcome: str) -> None:
+    """Cuenta el resultado de una recuperación en una conversación: 'fresh', 'extended' o 'reused'."""
+    try:
+        get_shared_cache().hincr("retrieval", outcome)
+    except Exception as e:
+        logger.warning(f"No se pudo registrar la recuperación '{outcome}': {e}")
+
+
+def retrieval_counts() -> Dict[str, int]:
+    try:
+        return get_shared_cache().hgetall("retrieval")
+    except Exception as e:
+        logger.warning(f"No se pudieron leer estadísticas de recuperación: {e}")
+        return {}
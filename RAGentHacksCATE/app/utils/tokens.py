@@ -0,0 +1,15 @@
+import tiktoken
+from functools import lru_cache
+from app.utils import config
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = config.LLM_MODEL):
+    """Devuelve el encoder de tiktoken para el modelo (cargado una sola vez por proceso)."""
+    return tiktoken.encoding_for_model(model_name)
+
+
+def count_tokens(text: str, model_name: str = config.LLM_MODEL) -> int:
+    if not text:
+        return 0
+    return len(get_encoding(model_name).encode(text))
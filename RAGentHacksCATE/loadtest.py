@@ -0,0 +1,196 @@
+"""
+Prueba de carga de /api/query con distinta cantidad de workers de uvicorn.
+
+Para cada valor de --workers levanta `uvicorn api:app --workers N`, espera /health/ready,
+lanza --concurrency clientes durante --duration segundos y reporta throughput y latencias.
+Con más de un worker conviene apuntar a un servidor Chroma compartido (CHROMA_HOST) y a
+Redis (REDIS_URL); ver "Modo multi-worker" en el README.
+
+    python loadtest.py --ramo CII-2750 --workers 1 2 4 --concurrency 32 --duration 30
+
+Por defecto usa mode=search y levanta la API con SEARCH_USE_LLM=false: la respuesta se arma
+desde el índice de perfiles sin llamar al LLM. Cada consulta sí embebe el prompt con el API de
+embeddings, así que las cifras incluyen esa latencia (y su límite de tasa): son una medición de
+extremo a extremo del despliegue, no de la capacidad del servidor aislada.
+
+Termina con código 1 si alguna configuración no queda lista o no obtiene respuestas 200, o si el
+throughput de la configuración con más workers no llega a --min-speedup veces el de la primera
+(--min-speedup 0 solo reporta).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+PROMPTS = [
+    "¿Qué controles incluyen ejercicios de derivadas?",
+    "pruebas con integrales por partes",
+    "solemnes del semestre 2023-2",
+    "ejercicios de límites y continuidad",
+    "pautas con demostraciones por inducción",
+    "controles sobre series y sucesiones",
+]
+
+
+def post(url: str, payload: Dict[str, Any], timeout: float) -> int:
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return 0
+
+
+def wait_ready(base_url: str, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health/ready", timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def run_load(base_url: str, ramo: str, mode: str, concurrency: int, duration: float, timeout: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(i: int):
+        n = i
+        while time.time() < stop_at:
+            payload = {"prompt": PROMPTS[n % len(PROMPTS)], "ramo": ramo, "mode": mode}
+            t0 = time.perf_counter()
+            status = post(f"{base_url}/api/query", payload, timeout)
+            elapsed = time.perf_counter() - t0
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+            n += concurrency
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    t0 = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - t0
+
+    latencies.sort()
+    ok = len(latencies)
+    return {
+        "ok": ok,
+        "statuses": statuses,
+        "throughput_rps": ok / wall if wall else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p95_ms": latencies[int(0.95 * (ok - 1))] * 1000 if latencies else None,
+    }
+
+
+def check_scaling(results: List[Any], min_speedup: float) -> List[str]:
+    """
+    Problemas que hacen fallar la corrida: configuraciones sin respuestas 200 y, con más de una
+    configuración, un speedup (la de más workers contra la primera) bajo `min_speedup`.
+    `results` son pares (workers, resultado de run_load); resultado None = el servidor no quedó listo.
+    """
+    problems = []
+    for workers, r in results:
+        if r is None:
+            problems.append(f"workers={workers}: el servidor no quedó listo")
+        elif not r["ok"]:
+            problems.append(f"workers={workers}: ninguna respuesta 200 ({r['statuses']})")
+    measured = [(w, r) for w, r in results if r and r["ok"]]
+    if min_speedup and len(measured) > 1 and len(measured) == len(results):
+        (first_w, first), (last_w, last) = measured[0], max(measured[1:], key=lambda wr: wr[0])
+        speedup = last["throughput_rps"] / first["throughput_rps"]
+        if speedup < min_speedup:
+            problems.append(
+                f"workers={last_w}: {speedup:.2f}x el throughput de workers={first_w}, "
+                f"se esperaba al menos {min_speedup:.2f}x"
+            )
+    return problems
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    # Los workers de la API solo sirven consultas; la ingesta va por `main.py ingest-worker`
+    env.setdefault("INGEST_WORKERS", "0")
+    # 'search' se sirve desde el índice de perfiles, sin LLM (se fija aunque el entorno diga otra cosa)
+    env["SEARCH_USE_LLM"] = "false"
+    env["SEARCH_USE_PROFILES"] = "true"
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ramo", required=True)
+    parser.add_argument("--mode", default="search", choices=["qa", "search", "flashcards"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por solicitud (s)")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--url", default=None, help="Probar un servidor ya levantado en vez de iniciar uvicorn")
+    parser.add_argument(
+        "--min-speedup", type=float, default=1.5,
+        help="Speedup mínimo de la configuración con más workers respecto de la primera (0 = no verificar)",
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    if args.url:
+        results.append(("externo", run_load(args.url.rstrip("/"), args.ramo, args.mode, args.concurrency, args.duration, args.timeout)))
+    else:
+        base_url = f"http://127.0.0.1:{args.port}"
+        for workers in args.workers:
+            proc = start_server(workers, args.port)
+            try:
+                if not wait_ready(base_url, timeout=300):
+                    print(f"workers={workers}: el servidor no quedó listo")
+                    results.append((workers, None))
+                    continue
+                # Ronda corta de calentamiento para no medir la primera apertura de cada worker
+                run_load(base_url, args.ramo, args.mode, args.concurrency, min(5.0, args.duration), args.timeout)
+                results.append((workers, run_load(base_url, args.ramo, args.mode, args.concurrency, args.duration, args.timeout)))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    measured = [(w, r) for w, r in results if r is not None]
+    base = measured[0][1]["throughput_rps"] if measured else 0.0
+    print(f"\n{'workers':>8} {'req/s':>8} {'x':>6} {'p50 ms':>8} {'p95 ms':>8}  estados")
+    for workers, r in measured:
+        speedup = r["throughput_rps"] / base if base else 0.0
+        p50 = f"{r['p50_ms']:.0f}" if r["p50_ms"] is not None else "-"
+        p95 = f"{r['p95_ms']:.0f}" if r["p95_ms"] is not None else "-"
+        print(f"{workers!s:>8} {r['throughput_rps']:>8.1f} {speedup:>6.2f} {p50:>8} {p95:>8}  {r['statuses']}")
+
+    problems = check_scaling(results, args.min_speedup)
+    for problem in problems:
+        print(f"FALLA: {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
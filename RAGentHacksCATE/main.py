@@ -4,9 +4,13 @@ from app.chatbot import Chatbot
 from app.data.ingestion import ingest_files, ingest_file
 from app.utils.logger import logger
 from app.utils import config
-from app.rag.retriever import get_vectorstore
-import chromadb
-import os
+from app.rag.retriever import get_chroma_client, get_vectorstore
+from app.data.flashcards import materialize_flashcards
+from app.data.profiles import build_profiles, profile_collection_name
+from app.rag.prompts import template_token_report
+from app.rag.batch import answer_batch
+from langchain_core.documents import Document
+import json
 
 app = typer.Typer()
 
@@ -16,21 +20,233 @@ def ingest(
     collection: str = typer.Argument("study_collection", help="Nombre de la colección"),
     paths: list[str] = typer.Option(None, help="Lista de rutas a ingestar (alternativa a ruta_de_archivo)"),
     dry_run: bool = False,
+    flashcards: bool = typer.Option(None, "--flashcards/--no-flashcards", help="Materializa flashcards por documento (por defecto FLASHCARDS_AT_INGEST)"),
+    profiles: bool = typer.Option(None, "--profiles/--no-profiles", help="Construye el índice de perfiles para 'search' (por defecto PROFILES_AT_INGEST)"),
+    resume: bool = typer.Option(False, help="Retoma una ingesta interrumpida con las mismas rutas (omite archivos ya escritos)"),
 ):
         """Ingesta documentos en la colección indicada.
         Modo 1: python main.py ingest ruta_de_archivo collection
         Modo 2: python main.py ingest --paths file1.pdf file2.pdf collection
+        Modo 3: python main.py ingest --paths file1.pdf file2.pdf --resume collection
         """
         if paths:
-            docs = ingest_files(paths, collection_name=collection, dry_run=dry_run)
+            written = ingest_files(paths, collection_name=collection, dry_run=dry_run, flashcards=flashcards, profiles=profiles, resume=resume)
         elif ruta_de_archivo:
-            docs = ingest_file(ruta_de_archivo, collection_name=collection, dry_run=dry_run)
+            written = ingest_file(ruta_de_archivo, collection_name=collection, dry_run=dry_run, flashcards=flashcards, profiles=profiles)
         else:
             print("Debes proporcionar una ruta_de_archivo o --paths.")
             raise typer.Exit(code=1)
 
         if dry_run:
-            print(f"Dry-run: {len(docs)} chunks would be created/added from provided paths")
+            print(f"Dry-run: {written} chunks would be created/added from provided paths")
+        else:
+            print(f"Documentos escritos: {written}")
+
+@app.command("ingest-s3")
+def ingest_s3(
+    prefix: str = typer.Argument(..., help="Prefijo en el bucket, p. ej. CII-2750/"),
+    collection: str = typer.Argument(None, help="Colección destino (por defecto el prefijo sin '/')"),
+    bucket: str = typer.Option(None, help="Bucket (por defecto S3_BUCKET)"),
+    concurrency: int = typer.Option(None, help="Descargas simultáneas (por defecto S3_MAX_CONCURRENCY)"),
+    force: bool = typer.Option(False, help="Reingesta aunque el ETag no haya cambiado"),
+    dry_run: bool = False,
+):
+    """Ingesta directamente desde almacenamiento S3/R2, en memoria y omitiendo objetos sin cambios (ETag)."""
+    from app.data.object_storage import ingest_prefix
+
+    stats = ingest_prefix(prefix, collection_name=collection, bucket=bucket, max_concurrency=concurrency, force=force, dry_run=dry_run)
+    print(
+        f"Objetos listados: {stats['listed']} | sin cambios: {stats['skipped']} | "
+        f"ingestados: {stats['ingested_objects']} | fallidos: {len(stats['failed'])} | chunks: {stats['documents']}"
+    )
+    for key in stats["failed"]:
+        print(f" - falló: {key}")
+    if stats["failed"]:
+        raise typer.Exit(code=1)
+
+@app.command()
+def reindex(
+    collection: str = typer.Argument("study_collection", help="Nombre de la colección"),
+    space: str = typer.Option(None, help="Distancia: l2, cosine o ip (por defecto la actual)"),
+    m: int = typer.Option(None, "--m", help="Vecinos por nodo del grafo HNSW (por defecto HNSW_M)"),
+    construction_ef: int = typer.Option(None, help="ef de construcción (por defecto HNSW_CONSTRUCTION_EF)"),
+    search_ef: int = typer.Option(None, help="ef de búsqueda (por defecto HNSW_SEARCH_EF)"),
+    k: int = typer.Option(10, help="k para medir recall@k"),
+    sample: int = typer.Option(200, help="Consultas de muestra para el reporte"),
+    swap: bool = typer.Option(True, "--swap/--no-swap", help="Reemplaza la colección (--no-swap solo evalúa)"),
+    keep_old: bool = typer.Option(False, help="Conserva la colección anterior renombrada"),
+):
+    """Reconstruye una colección con otros parámetros HNSW desde sus embeddings y reporta recall@k vs latencia."""
+    from app.rag.hnsw import reindex_collection
+
+    try:
+        report = reindex_collection(
+            collection,
+            space=space,
+            m=m,
+            construction_ef=construction_ef,
+            search_ef=search_ef,
+            k=k,
+            sample=sample,
+            swap=swap,
+            keep_old=keep_old,
+        )
+    except ValueError as e:
+        print(str(e))
+        raise typer.Exit(code=1)
+
+    print(f"Colección '{report['collection']}': {report['records']} registros, {report['queries']} consultas, k={report['k']}")
+    print(f"Construcción del nuevo índice: {report['build_s']}s\n")
+    print(f"{'índice':<8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}  parámetros")
+    for label in ("current", "new"):
+        r = report[label]
+        params = ", ".join(f"{key.split(':', 1)[1]}={v}" for key, v in sorted(r["params"].items())) or "(por defecto de Chroma)"
+        print(f"{label:<8} {r['recall']:>9.3f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f}  {params}")
+    if report["swapped"]:
+        print("\nColección reemplazada." + (f" Anterior conservada como '{report['old_collection']}'." if report.get("old_collection") else ""))
+    else:
+        print("\nSin cambios (--no-swap).")
+
+@app.command("export")
+def export_cmd(
+    collections: list[str] = typer.Argument(None, help="Colecciones a exportar (por defecto todas)"),
+    out: str = typer.Option("./snapshots", help="Directorio de salida"),
+):
+    """Exporta colecciones (ids, metadata, textos y embeddings) a un snapshot NumPy con checksums."""
+    from app.rag.retriever import list_collection_names
+    from app.rag.snapshot import export_collection
+
+    names = collections or list_collection_names()
+    if not names:
+        print("No hay colecciones para exportar.")
+        raise typer.Exit()
+    for name in names:
+        manifest = export_collection(name, out)
+        print(f" - {name}: {manifest['count']} registros (dim {manifest['dim']}) -> {os.path.join(out, name)}")
+
+@app.command("import")
+def import_cmd(
+    snapshot_dir: str = typer.Argument(..., help="Directorio creado por 'export'"),
+    persist_dir: str = typer.Option(None, help="Directorio Chroma destino (por defecto CHROMA_PERSIST_DIR)"),
+    replace: bool = typer.Option(False, help="Reemplaza colecciones existentes"),
+    allow_model_mismatch: bool = typer.Option(False, help="Importa aunque EMBEDDING_MODEL no coincida con el del snapshot"),
+):
+    """Carga snapshots en un directorio Chroma sin llamar al API de embeddings."""
+    from app.rag.snapshot import MANIFEST_FILE, import_collection, list_snapshots
+
+    if os.path.isfile(os.path.join(snapshot_dir, MANIFEST_FILE)):
+        paths = [snapshot_dir]
+    else:
+        paths = [os.path.join(snapshot_dir, d) for d in list_snapshots(snapshot_dir)]
+    if not paths:
+        print(f"No se encontraron snapshots en {snapshot_dir}.")
+        raise typer.Exit(code=1)
+    for path in paths:
+        try:
+            res = import_collection(path, persist_dir=persist_dir, replace=replace, allow_model_mismatch=allow_model_mismatch)
+        except ValueError as e:
+            print(f" - {path}: {e}")
+            raise typer.Exit(code=1)
+        print(f" - {res['collection']}: {res['count']} registros en {res['seconds']}s")
+
+@app.command("extraction-cache")
+def extraction_cache_cmd(clear: bool = typer.Option(False, help="Vacía la caché de texto extraído")):
+    """Muestra (o vacía) la caché de texto extraído de PDFs/DOCX usada por la ingesta."""
+    from app.data.extraction_cache import get_extraction_cache
+
+    cache = get_extraction_cache()
+    if clear:
+        print(f"Entradas eliminadas: {cache.clear()}")
+        return
+    stats = cache.stats()
+    print(f"Entradas: {stats['entries']} | tamaño comprimido: {stats['bytes'] / 1e6:.1f} MB ({config.EXTRACTION_CACHE_DB_PATH})")
+    for extractor, n in sorted(stats["by_extractor"].items()):
+        print(f" - {extractor}: {n}")
+
+@app.command("ingest-worker")
+def ingest_worker(workers: int = typer.Option(1, help="Hilos que procesan la cola")):
+    """
+    Procesa la cola de ingesta de la API (POST /api/ingest) en un proceso dedicado.
+    Es el camino de escritura en modo multi-worker: la API corre con INGEST_WORKERS=0 y solo encola.
+    """
+    import time
+    from app.data.jobs import IngestJobQueue, IngestWorkerPool
+
+    pool = IngestWorkerPool(IngestJobQueue(), workers=workers)
+    pool.start()
+    print(f"Ingest worker con {workers} hilos en {config.INGEST_JOBS_DB_PATH}. Ctrl+C para detener.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+
+@app.command("build-flashcards")
+def build_flashcards(collection: str = typer.Argument("study_collection", help="Nombre de la colección"), force: bool = typer.Option(False, help="Regenera aunque el contenido no haya cambiado")):
+    """Materializa flashcards para los documentos ya ingestados (solo los nuevos o modificados)."""
+    vs = get_vectorstore(collection_name=collection)
+    data = vs.get(include=['documents', 'metadatas'])
+    docs = [
+        Document(page_content=text or "", metadata=md or {})
+        for text, md in zip(data.get('documents', []) or [], data.get('metadatas', []) or [])
+    ]
+    if not docs:
+        print(f"La colección '{collection}' no tiene documentos.")
+        raise typer.Exit()
+    regenerated = materialize_flashcards(docs, collection, force=force)
+    print(f"Flashcards regeneradas para {regenerated} de {len(docs)} documentos.")
+
+@app.command("build-profiles")
+def build_profiles_cmd(collection: str = typer.Argument("study_collection", help="Nombre de la colección"), force: bool = typer.Option(False, help="Reconstruye aunque el contenido no haya cambiado")):
+    """Construye el índice de perfiles (resumen, temas, tipo de evaluación) de los documentos ya ingestados."""
+    vs = get_vectorstore(collection_name=collection)
+    data = vs.get(include=['documents', 'metadatas'])
+    docs = [
+        Document(page_content=text or "", metadata=md or {})
+        for text, md in zip(data.get('documents', []) or [], data.get('metadatas', []) or [])
+    ]
+    if not docs:
+        print(f"La colección '{collection}' no tiene documentos.")
+        raise typer.Exit()
+    written = build_profiles(docs, collection, force=force)
+    print(f"Perfiles escritos: {written} de {len(docs)} documentos en '{profile_collection_name(collection)}'.")
+
+@app.command()
+def batch(
+    questions_file: str = typer.Argument(..., help="Archivo de texto con una pregunta por línea"),
+    collection: str = typer.Argument("study_collection", help="Nombre de la colección"),
+    mode: str = typer.Option("qa", help="Modo: qa, search o flashcards"),
+    output: str = typer.Option(None, help="Archivo JSONL de salida (por defecto stdout)"),
+    parallel: int = typer.Option(None, help="Llamadas al LLM en paralelo (por defecto BATCH_MAX_PARALLEL)"),
+):
+    """Responde muchas preguntas con recuperación compartida; escribe cada resultado (JSONL) apenas termina."""
+    with open(questions_file, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+    if not questions:
+        print("El archivo no contiene preguntas.")
+        raise typer.Exit(code=1)
+
+    out = open(output, "w", encoding="utf-8") if output else None
+    done = 0
+    try:
+        for item in answer_batch(questions, collection_name=collection, mode=mode, max_workers=parallel):
+            line = json.dumps(item, ensure_ascii=False)
+            if out:
+                out.write(line + "\n")
+                out.flush()
+                done += 1
+                print(f"[{done}/{len(questions)}] pregunta {item['index']}{' (error)' if 'error' in item else ''}")
+            else:
+                print(line, flush=True)
+    finally:
+        if out:
+            out.close()
+
+@app.command("prompt-tokens")
+def prompt_tokens():
+    """Muestra cuántos tokens cuesta la plantilla fija de cada modo (qa, search, flashcards)."""
+    for mode, costs in template_token_report().items():
+        print(f" - {mode}: {costs['template']} tokens (prefijo compartido: {costs['shared_prefix']})")
 
 @app.command()
 def chat(use_rag: bool = True, collection: str = "study_collection"):
@@ -40,7 +256,7 @@ def chat(use_rag: bool = True, collection: str = "study_collection"):
         q = input("Tú> ").strip()
         if q.lower() in ("exit", "quit", "salir"):
             break
-        res = bot.ask(q)
+        res = bot.ask(q, conversation_id="cli")
         print("\nRespuesta:")
         print(res["answer"])
         if res.get("source_documents"):
@@ -58,9 +274,9 @@ def chat(use_rag: bool = True, collection: str = "study_collection"):
 def run(paths: list[str] = typer.Argument(None), collection: str = "study_collection", use_rag: bool = True, dry_run: bool = False):
 
     if paths:
-        docs = ingest_files(paths, collection_name=collection, dry_run=dry_run)
+        written = ingest_files(paths, collection_name=collection, dry_run=dry_run)
         if dry_run:
-            print(f"Dry-run: {len(docs)} chunks would be created/added from provided paths")
+            print(f"Dry-run: {written} chunks would be created/added from provided paths")
     else:
         if not os.path.exists(config.CHROMA_PERSIST_DIR):
             print("No existe base de datos y no se entregaron archivos. Ingresa archivos primero con 'ingest'.")
@@ -116,11 +332,11 @@ def delete(targets: list[str] = typer.Argument(..., help="Paths to source files
 
 @app.command("list")
 def list_files(a: bool = typer.Option(False, "--all", "-a", help="Show first ids per source")):
-    # Cliente persistente (API nueva de Chroma)
+    # Cliente Chroma del proceso (directorio local o servidor si CHROMA_HOST está definido)
     try:
-        client = chromadb.PersistentClient(path=config.CHROMA_PERSIST_DIR)
+        client = get_chroma_client()
     except Exception as e:
-        print(f"Error creando cliente Chroma persistente: {e}")
+        print(f"Error creando cliente Chroma: {e}")
         raise typer.Exit(code=1)
 
     try:
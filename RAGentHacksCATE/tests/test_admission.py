@@ -0,0 +1,116 @@
+import asyncio
+import pytest
+
+admission = pytest.importorskip("app.controllers.admission")
+from app.utils import config
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_waiters_are_served_by_lane_then_arrival():
+    async def scenario():
+        ctrl = admission.AdmissionController(max_active=1, max_queue=10, max_queue_per_ramo=10, queue_timeout=5, degrade_queue=0)
+        order = []
+        holder = await ctrl.acquire("ramo", "qa")
+
+        async def query(name, mode):
+            async with ctrl.admit(f"ramo-{name}", mode):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        tasks = [asyncio.create_task(query(n, m)) for n, m in [("fc", "flashcards"), ("qa1", "qa"), ("s", "search"), ("qa2", "qa")]]
+        await asyncio.sleep(0.01)
+        assert ctrl.queued == 4 and ctrl.active == 1
+        ctrl.release(holder)
+        await asyncio.gather(*tasks)
+        return ctrl, order
+
+    ctrl, order = run(scenario())
+    assert order == ["s", "qa1", "qa2", "fc"]
+    assert ctrl.active == 0 and ctrl.queued == 0
+    assert ctrl.snapshot()["admitted_by_lane"] == {"search": 1, "qa": 3, "flashcards": 1}
+
+
+def test_full_queues_are_rejected_immediately():
+    async def scenario():
+        ctrl = admission.AdmissionController(max_active=1, max_queue=2, max_queue_per_ramo=1, queue_timeout=5)
+        holder = await ctrl.acquire("a")
+        waiter = asyncio.create_task(ctrl.acquire("a"))
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Overloaded) as per_ramo:
+            await ctrl.acquire("a")
+        other = asyncio.create_task(ctrl.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Overloaded) as global_full:
+            await ctrl.acquire("c")
+        ctrl.release(holder)
+        ctrl.release(await waiter)
+        ctrl.release(await other)
+        return ctrl, per_ramo.value, global_full.value
+
+    ctrl, per_ramo, global_full = run(scenario())
+    assert per_ramo.reason == "ramo_queue_full"
+    assert global_full.reason == "global_queue_full"
+    assert global_full.retry_after >= 1
+    assert ctrl.stats["rejected"] == 2
+    assert ctrl.active == 0
+
+
+def test_queue_timeout_gives_back_its_place():
+    async def scenario():
+        ctrl = admission.AdmissionController(max_active=1, max_queue=5, max_queue_per_ramo=5, queue_timeout=0.05)
+        holder = await ctrl.acquire("a")
+        with pytest.raises(admission.Overloaded) as timed_out:
+            await ctrl.acquire("a")
+        ctrl.release(holder)
+        return ctrl, timed_out.value
+
+    ctrl, timed_out = run(scenario())
+    assert timed_out.reason == "queue_timeout"
+    assert ctrl.stats["timed_out"] == 1
+    assert (ctrl.active, ctrl.queued) == (0, 0)
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        ctrl = admission.AdmissionController(max_active=1, max_queue=5, max_queue_per_ramo=5, queue_timeout=5)
+        holder = await ctrl.acquire("a")
+        waiter = asyncio.create_task(ctrl.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()  # el cliente se desconecta mientras espera
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        ctrl.release(holder)
+        ctrl.release(holder)  # liberar dos veces no cuenta doble
+        return ctrl
+
+    ctrl = run(scenario())
+    assert (ctrl.active, ctrl.queued) == (0, 0)
+
+
+def test_long_queue_degrades_admitted_queries(monkeypatch):
+    monkeypatch.setattr(config, "ADMISSION_DEGRADED_TOP_K", 3)
+    monkeypatch.setattr(config, "ADMISSION_DEGRADED_CONTEXT_TOKENS", 1500)
+
+    async def scenario():
+        ctrl = admission.AdmissionController(max_active=1, max_queue=10, max_queue_per_ramo=10, queue_timeout=5, degrade_queue=2)
+        holder = await ctrl.acquire("a")
+        assert not holder.degraded
+        waiters = [asyncio.create_task(ctrl.acquire("a")) for _ in range(3)]
+        await asyncio.sleep(0)
+        ctrl.release(holder)
+        first = await waiters[0]
+        ctrl.release(first)
+        second = await waiters[1]
+        ctrl.release(second)
+        last = await waiters[2]
+        ctrl.release(last)
+        return ctrl, first, last
+
+    ctrl, first, last = run(scenario())
+    # Con 2 en cola al ser admitida corre degradada; la última, con la cola vacía, no
+    assert (first.degraded, first.k, first.context_tokens) == (True, 3, 1500)
+    assert not last.degraded
+    assert ctrl.stats["degraded"] == 1
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+
+batch = pytest.importorskip("app.rag.batch")
+api = pytest.importorskip("api")
+from app.controllers.admission import AdmissionController
+
+
+def test_closing_the_batch_stops_submitting_questions(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batch, "get_relevant_docs_batch", lambda questions, k, collection_name: ([[] for _ in questions], {}))
+
+    def answer(question, docs, mode, files, context_tokens):
+        calls.append(question)
+        if question == "p1":
+            raise RuntimeError("LLM caído")
+        return {"answer": f"r-{question}", "source_documents": [], "tokens_used": 1}
+
+    monkeypatch.setattr(batch, "answer_from_docs", answer)
+    items = list(batch.answer_batch(["p0", "p1", "p2"], collection_name="ramo", max_workers=2))
+    assert sorted(i["index"] for i in items) == [0, 1, 2]
+    assert next(i for i in items if i["index"] == 1)["error"] == "LLM caído"
+
+    calls.clear()
+    gen = batch.answer_batch([f"q{i}" for i in range(20)], collection_name="ramo", max_workers=2)
+    next(gen)
+    gen.close()
+    time.sleep(0.05)
+    # Solo la ventana inicial y el reemplazo de la primera respuesta, no las 20 preguntas
+    assert len(calls) <= 3
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    ctrl = AdmissionController(max_active=1, max_queue=0, max_queue_per_ramo=0)
+    monkeypatch.setattr(api, "admission", ctrl)
+    monkeypatch.setattr(api, "record_usage", lambda ramo, n: None)
+    return ctrl
+
+
+def slow_batch(started):
+    def fake(questions, **kwargs):
+        for i, q in enumerate(questions):
+            if i:
+                started.set()
+                time.sleep(0.3)
+            yield {"index": i, "prompt": q, "answer": "ok", "sources": [], "tokens_used": 1}
+    return fake
+
+
+def call_batch(receive_after_body, send, spec_version="2.0"):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/api/query/batch", "raw_path": b"/api/query/batch",
+        "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    body = json.dumps({"prompts": ["a", "b", "c"], "ramo": "ramo"}).encode()
+    sent_body = [False]
+
+    async def receive():
+        if not sent_body[0]:
+            sent_body[0] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive_after_body()
+
+    return api.app(scope, receive, send)
+
+
+def test_disconnect_mid_stream_releases_the_slot(controller, monkeypatch):
+    started = threading.Event()
+    monkeypatch.setattr(api, "answer_batch", slow_batch(started))
+    chunks = []
+
+    async def run():
+        got_chunk = asyncio.Event()
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                chunks.append(message["body"])
+                got_chunk.set()
+
+        async def disconnect():
+            await got_chunk.wait()
+            # El cliente se va mientras el hilo está dentro de next(batch)
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            return {"type": "http.disconnect"}
+
+        await call_batch(disconnect, send)
+
+    asyncio.run(run())
+    # La pregunta en curso puede alcanzar a enviarse; las siguientes no
+    assert len(chunks) < 3
+    assert controller.active == 0
+    assert controller.stats["admitted"] == 1
+
+
+def test_unstarted_stream_releases_the_slot(controller, monkeypatch):
+    monkeypatch.setattr(api, "answer_batch", slow_batch(threading.Event()))
+
+    async def run():
+        async def send(message):
+            # Desconexión antes de enviar las cabeceras: el cuerpo nunca se itera
+            raise OSError("conexión cerrada")
+
+        async def never():
+            await asyncio.sleep(10)
+
+        with pytest.raises(Exception):
+            await call_batch(never, send, spec_version="2.4")
+
+    asyncio.run(run())
+    assert controller.active == 0
+
+
+def test_full_queue_is_rejected_with_retry_after(controller):
+    async def run():
+        holder = await controller.acquire("otro", "qa")
+        statuses = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append((message["status"], dict(message["headers"])))
+
+        async def never():
+            await asyncio.sleep(10)
+
+        await call_batch(never, send)
+        controller.release(holder)
+        return statuses
+
+    (status, headers), = asyncio.run(run())
+    assert status == 429
+    assert int(headers[b"retry-after"]) >= 1
+    assert controller.active == 0
+    assert controller.stats["rejected"] == 1
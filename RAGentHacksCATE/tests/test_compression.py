@@ -0,0 +1,63 @@
+import pytest
+
+compression = pytest.importorskip("app.rag.compression")
+from langchain_core.documents import Document
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # tiktoken descarga su encoder; para los presupuestos basta contar palabras
+    monkeypatch.setattr(compression, "count_tokens", lambda text: len(text.split()))
+
+
+def test_split_passages_keeps_pages():
+    text = "Página uno: límites.\nMás límites.\nPágina dos: derivadas."
+    doc = Document(page_content=text, metadata={"source": "a.pdf", "page_offsets": f"0,{text.index('Página dos')}"})
+    passages = compression.split_passages(doc, 0, max_chars=1000)
+    assert [(p["page"], p["text"]) for p in passages] == [
+        (1, "Página uno: límites.\nMás límites."),
+        (2, "Página dos: derivadas."),
+    ]
+
+    long_line = Document(page_content="x" * 250, metadata={"page": 4})
+    assert [len(p["text"]) for p in compression.split_passages(long_line, 0, max_chars=100)] == [100, 100, 50]
+
+
+def test_bm25_prefers_passages_with_query_terms():
+    passages = [compression._terms(t) for t in (
+        "La regla de la cadena deriva funciones compuestas",
+        "Integrales por partes y sustitución",
+        "Ejemplos de límites laterales",
+    )]
+    scores = compression._bm25_scores(compression._terms("¿Cómo se usa la regla de la cadena?"), passages)
+    assert scores[0] > 0
+    assert scores[1] == scores[2] == 0
+
+
+def test_mmr_skips_redundant_passages():
+    relevance = [1.0, 0.99, 0.5]
+    duplicates = {(0, 1), (1, 0)}
+    similarity = lambda i, j: 1.0 if (i, j) in duplicates else 0.0
+    assert compression._mmr_select(relevance, similarity, [10, 10, 10], token_target=20, lambda_mult=0.5) == [0, 2]
+    # Sin penalización de redundancia gana la relevancia pura
+    assert compression._mmr_select(relevance, similarity, [10, 10, 10], token_target=20, lambda_mult=1.0) == [0, 1]
+
+
+def test_compress_context_respects_budget_and_cites_pages(monkeypatch):
+    monkeypatch.setattr(compression.config, "COMPRESSION_PASSAGE_CHARS", 60)
+    relevant = "La regla de la cadena se aplica a funciones compuestas."
+    filler = "Texto de relleno sin relación alguna con la pregunta."
+    text = "\n".join([filler] * 5 + [relevant] + [filler] * 5)
+    docs = [
+        Document(page_content=text, metadata={"source": "Apuntes.pdf", "chunk": 3, "page": 7}),
+        Document(page_content="La regla de la cadena en otro archivo.", metadata={"source": "Otro.pdf", "chunk": 0}),
+    ]
+    # Cada línea es un pasaje; el presupuesto alcanza para los dos relevantes y ningún relleno
+    out = compression.compress_context("regla de la cadena", docs, token_target=50, scorer="bm25")
+    assert sum(len(d.page_content.split()) + compression.HEADER_TOKENS for d in out) <= 50
+    assert [d.metadata for d in out] == [{"source": "Apuntes.pdf", "chunk": 3, "page": 7}, {"source": "Otro.pdf", "chunk": 0}]
+    assert out[0].page_content == relevant
+
+    focused = compression.compress_context("regla de la cadena", docs, token_target=30, files_focus=["otro"], scorer="bm25")
+    assert [d.metadata["source"] for d in focused] == ["Otro.pdf"]
+    assert compression.compress_context("regla", [], token_target=30) == []
@@ -0,0 +1,90 @@
+import pytest
+
+conversation = pytest.importorskip("app.controllers.conversation")
+from langchain_core.documents import Document
+from app.utils import config
+
+# Similitud coseno con "derivadas": 0.95 (reutiliza), 0.8 (extiende), 0 (nueva)
+VECTORS = {
+    "derivadas": [1.0, 0.0, 0.0],
+    "derivadas parciales": [0.95, 0.31, 0.0],
+    "regla de la cadena": [0.8, 0.6, 0.0],
+    "integrales": [0.0, 1.0, 0.0],
+}
+
+
+class FakeEmbeddingClient:
+    def embed(self, text):
+        return VECTORS[text]
+
+
+def doc(source, chunk):
+    return Document(page_content=f"{source} {chunk}", metadata={"source": source, "chunk": chunk})
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    queries = []
+    recorded = []
+
+    def relevant_docs(question, k=None, collection_name=None, query_embedding=None):
+        queries.append(question)
+        return [doc(f"{question}.pdf", i) for i in range(2)]
+
+    monkeypatch.setattr(config, "FOLLOWUP_REUSE_ENABLED", True)
+    monkeypatch.setattr(config, "FOLLOWUP_REUSE_SIMILARITY", 0.9)
+    monkeypatch.setattr(config, "FOLLOWUP_EXTEND_SIMILARITY", 0.75)
+    monkeypatch.setattr(conversation, "EmbeddingClient", FakeEmbeddingClient)
+    monkeypatch.setattr(conversation, "get_relevant_docs", relevant_docs)
+    monkeypatch.setattr(conversation, "collection_generation", lambda name: 1)
+    monkeypatch.setattr(conversation, "record_retrieval", recorded.append)
+    return conversation.ConversationManager(), queries, recorded
+
+
+def test_similar_followup_reuses_context(manager):
+    cm, queries, recorded = manager
+    first, outcome = cm._retrieve("derivadas", None, None, "c1")
+    assert outcome == "fresh"
+    docs, outcome = cm._retrieve("derivadas parciales", None, None, "c1")
+    assert outcome == "reused"
+    assert docs == first
+    assert queries == ["derivadas"]
+    # El primer turno no podía reutilizar nada y no entra en las métricas
+    assert recorded == ["reused"]
+
+
+def test_related_followup_extends_context(manager):
+    cm, queries, recorded = manager
+    cm._retrieve("derivadas", None, None, "c1")
+    docs, outcome = cm._retrieve("regla de la cadena", None, None, "c1")
+    assert outcome == "extended"
+    assert queries == ["derivadas", "regla de la cadena"]
+    assert [d.metadata["source"] for d in docs][:2] == ["regla de la cadena.pdf"] * 2
+    assert {d.metadata["source"] for d in docs[2:]} <= {"derivadas.pdf"}
+    assert recorded == ["extended"]
+
+
+def test_unrelated_followup_is_fresh_and_recorded(manager):
+    cm, queries, recorded = manager
+    cm._retrieve("derivadas", None, None, "c1")
+    docs, outcome = cm._retrieve("integrales", None, None, "c1")
+    assert outcome == "fresh"
+    assert {d.metadata["source"] for d in docs} == {"integrales.pdf"}
+    assert recorded == ["fresh"]
+
+
+def test_queries_without_conversation_are_not_recorded(manager):
+    cm, queries, recorded = manager
+    cm._retrieve("derivadas", None, None, None)
+    cm._retrieve("derivadas parciales", None, None, None)
+    assert queries == ["derivadas", "derivadas parciales"]
+    assert recorded == []
+
+
+def test_ingestion_invalidates_previous_retrieval(manager, monkeypatch):
+    cm, queries, recorded = manager
+    cm._retrieve("derivadas", None, None, "c1")
+    monkeypatch.setattr(conversation, "collection_generation", lambda name: 2)
+    _, outcome = cm._retrieve("derivadas parciales", None, None, "c1")
+    assert outcome == "fresh"
+    assert recorded == []
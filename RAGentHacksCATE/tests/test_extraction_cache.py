@@ -0,0 +1,60 @@
+import pytest
+
+extraction_cache = pytest.importorskip("app.data.extraction_cache")
+ingestion = pytest.importorskip("app.data.ingestion")
+docx = pytest.importorskip("docx")
+from app.utils import config
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EXTRACTION_CACHE_ENABLED", True)
+    store = extraction_cache.ExtractionCache(path=str(tmp_path / "extraction.db"))
+    monkeypatch.setattr(extraction_cache, "_cache", store)
+    return store
+
+
+def test_cached_text_is_reused(cache):
+    calls = []
+
+    def extract():
+        calls.append(1)
+        return ["página 1", "página 2"]
+
+    assert extraction_cache.cached_extraction("h1", "pypdf2-3.0", extract) == ["página 1", "página 2"]
+    assert extraction_cache.cached_extraction("h1", "pypdf2-3.0", extract) == ["página 1", "página 2"]
+    assert len(calls) == 1
+    # Otro extractor (u otra versión) no reutiliza la entrada
+    extraction_cache.cached_extraction("h1", "pypdf2-3.1", extract)
+    assert len(calls) == 2
+    assert cache.stats()["entries"] == 2
+
+
+def test_fallback_text_is_not_cached(cache):
+    def marker_failed():
+        raise extraction_cache.FallbackExtraction("texto de PyPDF2")
+
+    assert extraction_cache.cached_extraction("h1", "marker", marker_failed) == "texto de PyPDF2"
+    assert cache.stats()["entries"] == 0
+    assert extraction_cache.cached_extraction("h1", "marker", lambda: "texto de Marker") == "texto de Marker"
+    assert cache.get("h1", f"marker/v{extraction_cache.EXTRACTION_FORMAT_VERSION}") == "texto de Marker"
+
+
+def test_extractor_keys_carry_library_versions():
+    assert ingestion._extractor_key(".pdf") == f"pypdf2-{ingestion.PYPDF2_VERSION}"
+    assert ingestion._extractor_key(".docx") == f"python-docx-{docx.__version__}"
+
+
+def test_docx_extraction_is_cached_by_content(cache, tmp_path, monkeypatch):
+    path = tmp_path / "Guía 1.docx"
+    document = docx.Document()
+    document.add_paragraph("Ejercicio 1: derivar x^2")
+    document.save(str(path))
+
+    assert "derivar x^2" in ingestion.load_file_to_text(str(path))
+    # Una copia con otro nombre tiene el mismo contenido: no se vuelve a parsear
+    copy = tmp_path / "copia.docx"
+    copy.write_bytes(path.read_bytes())
+    monkeypatch.setattr(ingestion, "read_docx", lambda p: pytest.fail("se volvió a parsear el docx"))
+    assert "derivar x^2" in ingestion.load_file_to_text(str(copy))
+    assert cache.stats()["by_extractor"] == {f"python-docx-{docx.__version__}/v{extraction_cache.EXTRACTION_FORMAT_VERSION}": 1}
@@ -0,0 +1,72 @@
+import json
+import pytest
+
+flashcards = pytest.importorskip("app.data.flashcards")
+from langchain_core.documents import Document
+
+
+class FakeLLM:
+    """Responde con flashcards fijas y cuenta las llamadas."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        cards = [
+            {"question": f"P{i}", "answer": f"R{i}", "source": {"page": i}, "difficulty": "Hard" if i % 2 else "easy", "topic": "derivadas" if i < 4 else "integrales"}
+            for i in range(6)
+        ]
+        cards.append({"question": "", "answer": "sin pregunta"})
+        return json.dumps({"flashcards": cards})
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    fake = FakeLLM()
+    monkeypatch.setattr(flashcards, "_store", flashcards.FlashcardStore(path=str(tmp_path / "flashcards.db")))
+    monkeypatch.setattr(flashcards, "llm", fake)
+    monkeypatch.setattr(flashcards, "build_prompt", lambda docs, question, mode: question)
+    return fake
+
+
+def test_store_survives_restart(tmp_path):
+    path = str(tmp_path / "flashcards.db")
+    flashcards.FlashcardStore(path=path).replace("ramo", "Control 1.pdf", "h1", [{"question": "P", "answer": "R", "page": 2}])
+
+    reopened = flashcards.FlashcardStore(path=path)
+    assert reopened.is_current("ramo", "Control 1.pdf", "h1")
+    assert not reopened.is_current("ramo", "Control 1.pdf", "h2")
+    # El frontend pide archivos sin extensión
+    assert reopened.cards_for("ramo", ["control 1"])[0]["page"] == 2
+    assert reopened.cards_for("otro", ["control 1"]) == []
+
+
+def test_materialize_skips_unchanged_documents(fake_llm):
+    doc = Document(page_content="derivadas e integrales", metadata={"source": "Control 1.pdf"})
+    assert flashcards.materialize_flashcards([doc], "ramo") == 1
+    assert flashcards.materialize_flashcards([doc], "ramo") == 0
+    assert fake_llm.calls == 1
+
+    edited = Document(page_content="derivadas, integrales y series", metadata={"source": "Control 1.pdf"})
+    assert flashcards.materialize_flashcards([edited], "ramo") == 1
+    # La regeneración reemplaza las tarjetas, no las acumula; la tarjeta sin pregunta se descarta
+    assert len(flashcards.get_flashcard_store().cards_for("ramo", ["Control 1.pdf"])) == 6
+
+
+def test_sample_filters_and_falls_back(fake_llm):
+    doc = Document(page_content="derivadas e integrales", metadata={"source": "Control 1.pdf"})
+    flashcards.materialize_flashcards([doc], "ramo")
+
+    result = flashcards.sample_flashcards("ramo", ["Control 1"], n=3)
+    assert len(result["flashcards"]) == 3
+    assert [c["id"] for c in result["flashcards"]] == [1, 2, 3]
+    assert result["flashcards"][0]["source"]["file"] == "Control 1.pdf"
+
+    hard = flashcards.sample_flashcards("ramo", ["Control 1"], difficulty="HARD", n=3)
+    assert {c["difficulty"] for c in hard["flashcards"]} == {"hard"}
+    assert flashcards.sample_flashcards("ramo", ["Control 1"], topic="integrales", n=2)["topics_covered"] == ["integrales"]
+
+    # Menos tarjetas almacenadas que las pedidas: el llamador usa el LLM
+    assert flashcards.sample_flashcards("ramo", ["Control 1"], topic="integrales", n=10) is None
+    assert flashcards.sample_flashcards("ramo", ["Otro"], n=3) is None
@@ -0,0 +1,52 @@
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+np = pytest.importorskip("numpy")
+retriever = pytest.importorskip("app.rag.retriever")
+hnsw = pytest.importorskip("app.rag.hnsw")
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[0.0] * 8 for _ in texts]
+
+    def embed_query(self, text):
+        return [0.0] * 8
+
+
+class FakeEmbeddingClient:
+    def __init__(self, *args, **kwargs):
+        self._client = FakeEmbeddings()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    monkeypatch.setattr(retriever, "get_chroma_client", lambda: client)
+    monkeypatch.setattr(hnsw, "get_chroma_client", lambda: client)
+    monkeypatch.setattr(retriever, "EmbeddingClient", FakeEmbeddingClient)
+    return client
+
+
+def test_reindexed_metadata_survives_reopen(client):
+    collection = retriever.open_collection("ramo")
+    assert collection.metadata["hnsw:space"] == retriever.hnsw_metadata()["hnsw:space"]
+    vectors = np.random.default_rng(0).normal(size=(30, 8)).astype(np.float32)
+    collection.add(
+        ids=[f"doc-{i}" for i in range(30)],
+        embeddings=vectors.tolist(),
+        documents=[f"documento {i}" for i in range(30)],
+        metadatas=[{"source": f"{i}.pdf"} for i in range(30)],
+    )
+
+    report = hnsw.reindex_collection("ramo", space="cosine", m=32, k=5, sample=10)
+    assert report["swapped"]
+
+    # Reabrir por los caminos normales no debe devolver la metadata a los valores de config
+    vectordb = retriever.get_vectorstore("ramo")
+    retriever.open_collection("ramo")
+    metadata = client.get_collection("ramo").metadata
+    assert metadata["hnsw:space"] == "cosine"
+    assert metadata["hnsw:M"] == 32
+    assert vectordb._collection.metadata["hnsw:space"] == "cosine"
+    assert client.get_collection("ramo").count() == 30
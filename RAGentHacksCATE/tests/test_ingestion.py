@@ -0,0 +1,104 @@
+import hashlib
+import os
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+ingestion = pytest.importorskip("app.data.ingestion")
+retriever = pytest.importorskip("app.rag.retriever")
+
+
+class FakeEmbeddings:
+    """Embeddings deterministas sin red: un vector por hash del texto."""
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:8]]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class FakeEmbeddingClient:
+    def __init__(self, *args, **kwargs):
+        self._client = FakeEmbeddings()
+
+    def embed(self, texts):
+        return self._client.embed_documents(texts) if isinstance(texts, list) else self._client.embed_query(texts)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    monkeypatch.setattr(retriever, "get_chroma_client", lambda: client)
+    monkeypatch.setattr(ingestion, "EmbeddingClient", FakeEmbeddingClient)
+    monkeypatch.setattr(ingestion, "mark_collection_updated", lambda name: None)
+    return client
+
+
+def ingest(path, text):
+    return ingestion.ingest_texts(
+        [(path, text, {})], total=1, collection_name="ramo", dedup_threshold=1.0, flashcards=False, profiles=False
+    )
+
+
+def test_edited_file_replaces_old_chunks(client):
+    ingest("docs/Control 1.pdf", "Ejercicio 1: derivar x^2. " * 50)
+    ingest("docs/Otro.pdf", "Integrales por partes. " * 50)
+    # Reingestar sin cambios es idempotente
+    ingest("docs/Control 1.pdf", "Ejercicio 1: derivar x^2. " * 50)
+    assert client.get_collection("ramo").count() == 2
+
+    ingest("docs/Control 1.pdf", "Ejercicio 1 corregido: derivar x^3. " * 50)
+    collection = client.get_collection("ramo")
+    stored = collection.get(where={"source": "Control 1.pdf"}, include=["documents"])
+    assert len(stored["ids"]) == 1
+    assert "corregido" in stored["documents"][0]
+    assert collection.count() == 2
+
+
+def test_same_name_in_other_directory_is_a_different_file(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion.config, "INGEST_UPLOAD_DIR", str(tmp_path / "uploads"))
+    ingest("a/apuntes.pdf", "Límites y continuidad. " * 50)
+    ingest("b/apuntes.pdf", "Series de potencias. " * 50)
+    assert client.get_collection("ramo").count() == 2
+
+    # Editar a/apuntes.pdf reemplaza solo sus chunks
+    ingest("a/apuntes.pdf", "Límites laterales y continuidad. " * 50)
+    stored = client.get_collection("ramo").get(where={"source": "apuntes.pdf"}, include=["documents", "metadatas"])
+    by_id = {md["source_id"]: doc for doc, md in zip(stored["documents"], stored["metadatas"])}
+    assert sorted(by_id) == sorted([ingestion.source_identity("a/apuntes.pdf"), ingestion.source_identity("b/apuntes.pdf")])
+    assert "laterales" in by_id[ingestion.source_identity("a/apuntes.pdf")]
+    assert "Series" in by_id[ingestion.source_identity("b/apuntes.pdf")]
+
+
+def test_reuploaded_file_keeps_its_identity(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    monkeypatch.setattr(ingestion.config, "INGEST_UPLOAD_DIR", str(uploads))
+    # Cada trabajo de la API sube a su propio directorio; el archivo sigue siendo el mismo
+    assert ingestion.source_identity(str(uploads / "job1" / "Control 1.pdf")) == "upload:Control 1.pdf"
+    assert ingestion.source_identity(str(uploads / "job2" / "Control 1.pdf")) == "upload:Control 1.pdf"
+    assert ingestion.source_identity(str(uploads / "job2" / "1" / "Control 1.pdf")) == "upload:1/Control 1.pdf"
+    assert ingestion.source_identity("docs/Control 1.pdf") == os.path.realpath("docs/Control 1.pdf")
+
+
+def test_resumed_ingest_counts_documents_from_the_interrupted_run(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion.config, "INGEST_CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(ingestion.config, "INGEST_BATCH_SIZE", 1)
+    texts = {"a.pdf": "Límites. " * 50, "b.pdf": "Derivadas. " * 50}
+    crash = {"b.pdf"}
+
+    def load(path, use_marker_ocr=False):
+        if path in crash:
+            raise RuntimeError("proceso interrumpido")
+        return texts[path]
+
+    monkeypatch.setattr(ingestion, "load_file_to_text", load)
+    with pytest.raises(RuntimeError):
+        ingestion.ingest_files(["a.pdf", "b.pdf"], collection_name="ramo", dedup_threshold=1.0, flashcards=False, profiles=False)
+
+    crash.clear()
+    assert ingestion.ingest_files(["a.pdf", "b.pdf"], collection_name="ramo", dedup_threshold=1.0, flashcards=False, profiles=False, resume=True) == 2
+    assert client.get_collection("ramo").count() == 2
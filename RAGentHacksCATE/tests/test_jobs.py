@@ -0,0 +1,41 @@
+import time
+import pytest
+
+jobs = pytest.importorskip("app.data.jobs")
+
+
+def test_status_survives_restart(tmp_path):
+    db = str(tmp_path / "jobs.db")
+    queue = jobs.IngestJobQueue(path=db)
+    done_id = queue.enqueue("ramo", ["a.pdf"])
+    queue.claim_next(owner="proc-a")
+    queue.finish(done_id, {"documents": 3})
+    running_id = queue.enqueue("ramo", ["b.pdf"])
+    queue.claim_next(owner="proc-a")
+    queued_id = queue.enqueue("ramo", ["c.pdf"])
+
+    # "Reinicio": una instancia nueva sobre la misma base
+    restarted = jobs.IngestJobQueue(path=db)
+    assert restarted.get(done_id)["status"] == "done"
+    assert restarted.get(done_id)["result"] == {"documents": 3}
+    assert restarted.get(running_id)["status"] == "running"
+    assert restarted.get(running_id)["owner"] == "proc-a"
+    assert restarted.get(queued_id)["status"] == "queued"
+
+
+def test_requeue_only_stale_jobs(tmp_path):
+    queue = jobs.IngestJobQueue(path=str(tmp_path / "jobs.db"))
+    live_id = queue.enqueue("ramo", ["a.pdf"])
+    queue.claim_next(owner="live")
+    dead_id = queue.enqueue("ramo", ["b.pdf"])
+    queue.claim_next(owner="dead")
+
+    # Otro proceso arranca mientras ambos trabajos tienen latido reciente: no se roba ninguno
+    assert jobs.IngestJobQueue(path=queue.path).requeue_stale(stale_after=60) == 0
+
+    time.sleep(0.05)
+    queue.heartbeat("live")
+    assert queue.requeue_stale(stale_after=0.03) == 1
+    assert queue.get(live_id)["status"] == "running"
+    assert queue.get(dead_id)["status"] == "queued"
+    assert queue.get(dead_id)["owner"] is None
@@ -0,0 +1,127 @@
+import threading
+import time
+import pytest
+
+llm = pytest.importorskip("app.models.llm")
+import httpx
+import openai
+from app.utils import config
+
+
+def rate_limited(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return openai.RateLimitError("rate limit", response=response, body=None)
+
+
+class Reply:
+    def __init__(self, content):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 10, "output_tokens": 5}
+
+
+class FakeChat:
+    """Falla con los errores de `errors` (en orden) y luego responde; registra la concurrencia máxima."""
+
+    def __init__(self, errors=(), delay=0.0):
+        self.errors = list(errors)
+        self.calls = 0
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.errors:
+                raise self.errors.pop(0)
+            return Reply(f"ok: {prompt}")
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    monkeypatch.setattr(llm, "count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr(llm, "_retry_delay", lambda attempt, error: 0)
+    monkeypatch.setattr(llm, "_rpm_bucket", None)
+    monkeypatch.setattr(llm, "_tpm_bucket", None)
+    monkeypatch.setattr(llm, "metrics", llm.LLMMetrics())
+    return llm.Agent()
+
+
+def test_token_bucket_blocks_until_refilled():
+    bucket = llm.TokenBucket(capacity=2, period=0.2)  # 10 unidades por segundo
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    t0 = time.monotonic()
+    waited = bucket.acquire()
+    assert waited > 0
+    assert time.monotonic() - t0 >= 0.08
+    # Más que la capacidad se limita a la capacidad en vez de esperar para siempre
+    assert bucket.acquire(50) < 1
+
+
+def test_token_bucket_adjust_returns_unused_tokens():
+    bucket = llm.TokenBucket(capacity=100, period=3600)
+    bucket.acquire(80)
+    bucket.adjust(-50)  # se estimaron 80 y se usaron 30
+    assert bucket.tokens == pytest.approx(70, abs=0.1)
+    bucket.adjust(-1000)
+    assert bucket.tokens == 100
+
+
+def test_retries_transient_errors(agent):
+    agent._client = FakeChat(errors=[rate_limited(), openai.APITimeoutError(request=httpx.Request("POST", "https://x"))])
+    assert agent.generate("hola") == "ok: hola"
+    snap = llm.metrics.snapshot()
+    assert (snap["retries"], snap["rate_limited"], snap["timeouts"], snap["successes"]) == (2, 1, 1, 1)
+    assert snap["prompt_tokens"] == 10 and snap["completion_tokens"] == 5
+
+
+def test_gives_up_after_max_retries(agent, monkeypatch):
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 2)
+    agent._client = FakeChat(errors=[rate_limited() for _ in range(5)])
+    with pytest.raises(openai.RateLimitError):
+        agent.generate("hola")
+    assert agent._client.calls == 3
+    assert llm.metrics.snapshot()["failures"] == 1
+
+
+def test_other_errors_are_not_retried(agent):
+    agent._client = FakeChat(errors=[ValueError("prompt inválido")])
+    with pytest.raises(ValueError):
+        agent.generate("hola")
+    assert agent._client.calls == 1
+
+
+def test_retry_delay_respects_retry_after(monkeypatch):
+    monkeypatch.setattr(config, "LLM_RETRY_MAX_DELAY", 10)
+    monkeypatch.setattr(config, "LLM_RETRY_BASE_DELAY", 1)
+    assert llm._retry_delay(0, rate_limited("3")) == 3
+    assert llm._retry_delay(0, rate_limited("120")) == 10
+    assert all(0 <= llm._retry_delay(6, rate_limited()) <= 10 for _ in range(20))
+
+
+def test_semaphore_bounds_concurrency(agent, monkeypatch):
+    monkeypatch.setattr(llm, "_semaphore", threading.BoundedSemaphore(2))
+    agent._client = FakeChat(delay=0.05)
+    threads = [threading.Thread(target=agent.generate, args=(f"p{i}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert agent._client.calls == 6
+    assert agent._client.max_active == 2
+
+
+def test_throttled_llm_applies_stop_sequences(agent):
+    agent._client = FakeChat()
+    wrapped = llm.ThrottledLLM(agent=agent)
+    assert wrapped.invoke("Thought: buscar\nObservation: x", stop=["\nObservation:"]) == "ok: Thought: buscar"
@@ -0,0 +1,51 @@
+import pytest
+
+loadtest = pytest.importorskip("loadtest")
+
+
+def result(rps, ok=100, statuses=None):
+    return {"ok": ok, "statuses": statuses or {200: ok}, "throughput_rps": rps, "p50_ms": 10.0, "p95_ms": 20.0}
+
+
+def test_scaling_ratio_passes_and_fails():
+    runs = [(1, result(10.0)), (2, result(18.0)), (4, result(31.0))]
+    assert loadtest.check_scaling(runs, min_speedup=1.5) == []
+    problems = loadtest.check_scaling(runs, min_speedup=4.0)
+    assert len(problems) == 1
+    assert problems[0].startswith("workers=4: 3.10x")
+    assert loadtest.check_scaling(runs, min_speedup=0) == []
+
+
+def test_unready_or_failing_configurations_fail():
+    runs = [(1, result(10.0)), (2, None), (4, result(0.0, ok=0, statuses={429: 50}))]
+    problems = loadtest.check_scaling(runs, min_speedup=0)
+    assert problems == ["workers=2: el servidor no quedó listo", "workers=4: ninguna respuesta 200 ({429: 50})"]
+
+
+def test_main_exits_non_zero_when_scaling_is_below_the_minimum(monkeypatch):
+    rps = {1: 10.0, 2: 11.0}
+
+    class FakeProc:
+        def __init__(self, workers):
+            self.workers = workers
+
+        def terminate(self):
+            pass
+
+        def wait(self, timeout=None):
+            return 0
+
+    current = {}
+
+    def start_server(workers, port):
+        current["workers"] = workers
+        return FakeProc(workers)
+
+    monkeypatch.setattr(loadtest, "start_server", start_server)
+    monkeypatch.setattr(loadtest, "wait_ready", lambda base_url, timeout: True)
+    monkeypatch.setattr(loadtest, "run_load", lambda *args: result(rps[current["workers"]]))
+
+    with pytest.raises(SystemExit) as exit_info:
+        loadtest.main(["--ramo", "CII-2750", "--workers", "1", "2", "--min-speedup", "1.5"])
+    assert exit_info.value.code == 1
+    loadtest.main(["--ramo", "CII-2750", "--workers", "1", "2", "--min-speedup", "1.05"])
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+retriever = pytest.importorskip("app.rag.retriever")
+profiles = pytest.importorskip("app.data.profiles")
+from langchain_core.documents import Document
+
+
+class FakeEmbeddings:
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        vec = [b / 255.0 for b in digest[:8]]
+        norm = sum(v * v for v in vec) ** 0.5
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+class FakeEmbeddingClient:
+    def __init__(self, *args, **kwargs):
+        self._client = FakeEmbeddings()
+
+
+class FakeEncoding:
+    def encode(self, text):
+        return list(text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        return json.dumps({"summary": "Control sobre derivadas", "topics": ["derivadas", "regla de la cadena", " "]})
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    fake = FakeLLM()
+    monkeypatch.setattr(retriever, "get_chroma_client", lambda: client)
+    monkeypatch.setattr(retriever, "EmbeddingClient", FakeEmbeddingClient)
+    monkeypatch.setattr(retriever, "_vectorstores", {})
+    monkeypatch.setattr(profiles, "get_encoding", lambda: FakeEncoding())
+    monkeypatch.setattr(profiles, "llm", fake)
+    return fake
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Pauta Control 1 S1 2023-2.pdf", {"exam_type": "Control", "exam_number": 1, "section": "S1", "semester": "2023-2", "year": 2023, "is_solution": True}),
+    ("Control_2_2022-1.pdf", {"exam_type": "Control", "exam_number": 2, "semester": "2022-1", "year": 2022}),
+    ("Mesa de Estudio 3.docx", {"exam_type": "Mesa Estudio", "exam_number": 3}),
+    ("apuntes derivadas.pdf", {}),
+])
+def test_parse_exam_name(name, expected):
+    assert profiles.parse_exam_name(name) == expected
+
+
+def test_where_from_query_needs_two_traits():
+    assert profiles._where_from_query("ejercicios de control") is None
+    assert profiles._where_from_query("solemne 2023-2") == {"$and": [{"exam_type": "Solemne"}, {"semester": "2023-2"}]}
+
+
+def test_profiles_persist_and_skip_unchanged(fake_llm):
+    doc = Document(page_content="Derivadas y regla de la cadena", metadata={"source": "Pauta Control 1 2023-2.pdf"})
+    assert profiles.build_profiles([doc], "ramo") == 1
+    assert profiles.build_profiles([doc], "ramo") == 0
+    assert fake_llm.calls == 1
+    assert profiles.has_profiles("ramo")
+    assert not profiles.has_profiles("otro")
+
+    # Reabrir (otro proceso) encuentra el perfil con sus metadatos
+    retriever._vectorstores.clear()
+    stored = retriever.get_vectorstore(profiles.profile_collection_name("ramo")).get(ids=["Pauta Control 1 2023-2.pdf"])
+    meta = stored["metadatas"][0]
+    assert meta["topics"] == "derivadas; regla de la cadena"
+    assert meta["is_solution"] is True and meta["semester"] == "2023-2"
+    assert "Evaluación: Pauta Control 1 2023-2" in stored["documents"][0]
+
+    edited = Document(page_content="Derivadas, cadena e implícitas", metadata={"source": "Pauta Control 1 2023-2.pdf"})
+    assert profiles.build_profiles([edited], "ramo") == 1
+
+
+def test_search_answer_from_profiles(fake_llm):
+    docs = [
+        Document(page_content="Derivadas", metadata={"source": "Control 1 2023-2.pdf"}),
+        Document(page_content="Integrales", metadata={"source": "Solemne 1 2023-2.pdf"}),
+    ]
+    profiles.build_profiles(docs, "ramo")
+    results = profiles.search_profiles("solemne 2023-2", "ramo", k=2)
+    # El filtro explícito deja solo la solemne
+    assert [d.metadata["source"] for d, _ in results] == ["Solemne 1 2023-2.pdf"]
+
+    answer = profiles.search_answer_from_profiles("derivadas", results)
+    assert answer["total_matches"] == 1
+    assert answer["matching_files"][0]["matching_topics"] == ["derivadas"]
+    assert answer["no_matches_reason"] is None
@@ -0,0 +1,57 @@
+import pytest
+
+prompts = pytest.importorskip("app.rag.prompts")
+qa = pytest.importorskip("app.rag.qa")
+from langchain_core.documents import Document
+
+
+class FakeEncoding:
+    """Un token por carácter: suficiente para probar presupuestos sin descargar el encoder."""
+
+    def encode(self, text):
+        return list(text)
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(prompts, "count_tokens", lambda text: len(text or ""))
+    monkeypatch.setattr(qa, "get_encoding", lambda: FakeEncoding())
+    prompts.template_tokens.cache_clear()
+    yield
+    prompts.template_tokens.cache_clear()
+
+
+def test_every_mode_starts_with_the_shared_prefix():
+    templates = {mode: prompts.system_prompt(mode) for mode in prompts.MODES}
+    for mode, template in templates.items():
+        assert template.startswith(prompts.SHARED_PREFIX + "\n\n")
+        assert prompts.MODE_SCHEMAS[mode] in template
+    assert len(set(templates.values())) == len(prompts.MODES)
+    assert prompts.system_prompt("desconocido") == templates["qa"]
+
+
+def test_prompt_puts_request_specific_text_last():
+    docs = [Document(page_content="La derivada de x^2 es 2x.", metadata={"source": "Control 1.pdf", "page": 2})]
+    a = qa.build_prompt(docs, "¿Cuál es la derivada de x^2?", mode="qa")
+    b = qa.build_prompt(docs[:0], "Otra pregunta", mode="qa", files_focus=["Control 1"])
+    template = prompts.system_prompt("qa")
+    # Lo estable (plantilla) va primero y es idéntico byte a byte entre solicitudes
+    assert a.startswith(template) and b.startswith(template)
+    assert a.index("La derivada de x^2 es 2x.") > len(template)
+    assert a.endswith("Pregunta del usuario:\n¿Cuál es la derivada de x^2?\n\nGenera la salida JSON ahora:")
+    assert "Archivos a enfocar: ['Control 1']" in b
+
+
+def test_context_is_truncated_to_the_budget():
+    docs = [Document(page_content="x" * 5000, metadata={"source": "Largo.pdf"})]
+    prompt = qa.build_prompt(docs, "resume", mode="qa", max_context_tokens=100)
+    context = prompt.split("Contexto recuperado (fragmentos con citas integradas):\n", 1)[1].split("\n\nPregunta del usuario", 1)[0]
+    assert 0 < len(context) <= 100
+
+
+def test_template_token_report():
+    report = prompts.template_token_report()
+    assert set(report) == set(prompts.MODES)
+    for mode, row in report.items():
+        assert row["shared_prefix"] == len(prompts.SHARED_PREFIX)
+        assert row["template"] == len(prompts.system_prompt(mode)) > row["shared_prefix"]
@@ -0,0 +1,27 @@
+import pytest
+
+retriever = pytest.importorskip("app.rag.retriever")
+
+PARAMS = {"min_k": 2, "max_k": 15, "min_score": 0.3, "min_gap": 0.05}
+MEDIOCRE = [0.55 - 0.005 * i for i in range(14)]  # 0.55 .. 0.485, sin saltos
+
+
+def test_single_strong_hit_is_not_padded_to_max_k():
+    # Un salto antes de min_k también es el codo: se corta y se acota a min_k
+    assert retriever.adaptive_k([0.92] + MEDIOCRE, **PARAMS) == 2
+
+
+def test_two_strong_hits_cut_at_the_gap():
+    assert retriever.adaptive_k([0.92, 0.91] + MEDIOCRE[:13], **PARAMS) == 2
+
+
+def test_flat_scores_keep_all_relevant():
+    assert retriever.adaptive_k(MEDIOCRE, **PARAMS) == 14
+
+
+def test_threshold_and_bounds():
+    assert retriever.adaptive_k([0.8, 0.7, 0.6, 0.35, 0.1, 0.05], **{**PARAMS, "min_gap": 0.5}) == 4
+    assert retriever.adaptive_k([0.2, 0.1], **PARAMS) == 2
+    assert retriever.adaptive_k([0.9, 0.5], **{**PARAMS, "min_k": 5}) == 2
+    assert retriever.adaptive_k(MEDIOCRE, **{**PARAMS, "max_k": 5}) == 5
+    assert retriever.adaptive_k([], **PARAMS) == 0
@@ -0,0 +1,93 @@
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+shared_cache = pytest.importorskip("app.utils.shared_cache")
+retriever = pytest.importorskip("app.rag.retriever")
+from app.utils import config
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[0.0] * 8 for _ in texts]
+
+    def embed_query(self, text):
+        return [0.0] * 8
+
+
+class FakeEmbeddingClient:
+    def __init__(self, *args, **kwargs):
+        self._client = FakeEmbeddings()
+
+
+class BrokenCache:
+    def get_counter(self, key):
+        raise ConnectionError("redis caído")
+
+    def incr(self, key):
+        raise ConnectionError("redis caído")
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    local = shared_cache.LocalCache()
+    monkeypatch.setattr(shared_cache, "_cache", local)
+    return local
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, cache):
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+    monkeypatch.setattr(retriever, "get_chroma_client", lambda: client)
+    monkeypatch.setattr(retriever, "EmbeddingClient", FakeEmbeddingClient)
+    monkeypatch.setattr(retriever, "_vectorstores", {})
+    return client
+
+
+def test_generation_bump(cache):
+    assert shared_cache.collection_generation("ramo") == 0
+    assert shared_cache.bump_generation("ramo") == 1
+    assert shared_cache.bump_generation("ramo") == 2
+    assert shared_cache.collection_generation("ramo") == 2
+    assert shared_cache.collection_generation("otro") == 0
+
+
+def test_usage_and_retrieval_counters(cache):
+    shared_cache.record_usage("calculo", 3)
+    shared_cache.record_usage("calculo")
+    shared_cache.record_retrieval("reused")
+    assert shared_cache.usage_counts() == {"calculo": 4}
+    assert shared_cache.retrieval_counts() == {"reused": 1}
+
+
+def test_unavailable_cache_degrades_gracefully(monkeypatch):
+    monkeypatch.setattr(shared_cache, "_cache", BrokenCache())
+    assert shared_cache.collection_generation("ramo") == -1
+    assert shared_cache.bump_generation("ramo") is None
+
+
+def test_redis_url_without_package_falls_back_to_local(monkeypatch):
+    monkeypatch.setattr(shared_cache, "_cache", None)
+    monkeypatch.setattr(shared_cache, "redis", None)
+    monkeypatch.setattr(config, "REDIS_URL", "redis://localhost:6379/0")
+    assert isinstance(shared_cache.get_shared_cache(), shared_cache.LocalCache)
+
+
+def test_vectorstore_reopens_after_another_process_bumps_the_generation(client, monkeypatch):
+    first = retriever.get_vectorstore("ramo")
+    assert retriever.get_vectorstore("ramo") is first
+
+    # Otro worker ingesta y sube la generación: este proceso no invalidó nada localmente
+    shared_cache.bump_generation("ramo")
+    reopened = retriever.get_vectorstore("ramo")
+    assert reopened is not first
+    assert retriever.get_vectorstore("ramo") is reopened
+
+    # Sin caché compartida disponible se sigue sirviendo el vectorstore abierto
+    monkeypatch.setattr(shared_cache, "_cache", BrokenCache())
+    assert retriever.get_vectorstore("ramo") is reopened
+
+
+def test_mark_collection_updated_bumps_collection_and_profiles(client):
+    retriever.mark_collection_updated("ramo")
+    assert shared_cache.collection_generation("ramo") == 1
+    assert shared_cache.collection_generation("ramo" + config.PROFILE_COLLECTION_SUFFIX) == 1
@@ -0,0 +1,66 @@
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+np = pytest.importorskip("numpy")
+snapshot = pytest.importorskip("app.rag.snapshot")
+from app.utils import config
+
+
+@pytest.fixture
+def exported(tmp_path, monkeypatch):
+    updated = []
+    monkeypatch.setattr(snapshot, "mark_collection_updated", updated.append)
+    src = chromadb.PersistentClient(path=str(tmp_path / "src"))
+    collection = src.create_collection("ramo", metadata={"hnsw:space": "cosine", "hnsw:M": 32})
+    vectors = np.random.default_rng(0).normal(size=(25, 8)).astype(np.float32)
+    collection.add(
+        ids=[f"doc-{i}" for i in range(25)],
+        embeddings=vectors.tolist(),
+        documents=[f"Ejercicio {i}: derivadas" for i in range(25)],
+        metadatas=[{"source": f"Control {i}.pdf", "chunk": 0, "page_offsets": "0,120"} for i in range(25)],
+    )
+    manifest = snapshot.export_collection("ramo", str(tmp_path / "snapshots"), persist_dir=str(tmp_path / "src"))
+    return tmp_path, manifest, vectors, updated
+
+
+def test_round_trip_preserves_records_and_hnsw_metadata(exported):
+    tmp_path, manifest, vectors, updated = exported
+    assert manifest["count"] == 25 and manifest["dim"] == 8
+    assert snapshot.list_snapshots(str(tmp_path / "snapshots")) == ["ramo"]
+
+    result = snapshot.import_collection(str(tmp_path / "snapshots" / "ramo"), persist_dir=str(tmp_path / "dst"))
+    assert result["count"] == 25
+    assert updated == ["ramo"]
+
+    imported = chromadb.PersistentClient(path=str(tmp_path / "dst")).get_collection("ramo")
+    assert imported.metadata["hnsw:space"] == "cosine" and imported.metadata["hnsw:M"] == 32
+    data = imported.get(ids=["doc-7"], include=["embeddings", "documents", "metadatas"])
+    assert data["documents"] == ["Ejercicio 7: derivadas"]
+    assert data["metadatas"][0] == {"source": "Control 7.pdf", "chunk": 0, "page_offsets": "0,120"}
+    np.testing.assert_allclose(data["embeddings"][0], vectors[7], rtol=1e-6)
+
+
+def test_corrupted_file_fails_checksum(exported):
+    tmp_path, _, _, updated = exported
+    records = tmp_path / "snapshots" / "ramo" / snapshot.RECORDS_FILE
+    raw = bytearray(records.read_bytes())
+    raw[-5] ^= 0xFF
+    records.write_bytes(bytes(raw))
+    with pytest.raises(ValueError, match="Checksum inválido para records.json.gz"):
+        snapshot.import_collection(str(tmp_path / "snapshots" / "ramo"), persist_dir=str(tmp_path / "dst"))
+    assert updated == []
+
+
+def test_model_mismatch_and_existing_collection_are_refused(exported, monkeypatch):
+    tmp_path, _, _, _ = exported
+    path = str(tmp_path / "snapshots" / "ramo")
+    monkeypatch.setattr(config, "EMBEDDING_MODEL", "otro-modelo")
+    with pytest.raises(ValueError, match="otro-modelo"):
+        snapshot.import_collection(path, persist_dir=str(tmp_path / "dst"))
+    snapshot.import_collection(path, persist_dir=str(tmp_path / "dst"), allow_model_mismatch=True)
+
+    with pytest.raises(ValueError, match="ya existe"):
+        snapshot.import_collection(path, persist_dir=str(tmp_path / "dst"), allow_model_mismatch=True)
+    result = snapshot.import_collection(path, persist_dir=str(tmp_path / "dst"), replace=True, allow_model_mismatch=True)
+    assert result["count"] == 25
+    assert chromadb.PersistentClient(path=str(tmp_path / "dst")).get_collection("ramo").count() == 25
@@ -0,0 +1,76 @@
+import pytest
+
+warmup = pytest.importorskip("app.controllers.warmup")
+from app.utils import config
+
+
+class FakeCollection:
+    def count(self):
+        return 7
+
+
+class FakeVectorstore:
+    _collection = FakeCollection()
+
+
+def test_usage_stats_round_trip(tmp_path):
+    path = str(tmp_path / "usage.json")
+    assert warmup.load_usage_stats(path) == {}
+    warmup.save_usage_stats({"calculo": 5, "algebra": 2}, path)
+    assert warmup.load_usage_stats(path) == {"calculo": 5, "algebra": 2}
+
+    (tmp_path / "roto.json").write_text("{no es json")
+    assert warmup.load_usage_stats(str(tmp_path / "roto.json")) == {}
+
+
+def test_select_collections_ranks_by_usage(monkeypatch):
+    monkeypatch.setattr(config, "WARMUP_COLLECTIONS", [])
+    monkeypatch.setattr(config, "WARMUP_MAX_COLLECTIONS", 2)
+    names = ["algebra", "calculo", "fisica", "calculo" + config.PROFILE_COLLECTION_SUFFIX]
+    monkeypatch.setattr(warmup, "list_collection_names", lambda: names)
+
+    assert warmup.select_collections({"fisica": 9, "calculo": 3}) == ["fisica", "calculo"]
+    # Sin estadísticas: orden alfabético, nunca las colecciones de perfiles
+    assert warmup.select_collections({}) == ["algebra", "calculo"]
+
+    monkeypatch.setattr(config, "WARMUP_COLLECTIONS", ["historia"])
+    assert warmup.select_collections({"fisica": 9}) == ["historia"]
+
+
+def test_warm_collection_times_every_stage(monkeypatch):
+    monkeypatch.setattr(config, "WARMUP_LLM", False)
+    monkeypatch.setattr(warmup, "get_vectorstore", lambda collection_name: FakeVectorstore())
+    monkeypatch.setattr(warmup, "get_relevant_docs", lambda query, collection_name: [])
+    monkeypatch.setattr(warmup, "build_prompt", lambda docs, query: "prompt")
+    monkeypatch.setattr(warmup, "get_encoding", lambda: None)
+
+    result = warmup.warm_collection("calculo", chatbot_factory=lambda name: object())
+    assert result["status"] == "warm"
+    assert result["documents"] == 7
+    assert set(result["stages_ms"]) == {"chatbot", "open_collection", "count", "retrieve", "tokenizer", "build_prompt"}
+
+
+def test_failed_warmup_still_finishes(monkeypatch):
+    monkeypatch.setattr(config, "WARMUP_ENABLED", True)
+    monkeypatch.setattr(config, "WARMUP_COLLECTIONS", ["calculo"])
+
+    def broken(collection_name):
+        raise RuntimeError("chroma caído")
+
+    monkeypatch.setattr(warmup, "get_vectorstore", broken)
+    state = warmup.WarmupState()
+    assert not state.ready
+    state.start(chatbot_factory=lambda name: object(), usage={})
+    state._thread.join(timeout=10)
+
+    assert state.ready
+    assert state.collections["calculo"]["status"] == "failed"
+    assert "chroma caído" in state.collections["calculo"]["error"]
+
+
+def test_disabled_warmup_is_ready_immediately(monkeypatch):
+    monkeypatch.setattr(config, "WARMUP_ENABLED", False)
+    state = warmup.WarmupState()
+    state.start(chatbot_factory=lambda name: object(), usage={})
+    assert state.ready
+    assert state.to_dict()["warmup_enabled"] is False